@@ -33,6 +33,13 @@ class BaseAdapter(object):
     # Namespace this config adapter handles
     NAMESPACE = None
 
+    # Other namespaces merged into this adapter namespace, from lower to
+    # higher precedence
+    ALIASED_NAMESPACES = []
+
+    # File storing the digest of the configuration data in cache
+    DIGEST_FILE = 'fleet-commander.digest'
+
     # Variable for setting cache path for testing
     _TEST_CACHE_PATH = None
 
@@ -68,11 +75,36 @@ class BaseAdapter(object):
         if os.path.exists(namespace_cache_path):
             shutil.rmtree(namespace_cache_path)
 
-    def generate_config(self, config_data):
+    def get_cached_digest(self, uid=None):
+        """
+        Return digest of the configuration data in cache, if known
+        """
+        path = os.path.join(self._get_cache_path(uid), self.DIGEST_FILE)
+        try:
+            with open(path, 'r') as fd:
+                digest = fd.read().strip()
+                fd.close()
+            return digest or None
+        except Exception:
+            return None
+
+    def generate_config(self, config_data, digest=None):
         """
-        Prepare files to be deployed
+        Prepare files to be deployed.
+
+        If a digest of the configuration data is given and it matches the
+        one of the data in cache, cached files are kept as they are. The
+        digest is only saved when the data was processed successfully.
+
+        Returns False if the configuration data could not be processed
         """
         namespace_cache_path = self._get_cache_path()
+        digest_path = os.path.join(namespace_cache_path, self.DIGEST_FILE)
+        if digest is not None and self.get_cached_digest() == digest:
+            logging.debug(
+                'Configuration for namespace {} is up to date'.format(
+                    self.NAMESPACE))
+            return True
         # Cleaning up cache path
         self.cleanup_cache(namespace_cache_path)
         # Create namespace cache path
@@ -81,7 +113,31 @@ class BaseAdapter(object):
         os.makedirs(namespace_cache_path)
         logging.debug('Processing data configuration for namespace {}'.format(
             self.NAMESPACE))
-        self.process_config_data(config_data, namespace_cache_path)
+        try:
+            result = self.process_config_data(
+                config_data, namespace_cache_path)
+        except Exception:
+            self._remove_digest(digest_path)
+            raise
+        if result is False:
+            logging.error(
+                'Error processing configuration for namespace {}'.format(
+                    self.NAMESPACE))
+            self._remove_digest(digest_path)
+            return False
+        if digest is not None:
+            with open(digest_path, 'w') as fd:
+                fd.write(digest)
+                fd.close()
+        return True
+
+    @staticmethod
+    def _remove_digest(digest_path):
+        """
+        Forget digest of cached data, so it is generated again next time
+        """
+        if os.path.exists(digest_path):
+            os.remove(digest_path)
 
     def deploy(self, uid):
         """
@@ -90,10 +146,26 @@ class BaseAdapter(object):
         namespace_cache_path = self._get_cache_path(uid)
         self.deploy_files(namespace_cache_path, uid)
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user. Adapters that do
+        not deploy files return an empty list
+        """
+        return []
+
+    def is_deployed(self, uid):
+        """
+        Check if files deployed for given user are still in place. Files
+        deployed to runtime directories are lost on reboot
+        """
+        return all(
+            os.path.exists(path) for path in self.get_deployed_paths(uid))
+
     def process_config_data(self, config_data, cache_path):
         """
         Process configuration data and save cache files to be deployed.
-        This method needs to be defined by each configuration adapter.
+        This method needs to be defined by each configuration adapter, and
+        should return False or raise an exception when processing fails.
         """
         raise NotImplementedError(
             'You must implement generate_config_data method')
@@ -45,6 +45,12 @@ class ChromiumAdapter(BaseAdapter):
         filename = self.POLICIES_FILENAME.format(uid)
         return os.path.join(self.policies_path, filename)
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [self._get_policies_file_path(uid)]
+
     def process_config_data(self, config_data, cache_path):
         """
         Process configuration data and save cache files to be deployed.
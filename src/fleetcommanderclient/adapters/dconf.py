@@ -20,14 +20,22 @@
 #          Oliver Gutiérrez <ogutierrez@redhat.com>
 
 import os
+import pwd
 import stat
-import subprocess
+import json
 import logging
 import shutil
+import tempfile
+import multiprocessing
+from concurrent import futures
 
 from gi.repository import GLib
 
 from fleetcommanderclient.adapters import BaseAdapter
+from fleetcommanderclient.keytrie import KeyTrie
+from fleetcommanderclient.compilecache import CompileCache, ContentStore
+from fleetcommanderclient import dconfdb
+from fleetcommanderclient import keyfile
 
 
 class DconfAdapter(BaseAdapter):
@@ -38,12 +46,27 @@ class DconfAdapter(BaseAdapter):
     # Namespace this config adapter handles
     NAMESPACE = 'org.gnome.gsettings'
 
+    # LibreOffice settings are deployed using dconf
+    ALIASED_NAMESPACES = ['org.libreoffice.registry']
+
     PROFILE_FILE = 'fleet-commander-dconf.conf'
     DB_FILE = 'fleet-commander-dconf.db'
 
-    def __init__(self, dconf_profile_path, dconf_db_path):
+    # Databases deployed for several users, named after their digest
+    SHARED_DB_FILE = 'fleet-commander-dconf-shared.db'
+
+    # Store of compiled databases, next to the namespace cache directory
+    DB_STORE_DIR = 'dconf-db-store'
+    DB_STORE_SIZE = 16
+
+    def __init__(self, dconf_profile_path, dconf_db_path,
+                 db_store_path=None, db_store_size=DB_STORE_SIZE,
+                 shared_dbs=False):
         self.dconf_profile_path = dconf_profile_path
         self.dconf_db_path = dconf_db_path
+        self.db_store_path = db_store_path
+        self.db_store_size = db_store_size
+        self.shared_dbs = shared_dbs
 
     def _get_paths_for_uid(self, uid):
         struid = str(uid)
@@ -54,24 +77,272 @@ class DconfAdapter(BaseAdapter):
             self.dconf_db_path, '{}-{}'.format(self.DB_FILE, struid))
         return (profile_path, keyfile_dir, db_path)
 
-    def _compile_dconf_db(self, keyfiles_dir, db_file):
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        profile_path, keyfile_dir, db_path = self._get_paths_for_uid(uid)
+        return [profile_path, db_path]
+
+    def _get_db_store(self, cache_path):
+        db_store_path = self.db_store_path
+        if db_store_path is None:
+            db_store_path = os.path.join(
+                os.path.dirname(cache_path), self.DB_STORE_DIR)
+        return ContentStore(db_store_path, self.db_store_size)
+
+    @staticmethod
+    def get_keyfile_digest(trie):
+        """
+        Return digest of the keyfile contents for given settings, regardless
+        of the order of their sections and keys
+        """
+        entries = sorted(
+            (key, item['value'])
+            for key, item in trie.iter_settings() if 'value' in item)
+        return CompileCache.get_digest(
+            json.dumps(entries, ensure_ascii=False).encode('utf-8'))
+
+    @staticmethod
+    def _compile_dconf_db(trie, db_file):
         """
         Compiles dconf database
         """
-        # Execute dbus service
-        cmd = subprocess.Popen([
-            'dconf',
-            'compile',
-            db_file,
-            keyfiles_dir,
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        cmd.wait()
-        out = cmd.stdout.read()
-        err = cmd.stderr.read()
-        cmd.stdout.close()
-        cmd.stderr.close()
-        if cmd.returncode != 0:
-            raise Exception('{}\n{}'.format(out, err))
+        dconfdb.compile_dconf_db(trie, db_file)
+
+    def generate_configs(self, items, workers=None):
+        """
+        Prepare files to be deployed for several users at once.
+
+        Items are (uid, config data, digest) tuples, where digest is the one
+        generate_config would be given for the configuration data, or None.
+        Each distinct keyfile contents is compiled once, using up to the
+        given number of worker processes, one per processor by default.
+        Compiled databases are taken from and added to the database store if
+        a store path was given. Caches are written with the identity of each
+        user.
+
+        Returns a dictionary mapping each uid to the digest of its keyfile
+        contents, or to None if its configuration could not be generated
+        """
+        groups = {}
+        data_digests = {}
+        for uid, config_data, data_digest in items:
+            data_digests[uid] = data_digest
+            if isinstance(config_data, KeyTrie):
+                trie = config_data
+            else:
+                trie = KeyTrie.from_settings(config_data)
+            digest = self.get_keyfile_digest(trie)
+            if digest not in groups:
+                groups[digest] = (trie, [])
+            groups[digest][1].append(uid)
+
+        store = None
+        if self.db_store_path is not None:
+            store = ContentStore(self.db_store_path, self.db_store_size)
+
+        results = {}
+        staging_path = tempfile.mkdtemp(prefix='fc-client-dconf')
+        try:
+            # Take compiled databases from store when possible
+            db_paths = {}
+            pending = []
+            for digest, (trie, uids) in groups.items():
+                db_path = os.path.join(staging_path, digest)
+                if store is not None:
+                    stored_db_path = store.lookup(digest)
+                    if stored_db_path is not None:
+                        try:
+                            # Stored databases may be evicted by other jobs
+                            shutil.copyfile(stored_db_path, db_path)
+                            db_paths[digest] = db_path
+                            continue
+                        except Exception as e:
+                            logging.warning(
+                                'Error copying compiled dconf database {}: {}'
+                                .format(stored_db_path, e))
+                pending.append((digest, trie, db_path))
+
+            logging.debug(
+                'Compiling {} dconf databases for {} users'.format(
+                    len(pending),
+                    sum(len(uids) for trie, uids in groups.values())))
+            errors = self._compile_dconf_dbs(pending, workers)
+            for digest, trie, db_path in pending:
+                if digest in errors:
+                    continue
+                db_paths[digest] = db_path
+                if store is not None:
+                    try:
+                        store.add_file(digest, db_path)
+                    except Exception as e:
+                        logging.warning(
+                            'Error storing compiled dconf database: {}'
+                            .format(e))
+
+            for digest, (trie, uids) in groups.items():
+                if digest not in db_paths:
+                    logging.error(
+                        'Error compiling dconf data for UIDs {}: {}'.format(
+                            uids, errors.get(digest)))
+                    results.update((uid, None) for uid in uids)
+                    continue
+                for uid in uids:
+                    results[uid] = self._install_db(
+                        db_paths[digest], uid, digest, data_digests[uid])
+        finally:
+            shutil.rmtree(staging_path)
+        return results
+
+    def _compile_dconf_dbs(self, jobs, workers=None):
+        """
+        Compiles dconf databases for given (digest, trie, database file)
+        tuples and returns a dictionary with the errors found by digest.
+
+        Compiling is CPU bound Python code, so databases are compiled in up
+        to the given number of spawned processes, one per processor by
+        default. A single database is compiled in this process
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(jobs))
+        errors = {}
+        if workers <= 1:
+            for digest, trie, db_path in jobs:
+                try:
+                    self._compile_dconf_db(trie, db_path)
+                except Exception as e:
+                    errors[digest] = e
+            return errors
+        # Forking would copy the GLib state of this process
+        context = multiprocessing.get_context('spawn')
+        with futures.ProcessPoolExecutor(
+                workers, mp_context=context) as executor:
+            submitted = [
+                (digest, executor.submit(
+                    compile_dconf_db_file, trie.to_list(), db_path))
+                for digest, trie, db_path in jobs]
+            for digest, job in submitted:
+                try:
+                    job.result()
+                except Exception as e:
+                    errors[digest] = e
+        return errors
+
+    def _install_db(self, db_path, uid, digest, data_digest=None):
+        """
+        Replaces cache of given user with given compiled database, saving
+        the digest of the configuration data as generate_config does.
+
+        Caches are in user home directories, so files are written with the
+        user identity when running as root. This way they are owned by the
+        user, and symbolic links placed by the user can not lead to files
+        the user could not write anyway
+        """
+        namespace_cache_path = self._get_cache_path(uid)
+        digest_path = os.path.join(namespace_cache_path, self.DIGEST_FILE)
+        try:
+            self._run_as_user(
+                uid, self._write_cache, namespace_cache_path, db_path,
+                digest_path, data_digest)
+        except Exception as e:
+            logging.error(
+                'Error saving dconf database for UID {} to {}: {}'.format(
+                    uid, namespace_cache_path, e))
+            return None
+        return digest
+
+    def _write_cache(self, namespace_cache_path, db_path, digest_path,
+                     data_digest):
+        self.cleanup_cache(namespace_cache_path)
+        os.makedirs(namespace_cache_path)
+        shutil.copyfile(
+            db_path, os.path.join(namespace_cache_path, self.DB_FILE))
+        if data_digest is not None:
+            with open(digest_path, 'w') as fd:
+                fd.write(data_digest)
+                fd.close()
+
+    @staticmethod
+    def _run_as_user(uid, function, *args):
+        """
+        Calls given function with the effective user and group identities
+        of given user when running as root, restoring them afterwards
+        """
+        if os.geteuid() != 0 or uid == 0:
+            return function(*args)
+        pw = pwd.getpwuid(uid)
+        groups = os.getgroups()
+        gid = os.getegid()
+        os.setgroups(os.getgrouplist(pw.pw_name, pw.pw_gid))
+        try:
+            os.setegid(pw.pw_gid)
+            try:
+                os.seteuid(uid)
+                try:
+                    return function(*args)
+                finally:
+                    os.seteuid(0)
+            finally:
+                os.setegid(gid)
+        finally:
+            os.setgroups(groups)
+
+    def _get_shared_db_path(self, digest):
+        return os.path.join(
+            self.dconf_db_path, '{}-{}'.format(self.SHARED_DB_FILE, digest))
+
+    def _deploy_shared_db(self, cached_db_file_path, deploy_db_file_path):
+        """
+        Deploys database as a hard link to the shared database with the same
+        contents, which is created if needed. The number of links of shared
+        databases counts the users they are deployed for
+        """
+        with open(cached_db_file_path, 'rb') as fd:
+            contents = fd.read()
+            fd.close()
+        shared_db_path = self._get_shared_db_path(
+            CompileCache.get_digest(contents))
+        if not os.path.isfile(shared_db_path):
+            logging.debug('Creating shared dconf database {}'.format(
+                shared_db_path))
+            tmp_path = '{}.{}.tmp'.format(shared_db_path, os.getpid())
+            with open(tmp_path, 'wb') as fd:
+                fd.write(contents)
+                fd.close()
+            os.rename(tmp_path, shared_db_path)
+        try:
+            os.link(shared_db_path, deploy_db_file_path)
+        except Exception as e:
+            logging.warning(
+                'Error linking shared dconf database {}: {}'.format(
+                    shared_db_path, e))
+            shutil.copyfile(cached_db_file_path, deploy_db_file_path)
+
+    def collect_shared_dbs(self):
+        """
+        Removes shared databases no longer deployed for any user
+        """
+        prefix = self.SHARED_DB_FILE + '-'
+        try:
+            names = os.listdir(self.dconf_db_path)
+        except Exception:
+            return
+        for name in names:
+            if not name.startswith(prefix) or name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.dconf_db_path, name)
+            try:
+                if os.stat(path).st_nlink <= 1:
+                    logging.debug(
+                        'Removing unused shared dconf database {}'.format(
+                            path))
+                    os.remove(path)
+            except Exception as e:
+                logging.warning(
+                    'Error removing shared dconf database {}: {}'.format(
+                        path, e))
 
     def _remove_path(self, path, throw=False):
         logging.debug('Removing path: {}'.format(path))
@@ -96,6 +367,27 @@ class DconfAdapter(BaseAdapter):
         This method needs to be defined by each configuration adapter.
         """
 
+        if isinstance(config_data, KeyTrie):
+            trie = config_data
+        else:
+            trie = KeyTrie.from_settings(config_data)
+        db_path = os.path.join(cache_path, self.DB_FILE)
+
+        # Use database compiled previously for the same keyfile contents
+        store = self._get_db_store(cache_path)
+        digest = self.get_keyfile_digest(trie)
+        stored_db_path = store.lookup(digest)
+        if stored_db_path is not None:
+            logging.debug('Using compiled dconf database {}'.format(
+                stored_db_path))
+            try:
+                shutil.copyfile(stored_db_path, db_path)
+                return
+            except Exception as e:
+                logging.warning(
+                    'Error copying compiled dconf database {}: {}'.format(
+                        stored_db_path, e))
+
         # Create keyfile path
         keyfiles_dir = os.path.join(cache_path, 'keyfiles')
         logging.debug(
@@ -105,36 +397,33 @@ class DconfAdapter(BaseAdapter):
         except Exception as e:
             logging.error('Error creating keyfiles path {}: {}'.format(
                 keyfiles_dir, e))
-            return
-
-        # Prepare data for saving it in keyfile
-        logging.debug('Preparing dconf data for saving to keyfile')
-        keyfile = GLib.KeyFile.new()
-        for item in config_data:
-            if 'key' in item and 'value' in item:
-                keysplit = item['key'][1:].split('/')
-                keypath = '/'.join(keysplit[:-1])
-                keyname = keysplit[-1]
-                keyfile.set_string(keypath, keyname, item['value'])
+            return False
 
         # Save keyfile
         keyfile_path = os.path.join(keyfiles_dir, self.PROFILE_FILE)
         logging.debug('Saving dconf keyfile to {}'.format(keyfile_path))
         try:
-            keyfile.save_to_file(keyfile_path)
+            keyfile.write_keyfile(
+                keyfile_path, dconfdb.iter_keyfile_sections(trie))
         except Exception as e:
             logging.error('Error saving dconf keyfile at "%s": %s' % (
                 keyfile_path, e))
-            return
+            return False
 
         # Compile dconf database
-        db_path = os.path.join(cache_path, self.DB_FILE)
         try:
-            self._compile_dconf_db(keyfiles_dir, db_path)
+            self._compile_dconf_db(trie, db_path)
         except Exception as e:
             logging.error('Error compiling dconf data to {}: {}'.format(
                 cache_path, e))
-            return
+            return False
+
+        # Keep compiled database for later use
+        try:
+            store.add_file(digest, db_path)
+        except Exception as e:
+            logging.warning(
+                'Error storing compiled dconf database: {}'.format(e))
 
     def deploy_files(self, cache_path, uid):
         """
@@ -163,10 +452,16 @@ class DconfAdapter(BaseAdapter):
             except Exception:
                 pass
 
-            # Copy db file from cache to db path
+            # Copy db file from cache to db path, or link it to the shared
+            # database with the same contents
             deploy_db_file_path = os.path.join(
                 self.dconf_db_path, '{}-{}'.format(self.DB_FILE, uid))
-            shutil.copyfile(cached_db_file_path, deploy_db_file_path)
+            if self.shared_dbs:
+                self._deploy_shared_db(
+                    cached_db_file_path, deploy_db_file_path)
+            else:
+                shutil.copyfile(cached_db_file_path, deploy_db_file_path)
+            self.collect_shared_dbs()
 
             # Save runtime file
             try:
@@ -195,3 +490,10 @@ class DconfAdapter(BaseAdapter):
                 'Dconf settings database file {} not present. Ignoring.'.format(
                     cached_db_file_path))
 
+
+def compile_dconf_db_file(settings, db_file):
+    """
+    Compiles dconf database for given settings list. Used by worker
+    processes, which get settings instead of tries as they pickle faster
+    """
+    DconfAdapter._compile_dconf_db(KeyTrie.from_settings(settings), db_file)
@@ -42,6 +42,13 @@ class FirefoxAdapter(BaseAdapter):
     def __init__(self, prefs_path):
         self.prefs_path = prefs_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [os.path.join(
+            self.prefs_path, self.PREFS_FILENAME.format(uid))]
+
     def process_config_data(self, config_data, cache_path):
         """
         Process configuration data and save cache files to be deployed.
@@ -40,6 +40,13 @@ class FirefoxBookmarksAdapter(BaseAdapter):
     def __init__(self, policies_path):
         self.policies_path = policies_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [os.path.join(
+            self.policies_path.format(uid), self.POLICIES_FILENAME)]
+
     def process_config_data(self, config_data, cache_path):
         """
         Process configuration data and save cache files to be deployed.
@@ -24,9 +24,8 @@ import stat
 import logging
 import shutil
 
-from gi.repository import GLib
-
 from fleetcommanderclient.adapters import BaseAdapter
+from fleetcommanderclient import keyfile
 
 
 class GOAAdapter(BaseAdapter):
@@ -42,30 +41,29 @@ class GOAAdapter(BaseAdapter):
     def __init__(self, goa_runtime_path):
         self.goa_runtime_path = goa_runtime_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [os.path.join(
+            self.goa_runtime_path, str(uid), self.ACCOUNTS_FILE)]
+
     def process_config_data(self, config_data, cache_path):
         """
         Process configuration data and save cache files to be deployed.
         This method needs to be defined by each configuration adapter.
         """
-        # Prepare data for saving it in keyfile
-        logging.debug('Preparing GOA data for saving to keyfile')
-        keyfile = GLib.KeyFile.new()
-        for account, accountdata in config_data.items():
-            for key, value in accountdata.items():
-                if type(value) == bool:
-                    keyfile.set_boolean(account, key, value)
-                else:
-                    keyfile.set_string(account, key, value)
-
         # Save config file
         keyfile_path = os.path.join(cache_path, self.ACCOUNTS_FILE)
         logging.debug('Saving GOA keyfile to "%s"' % keyfile_path)
         try:
-            keyfile.save_to_file(keyfile_path)
+            keyfile.write_keyfile(keyfile_path, (
+                (account, accountdata.items())
+                for account, accountdata in config_data.items()))
         except Exception as e:
             logging.error('Error saving GOA keyfile at {}: {}'.format(
                 keyfile_path, e))
-            return
+            return False
 
     def deploy_files(self, cache_path, uid):
         """
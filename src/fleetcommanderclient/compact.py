@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import sys
+import weakref
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+# Strings longer than this are not interned
+INTERN_MAX_LENGTH = 256
+
+# Mappings with more members than this are kept as plain dictionaries.
+# Wide mappings, like accounts by identifier, rarely share their shape
+RECORD_MAX_FIELDS = 16
+
+
+def intern_value(value):
+    """
+    Intern short strings so equal values share memory
+    """
+    if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+class Shape(object):
+    """
+    Field names shared by all records decoded from objects with the same
+    member names in the same order, indexing their position in the record
+    values. For duplicated names the last position is used, as JSON
+    decoding keeps the last value.
+    """
+
+    __slots__ = ('names', 'index', '__weakref__')
+
+    def __init__(self, names):
+        self.names = names
+        self.index = dict(
+            (name, position) for position, name in enumerate(names))
+
+
+# Shapes of live records. Shapes are dropped along with their last record
+SHAPES = weakref.WeakValueDictionary()
+
+
+def get_shape(names):
+    """
+    Return the shared shape for given member names
+    """
+    shape = SHAPES.get(names)
+    if shape is None:
+        shape = SHAPES[names] = Shape(names)
+    return shape
+
+
+class Record(Mapping):
+    """
+    Read only compact replacement for settings dictionaries.
+
+    Field names are stored in a shape shared by all records with the same
+    fields, and values in a tuple, avoiding a hash table per setting.
+    """
+
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, names, values):
+        self.shape = get_shape(names)
+        self.values = values
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Create record from (name, value) pairs, or a plain dictionary for
+        objects with too many members. Suitable as JSON decoder
+        object_pairs_hook
+        """
+        if len(pairs) > RECORD_MAX_FIELDS:
+            return dict(pairs)
+        return cls(
+            tuple(sys.intern(name) for name, value in pairs),
+            tuple(intern_value(value) for name, value in pairs))
+
+    def __reduce__(self):
+        # Shapes are shared again when unpickled
+        return (Record, (self.shape.names, self.values))
+
+    def __getitem__(self, name):
+        return self.values[self.shape.index[name]]
+
+    def __contains__(self, name):
+        return name in self.shape.index
+
+    def __iter__(self):
+        return iter(self.shape.index)
+
+    def __len__(self):
+        return len(self.shape.index)
+
+    def __repr__(self):
+        return 'Record(%r)' % expand(self)
+
+
+def expand(value):
+    """
+    Convert compact settings to plain dictionaries and lists
+    """
+    if isinstance(value, Record):
+        return dict((name, expand(value[name])) for name in value)
+    if isinstance(value, dict):
+        return dict((name, expand(item)) for name, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [expand(item) for item in value]
+    return value
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import os
+import logging
+import json
+import hashlib
+import shutil
+
+from fleetcommanderclient import compact
+from fleetcommanderclient.provenance import ProvenanceIndex
+
+
+class CompileCache(object):
+    """
+    Compiled settings cache
+
+    Stores a manifest of the profile files used in a compilation, the merged
+    settings after some of those files (checkpoints) and the final result,
+    along with their provenance index if any.
+    """
+
+    VERSION = 4
+
+    MANIFEST_FILE = 'manifest.json'
+    COMPILED_FILE = 'compiled.json'
+    PROVENANCE_FILE = 'provenance.json'
+    DIGESTS_FILE = 'digests.json'
+    APPLIED_FILE = 'applied.json'
+    CHECKPOINT_FILE = 'checkpoint-{:05d}.json'
+    CHECKPOINT_PREFIX = 'checkpoint-'
+    CHECKPOINT_SUFFIX = '.json'
+
+    # Size of the blocks read while hashing files
+    READ_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, path, decoder=None):
+        self.path = path
+        if decoder is None:
+            decoder = json.JSONDecoder()
+        self.decoder = decoder
+
+    @staticmethod
+    def get_digest(contents):
+        """
+        Return digest for given file contents
+        """
+        return hashlib.sha256(contents).hexdigest()
+
+    @classmethod
+    def get_file_digest(cls, filepath):
+        """
+        Return digest for given file contents, reading it by blocks
+        """
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as fd:
+            for block in iter(lambda: fd.read(cls.READ_BLOCK_SIZE), b''):
+                digest.update(block)
+            fd.close()
+        return digest.hexdigest()
+
+    def _read_json(self, filename):
+        with open(os.path.join(self.path, filename), 'rb') as fd:
+            return self.decoder.decode(fd.read().decode('utf-8'))
+
+    def _write_json(self, filename, data):
+        path = os.path.join(self.path, filename)
+        with open(path + '.tmp', 'w') as fd:
+            fd.write(json.dumps(data, default=compact.expand))
+            fd.close()
+        os.rename(path + '.tmp', path)
+
+    def load_manifest(self, options=None):
+        """
+        Return cached manifest as a (entries, compiled) tuple.
+
+        Manifests generated with different compile options are ignored
+        """
+        try:
+            manifest = self._read_json(self.MANIFEST_FILE)
+            if manifest.get('version') == self.VERSION \
+                    and manifest.get('options') == options:
+                return (manifest['entries'], manifest['compiled'])
+        except Exception as e:
+            logging.debug(
+                'CompileCache: Can not load manifest from {}: {}'.format(
+                    self.path, e))
+        return ([], False)
+
+    def save_manifest(self, entries, compiled, options=None):
+        """
+        Save manifest. The compiled flag tells if the compiled result
+        matches all the given entries
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._write_json(self.MANIFEST_FILE, {
+            'version': self.VERSION,
+            'options': options,
+            'entries': entries,
+            'compiled': compiled,
+        })
+
+    @classmethod
+    def build_manifest(cls, dirpath, filenames, previous, max_size=None):
+        """
+        Generate manifest entries for given files.
+
+        Files are only read when their size or modification time differ from
+        the previous manifest. Files bigger than max_size are not read and
+        get no digest. Files are hashed by blocks and their contents are not
+        kept, so only files merged afterwards are read again, memory mapped
+        by the settings compiler.
+        """
+        previous = {entry['name']: entry for entry in previous}
+        entries = []
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            entry = {
+                'name': filename,
+                'size': None,
+                'mtime': None,
+                'digest': None,
+            }
+            try:
+                st = os.stat(filepath)
+                entry['size'] = st.st_size
+                entry['mtime'] = st.st_mtime_ns
+                old = previous.get(filename)
+                if old is not None and old['size'] == entry['size'] \
+                        and old['mtime'] == entry['mtime']:
+                    entry['digest'] = old['digest']
+                elif max_size is not None and st.st_size > max_size:
+                    logging.debug(
+                        'CompileCache: Not hashing {}: too big'.format(
+                            filepath))
+                else:
+                    entry['digest'] = cls.get_file_digest(filepath)
+            except Exception as e:
+                logging.debug(
+                    'CompileCache: Can not hash {}: {}'.format(filepath, e))
+            entries.append(entry)
+        return entries
+
+    @staticmethod
+    def get_first_changed(old, new):
+        """
+        Return position of the first entry that differs between manifests
+        """
+        position = 0
+        for old_entry, new_entry in zip(old, new):
+            if new_entry['digest'] is None \
+                    or old_entry['name'] != new_entry['name'] \
+                    or old_entry['digest'] != new_entry['digest']:
+                break
+            position += 1
+        return position
+
+    def get_checkpoint_positions(self):
+        """
+        Return sorted positions of saved checkpoints
+        """
+        positions = []
+        try:
+            names = os.listdir(self.path)
+        except Exception:
+            return positions
+        for name in names:
+            if name.startswith(self.CHECKPOINT_PREFIX) \
+                    and name.endswith(self.CHECKPOINT_SUFFIX):
+                try:
+                    positions.append(int(name[
+                        len(self.CHECKPOINT_PREFIX):
+                        -len(self.CHECKPOINT_SUFFIX)]))
+                except ValueError:
+                    pass
+        positions.sort()
+        return positions
+
+    def get_last_checkpoint(self, end):
+        """
+        Return position of the last checkpoint saved before given position,
+        or None if there is none
+        """
+        last = None
+        for position in self.get_checkpoint_positions():
+            if position >= end:
+                break
+            last = position
+        return last
+
+    def remove_checkpoints(self, start):
+        """
+        Remove checkpoints saved from given position on
+        """
+        for position in self.get_checkpoint_positions():
+            if position >= start:
+                os.remove(os.path.join(
+                    self.path, self.CHECKPOINT_FILE.format(position)))
+
+    def load_checkpoint(self, position):
+        """
+        Load merged settings and provenance after file at given position
+        """
+        data = self._read_json(self.CHECKPOINT_FILE.format(position))
+        provenance = data['provenance']
+        if provenance is not None:
+            provenance = ProvenanceIndex.from_dict(provenance)
+        return (data['settings'], provenance)
+
+    def save_checkpoint(self, position, settings, provenance=None):
+        """
+        Save merged settings and provenance after file at given position
+        """
+        if provenance is not None:
+            provenance = provenance.to_dict()
+        self._write_json(self.CHECKPOINT_FILE.format(position), {
+            'settings': settings,
+            'provenance': provenance,
+        })
+
+    def load_compiled(self):
+        """
+        Load compiled settings
+        """
+        return self._read_json(self.COMPILED_FILE)
+
+    def load_provenance(self):
+        """
+        Load provenance index for compiled settings, if any
+        """
+        try:
+            return ProvenanceIndex.from_dict(
+                self._read_json(self.PROVENANCE_FILE))
+        except Exception as e:
+            logging.debug(
+                'CompileCache: Can not load provenance from {}: {}'.format(
+                    self.path, e))
+        return None
+
+    def load_digests(self):
+        """
+        Load content digests of compiled settings by namespace, if any
+        """
+        try:
+            return self._read_json(self.DIGESTS_FILE)
+        except Exception as e:
+            logging.debug(
+                'CompileCache: Can not load digests from {}: {}'.format(
+                    self.path, e))
+        return None
+
+    def load_applied(self):
+        """
+        Load digests of the settings last applied by namespace
+        """
+        try:
+            return self._read_json(self.APPLIED_FILE)
+        except Exception as e:
+            logging.debug(
+                'CompileCache: Can not load applied digests from {}: {}'.format(
+                    self.path, e))
+        return {}
+
+    def save_applied(self, digests):
+        """
+        Save digests of the settings last applied by namespace
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._write_json(self.APPLIED_FILE, digests)
+
+    def save_compiled(self, entries, settings, options=None, provenance=None,
+                      digests=None):
+        """
+        Save compiled settings for given manifest entries and remove
+        checkpoints not belonging to it
+        """
+        self._write_json(self.COMPILED_FILE, settings)
+        if digests is not None:
+            self._write_json(self.DIGESTS_FILE, digests)
+        elif os.path.exists(os.path.join(self.path, self.DIGESTS_FILE)):
+            os.remove(os.path.join(self.path, self.DIGESTS_FILE))
+        if provenance is not None:
+            self._write_json(self.PROVENANCE_FILE, provenance.to_dict())
+        elif os.path.exists(os.path.join(self.path, self.PROVENANCE_FILE)):
+            os.remove(os.path.join(self.path, self.PROVENANCE_FILE))
+        self.save_manifest(entries, True, options)
+        self.remove_checkpoints(len(entries))
+
+
+class LayerCache(object):
+    """
+    Shared compiled settings layers cache
+
+    Stores merged settings for sequences of profile files shared by several
+    users (base layers). Each layer is kept in its own compile cache,
+    addressed by the names and digests of its files and the compile options.
+    The least recently used layers are removed when the cache holds more
+    than max_layers layers.
+    """
+
+    def __init__(self, path, decoder=None, max_layers=None):
+        self.path = path
+        self.decoder = decoder
+        self.store = ContentStore(path, max_layers)
+
+    @staticmethod
+    def get_layer_entries(entries):
+        """
+        Return manifest entries without user specific file attributes
+        """
+        return [
+            {'name': entry['name'], 'digest': entry['digest']}
+            for entry in entries]
+
+    @classmethod
+    def get_layer_digest(cls, entries, options=None):
+        """
+        Return digest addressing the layer of given manifest entries
+        """
+        key = json.dumps(
+            [options, cls.get_layer_entries(entries)], sort_keys=True)
+        return CompileCache.get_digest(key.encode('utf-8'))
+
+    def get_layer_cache(self, entries, options=None):
+        """
+        Return compile cache for the layer of given manifest entries
+        """
+        return CompileCache(
+            self.store.get_path(self.get_layer_digest(entries, options)),
+            self.decoder)
+
+    def load_layer(self, entries, options=None):
+        """
+        Return a (settings, provenance) tuple for the layer of given manifest
+        entries, or None if it is not cached
+        """
+        path = self.store.lookup(self.get_layer_digest(entries, options))
+        if path is None:
+            return None
+        cache = CompileCache(path, self.decoder)
+        layer_entries, compiled = cache.load_manifest(options)
+        if not compiled or layer_entries != self.get_layer_entries(entries):
+            return None
+        try:
+            return (cache.load_compiled(), cache.load_provenance())
+        except Exception as e:
+            logging.debug(
+                'LayerCache: Can not load layer from {}: {}'.format(
+                    cache.path, e))
+        return None
+
+    def save_layer(self, entries, settings, options=None, provenance=None):
+        """
+        Save merged settings for the layer of given manifest entries
+        """
+        cache = self.get_layer_cache(entries, options)
+        entries = self.get_layer_entries(entries)
+        cache.save_manifest(entries, False, options)
+        cache.save_compiled(entries, settings, options, provenance)
+        self.store.evict()
+
+
+class ContentStore(object):
+    """
+    Content addressed file store
+
+    Files are stored under the digest of the data they were generated from.
+    Modification times of stored files are updated each time they are used,
+    and the least recently used files are removed when the store holds more
+    than max_entries files. Stored entries may also be directories, which
+    are removed as a whole.
+    """
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+
+    def get_path(self, digest):
+        """
+        Return path of the file stored for given digest
+        """
+        return os.path.join(self.path, digest)
+
+    def lookup(self, digest):
+        """
+        Return path of the file stored for given digest, marking it as
+        recently used, or None if there is none
+        """
+        path = self.get_path(digest)
+        try:
+            os.utime(path)
+        except Exception:
+            return None
+        return path
+
+    def add_file(self, digest, filename):
+        """
+        Store a copy of given file for given digest and return its path
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        path = self.get_path(digest)
+        shutil.copyfile(filename, path + '.tmp')
+        os.rename(path + '.tmp', path)
+        self.evict()
+        return path
+
+    def get_entries(self):
+        """
+        Return list of (modification time, digest) tuples for stored files,
+        least recently used first
+        """
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except Exception:
+            return entries
+        for name in names:
+            if name.endswith('.tmp'):
+                continue
+            try:
+                entries.append(
+                    (os.stat(os.path.join(self.path, name)).st_mtime_ns,
+                        name))
+            except Exception:
+                pass
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used files exceeding the store size
+        """
+        if self.max_entries is None:
+            return
+        entries = self.get_entries()
+        for mtime, digest in entries[:max(len(entries) - self.max_entries, 0)]:
+            logging.debug(
+                'ContentStore: Removing {} from {}'.format(digest, self.path))
+            path = self.get_path(digest)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except Exception as e:
+                logging.debug(
+                    'ContentStore: Can not remove {}: {}'.format(digest, e))
@@ -30,6 +30,10 @@ class BaseConfigAdapter(object):
     # Namespace this config adapter handles
     NAMESPACE = None
 
+    # Other namespaces merged into this adapter namespace, from lower to
+    # higher precedence
+    ALIASED_NAMESPACES = []
+
     def bootstrap(self, uid):
         """
         Prepare environment for a clean configuration deploy
@@ -38,10 +42,26 @@ class BaseConfigAdapter(object):
 
     def update(self, uid, data):
         """
-        Update configuration for given user
+        Update configuration for given user. Returns False or raises an
+        exception when the configuration can not be applied
         """
         raise NotImplementedError('You must implement update method')
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user. Adapters that do
+        not deploy files return an empty list
+        """
+        return []
+
+    def is_deployed(self, uid):
+        """
+        Check if files deployed for given user are still in place. Files
+        deployed to runtime directories are lost on reboot
+        """
+        return all(
+            os.path.exists(path) for path in self.get_deployed_paths(uid))
+
     @staticmethod
     def _set_perms(fd, uid, gid, perms):
         """
@@ -38,6 +38,13 @@ class ChromiumConfigAdapter(BaseConfigAdapter):
     def __init__(self, policies_path):
         self.policies_path = policies_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [
+            os.path.join(self.policies_path, self.POLICIES_FILENAME % uid)]
+
     def bootstrap(self, uid):
         filename = self.POLICIES_FILENAME % uid
         path = os.path.join(self.policies_path, filename)
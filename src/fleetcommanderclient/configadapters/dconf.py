@@ -22,12 +22,14 @@
 import os
 import shutil
 import logging
-import subprocess
 
 import gi
 from gi.repository import GLib
 
 from fleetcommanderclient.configadapters.base import BaseConfigAdapter
+from fleetcommanderclient.keytrie import KeyTrie
+from fleetcommanderclient import dconfdb
+from fleetcommanderclient import keyfile
 
 
 class DconfConfigAdapter(BaseConfigAdapter):
@@ -36,6 +38,9 @@ class DconfConfigAdapter(BaseConfigAdapter):
     """
 
     NAMESPACE = 'org.gnome.gsettings'
+
+    # LibreOffice settings are deployed using dconf
+    ALIASED_NAMESPACES = ['org.libreoffice.registry']
     FC_PROFILE_FILE = 'fleet-commander-dconf.conf'
     FC_DB_FILE = 'fleet-commander-dconf-'
 
@@ -68,6 +73,13 @@ class DconfConfigAdapter(BaseConfigAdapter):
                 logging.warning('Error removing path "%s": %s' % (
                     path, e))
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        profile_path, keyfile_dir, db_path = self.get_paths_for_uid(uid)
+        return [profile_path, db_path]
+
     def bootstrap(self, uid):
         # Remove old data
         profile_path, keyfile_dir, db_path = self.get_paths_for_uid(uid)
@@ -78,15 +90,10 @@ class DconfConfigAdapter(BaseConfigAdapter):
     def update(self, uid, data):
         profile_path, keyfile_dir, db_path = self.get_paths_for_uid(uid)
 
-        # Prepare data for saving it in keyfile
-        logging.debug('Preparing dconf data for saving to keyfile')
-        keyfile = GLib.KeyFile.new()
-        for item in data:
-            if 'key' in item and 'value' in item:
-                keysplit = item['key'][1:].split('/')
-                keypath = '/'.join(keysplit[:-1])
-                keyname = keysplit[-1]
-                keyfile.set_string(keypath, keyname, item['value'])
+        if isinstance(data, KeyTrie):
+            trie = data
+        else:
+            trie = KeyTrie.from_settings(data)
 
         # Create keyfile path
         logging.debug('Creating keyfile path for dconf: "%s"' % profile_path)
@@ -95,25 +102,26 @@ class DconfConfigAdapter(BaseConfigAdapter):
         except Exception:
             logging.error('Error creating keyfile path "%s": %s' % (
                 path, e))
-            return
+            return False
 
         # Save config file
         keyfile_path = os.path.join(keyfile_dir, self.FC_PROFILE_FILE)
         logging.debug('Saving dconf keyfile to "%s"' % keyfile_path)
         try:
-            keyfile.save_to_file(keyfile_path)
+            keyfile.write_keyfile(
+                keyfile_path, dconfdb.iter_keyfile_sections(trie))
         except Exception as e:
             logging.error('Error saving dconf keyfile at "%s": %s' % (
                 keyfile_path, e))
-            return
+            return False
 
         # Compile dconf database
         try:
-            self._compile_dconf_db(uid)
+            self._compile_dconf_db(uid, trie)
         except Exception as e:
             logging.error('Error compiling dconf data to "%s": %s' % (
                 db_path, e))
-            return
+            return False
 
         # Create runtime path
         logging.debug('Creating profile path for dconf: "%s"' % profile_path)
@@ -130,27 +138,13 @@ class DconfConfigAdapter(BaseConfigAdapter):
         except Exception as e:
             logging.error('Error saving dconf profile at "%s": %s' % (
                 profile_path, e))
-            return
+            return False
 
         logging.info('Processed dconf configuration for UID %s')
 
-    def _compile_dconf_db(self, uid):
+    def _compile_dconf_db(self, uid, trie):
         """
         Compiles dconf database
         """
         profile_path, keyfile_dir, db_path = self.get_paths_for_uid(uid)
-
-        # Execute dbus service
-        cmd = subprocess.Popen([
-            'dconf',
-            'compile',
-            db_path,
-            keyfile_dir,
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        cmd.wait()
-        out = cmd.stdout.read()
-        err = cmd.stderr.read()
-        cmd.stdout.close()
-        cmd.stderr.close()
-        if cmd.returncode != 0:
-            raise Exception('%s\n%s' % (out, err))
+        dconfdb.compile_dconf_db(trie, db_path)
@@ -39,6 +39,13 @@ class FirefoxConfigAdapter(BaseConfigAdapter):
     def __init__(self, preferences_path):
         self.preferences_path = preferences_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [
+            os.path.join(self.preferences_path, self.PREFS_FILENAME % uid)]
+
     def bootstrap(self, uid):
         filename = self.PREFS_FILENAME % uid
         path = os.path.join(self.preferences_path, filename)
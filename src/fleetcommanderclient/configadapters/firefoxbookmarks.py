@@ -40,6 +40,13 @@ class FirefoxBookmarksConfigAdapter(BaseConfigAdapter):
                 policies_path))
         self.policies_path = policies_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [os.path.join(
+            self.policies_path.format(uid), self.POLICIES_FILENAME)]
+
     def bootstrap(self, uid):
         path = os.path.join(self.policies_path.format(uid), self.POLICIES_FILENAME)
         # Delete existing files
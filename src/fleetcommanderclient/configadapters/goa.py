@@ -23,10 +23,8 @@ import os
 import shutil
 import logging
 
-import gi
-from gi.repository import GLib
-
 from fleetcommanderclient.configadapters.base import BaseConfigAdapter
+from fleetcommanderclient import keyfile
 
 
 class GOAConfigAdapter(BaseConfigAdapter):
@@ -40,6 +38,13 @@ class GOAConfigAdapter(BaseConfigAdapter):
     def __init__(self, goa_runtime_path):
         self.goa_runtime_path = goa_runtime_path
 
+    def get_deployed_paths(self, uid):
+        """
+        Return paths of the files deployed for given user
+        """
+        return [os.path.join(
+            self.goa_runtime_path, str(uid), self.FC_ACCOUNTS_FILE)]
+
     def bootstrap(self, uid):
         runtime_path = os.path.join(self.goa_runtime_path, str(uid))
         logging.debug('Removing runtime path for GOA: "%s"' % runtime_path)
@@ -58,26 +63,18 @@ class GOAConfigAdapter(BaseConfigAdapter):
         except Exception as e:
             logging.error('Error creating GOA runtime path "%s": %s' % (
                 runtime_path, e))
-            return
-
-        # Prepare data for saving it in keyfile
-        logging.debug('Preparing GOA data for saving to keyfile')
-        keyfile = GLib.KeyFile.new()
-        for account, accountdata in data.items():
-            for key, value in accountdata.items():
-                if type(value) == bool:
-                    keyfile.set_boolean(account, key, value)
-                else:
-                    keyfile.set_string(account, key, value)
+            return False
 
         # Save config file
         keyfile_path = os.path.join(runtime_path, self.FC_ACCOUNTS_FILE)
         logging.debug('Saving GOA keyfile to "%s"' % keyfile_path)
         try:
-            keyfile.save_to_file(keyfile_path)
+            keyfile.write_keyfile(keyfile_path, (
+                (account, accountdata.items())
+                for account, accountdata in data.items()))
         except Exception as e:
             logging.error('Error saving GOA keyfile at "%s": %s' % (
                 keyfile_path, e))
-            return
+            return False
 
         logging.info('Processed GOA configuration for UID %s')
@@ -30,11 +30,17 @@ class ConfigLoader(object):
     DEFAULTS = {
         'dconf_db_path': '/etc/dconf/db',
         'dconf_profile_path': '/run/dconf/user',
+        'dconf_shared_dbs': 'false',
         'goa_run_path': '/run/goa-1.0',
         'chromium_policies_path': '/etc/chromium/policies/managed',
         'chrome_policies_path': '/etc/opt/chrome/policies/managed',
         'firefox_prefs_path': '/etc/firefox/pref',
         'firefox_policies_path': '/run/user/{}/firefox',
+        'compile_cache_path': '/var/cache/fleet-commander-client',
+        'compile_workers': '1',
+        'complete_namespaces': '',
+        'max_profile_size': '33554432',
+        'save_profiles': 'false',
         'log_level': 'info',
     }
 
@@ -58,3 +64,34 @@ class ConfigLoader(object):
                 logging.warning('Can not read key %s from config: %s' % (
                     key, e))
         return None
+
+    def get_int_value(self, key):
+        value = self.get_value(key)
+        try:
+            return int(value)
+        except Exception as e:
+            logging.warning('Can not read integer key %s from config: %s' % (
+                key, e))
+        if key in self.DEFAULTS.keys():
+            return int(self.DEFAULTS[key])
+        return None
+
+    def get_bool_value(self, key):
+        value = self.get_value(key)
+        if value is not None:
+            value = value.strip().lower()
+            if value in ('true', 'yes', '1'):
+                return True
+            if value in ('false', 'no', '0'):
+                return False
+            logging.warning('Can not read boolean key %s from config: %s' % (
+                key, value))
+        if key in self.DEFAULTS.keys():
+            return self.DEFAULTS[key] == 'true'
+        return None
+
+    def get_list_value(self, key):
+        value = self.get_value(key)
+        if value is None:
+            return []
+        return [item.strip() for item in value.split(';') if item.strip()]
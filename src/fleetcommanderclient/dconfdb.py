@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import sys
+import logging
+
+from gi.repository import GLib
+
+from fleetcommanderclient import gvdb
+
+
+def iter_keyfile_sections(trie):
+    """
+    Return (key path, (key name, value) tuples) sections of a keyfile for
+    given dconf settings trie
+    """
+    for keypath, items in trie.iter_sections():
+        yield (keypath, (
+            (keyname, item['value'])
+            for keyname, item in items if 'value' in item))
+
+
+def get_dconf_values(trie):
+    """
+    Return (key path, serialized value) tuples for dconf database
+    """
+    values = []
+    for key, item in trie.iter_settings():
+        if 'value' not in item:
+            continue
+        try:
+            variant = GLib.Variant.parse(None, item['value'], None, None)
+        except Exception as e:
+            logging.warning(
+                'Ignoring invalid dconf value for {}: {}'.format(key, e))
+            continue
+        # Values are stored boxed, in normal form and little endian
+        variant = GLib.Variant.new_variant(variant).get_normal_form()
+        if sys.byteorder != 'little':
+            variant = variant.byteswap()
+        values.append((key, variant.get_data_as_bytes().get_data()))
+    return values
+
+
+def compile_dconf_db(trie, db_file):
+    """
+    Compiles dconf database for given settings trie
+    """
+    gvdb.build_dconf_table(get_dconf_values(trie)).write(db_file)
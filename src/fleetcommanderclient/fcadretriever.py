@@ -53,7 +53,9 @@ from gi.repository import GLib
 
 from fleetcommanderclient.configloader import ConfigLoader
 from fleetcommanderclient.settingscompiler import SettingsCompiler
+from fleetcommanderclient.settingscompiler import FC_GLOBAL_POLICY_MAPPINGS
 from fleetcommanderclient import adapters
+from fleetcommanderclient import jsonscanner
 
 # Basic constants
 FC_PROFILE_PREFIX = '_FC_%s'
@@ -67,32 +69,6 @@ FC_DEFAULT_PROFILE_DATA = json.dumps({
 FC_GLOBAL_POLICY_NS = 'org.freedesktop.FleetCommander'
 FC_GLOBAL_POLICY_PROFILE_NAME = 'GLOBAL_POLICY__DO_NOT_MODIFY'
 FC_GLOBAL_POLICY_DEFAULT = 1
-FC_GLOBAL_POLICY_MAPPINGS = [
-    'ughx',
-    'ugxh',
-    'uhgx',
-    'uhxg',
-    'uxgh',
-    'uxhg',
-    'guhx',
-    'guxh',
-    'ghux',
-    'ghxu',
-    'gxuh',
-    'gxhu',
-    'hugx',
-    'huxg',
-    'hgux',
-    'hgxu',
-    'hxug',
-    'hxgu',
-    'xugh',
-    'xuhg',
-    'xguh',
-    'xghu',
-    'xhug',
-    'xhgu',
-]
 
 FC_NO_MATCH_PRIORITY = '00000'
 
@@ -560,13 +536,41 @@ class FleetCommanderADProfileRetriever(object):
 
     def process_profile(
             self, profile, userdir, username, groups, hostname, global_policy):
+        """
+        Return a (filename, settings) tuple for given profile, or None if
+        its data can not be read. Settings are returned as encoded JSON data,
+        to be decoded by the settings compiler. They are also written to a
+        file in given directory, if any
+        """
         # Read CIFs data
         data = self.get_profile_cifs_data(profile['cn'])
+        max_size = self.config.get_int_value('max_profile_size')
+        if data is not None and max_size and len(data) > max_size:
+            logging.error(
+                'FCADRetriever: Ignoring profile {}: {} bytes exceed the '
+                'limit of {}'.format(profile['cn'], len(data), max_size))
+            return None
         if data is not None:
-            jsondata = json.loads(data)
-            # Get priority
-            priority = str(
-                jsondata.get('priority', FC_DEFAULT_PRIORITY)).zfill(5)
+            # Find settings, leaving their decoding to the settings compiler
+            try:
+                text = str(data, 'utf-8')
+                spans = jsonscanner.get_object_member_spans(
+                    text, ('priority', 'settings'))
+                if 'settings' not in spans:
+                    raise ValueError('Missing settings')
+                if 'priority' in spans:
+                    start, end = spans['priority']
+                    priority = json.loads(text[start:end])
+                else:
+                    priority = FC_DEFAULT_PRIORITY
+            except Exception as e:
+                logging.error(
+                    'FCADRetriever: Ignoring profile {}: {}'.format(
+                        profile['cn'], e))
+                return None
+            start, end = spans['settings']
+            settings = text[start:end].encode('utf-8')
+            priority = str(priority).zfill(5)
             # Generate file name
             priority_applies = self.generate_priority_applies(
                 username, groups, hostname,
@@ -577,9 +581,12 @@ class FleetCommanderADProfileRetriever(object):
                 priority_applies,
                 profile['name'].replace(' ', '_'))
             # Write profile file in user directory
-            with open(os.path.join(userdir, filename), 'w') as fd:
-                fd.write(json.dumps(jsondata['settings']))
-                fd.close()
+            if userdir is not None:
+                with open(os.path.join(userdir, filename), 'wb') as fd:
+                    fd.write(settings)
+                    fd.close()
+            return (filename, settings)
+        return None
 
     def call_fc_client(self):
         logging.debug('FCADRetriever: Calling FC client')
@@ -633,29 +640,70 @@ class FleetCommanderADProfileRetriever(object):
         userdir = os.path.join(
             os.path.expanduser('~/.cache/fleet-commander-client'), str(uid))
         profilesdir = os.path.join(userdir, 'profiles')
-        if os.path.exists(userdir):
-            shutil.rmtree(userdir)
-        os.makedirs(profilesdir)
+        compiledir = os.path.join(userdir, 'compiled')
+        sourcesdir = os.path.join(userdir, 'compiled-sources')
+        if os.path.exists(profilesdir):
+            shutil.rmtree(profilesdir)
+
+        # Profiles are only written to disk when asked to, compiling them in
+        # memory otherwise
+        save_profiles = self.config.get_bool_value('save_profiles')
+        if save_profiles:
+            os.makedirs(profilesdir)
         
         # Read all profiles
         logging.debug('FCADRetriever: Reading and processing profiles')
         profiles = self.get_profiles()
         # Process each profile
+        sources = []
         for profile in profiles:
-            self.process_profile(
-                profile, profilesdir,
+            source = self.process_profile(
+                profile, profilesdir if save_profiles else None,
                 username, groups, hostname, global_policy)
+            if source is not None:
+                sources.append(source)
 
         # Compile profiles data
         logging.debug('FCADRetriever: Compiling settings data')
-        sc = SettingsCompiler(profilesdir)
-        compiled_settings = sc.compile_settings()
+        max_profile_size = self.config.get_int_value(
+            'max_profile_size') or None
+        workers = self.config.get_int_value('compile_workers')
+        complete_namespaces = self.config.get_list_value('complete_namespaces')
+        if save_profiles:
+            # Provenance is saved along with compiled settings in cache
+            sc = SettingsCompiler(
+                profilesdir, compiledir,
+                provenance=True,
+                max_profile_size=max_profile_size,
+                workers=workers,
+                complete_namespaces=complete_namespaces)
+        else:
+            sc = SettingsCompiler(
+                None, sourcesdir,
+                max_profile_size=max_profile_size,
+                workers=workers,
+                shadowed=True,
+                complete_namespaces=complete_namespaces)
+        for namespace, adapter in self.adapters.items():
+            sc.register_aliases(namespace, adapter.ALIASED_NAMESPACES)
+        if save_profiles:
+            compiled_settings = sc.compile_settings(
+                namespaces=self.adapters.keys())
+        else:
+            compiled_settings = sc.compile_sources(
+                sources, namespaces=self.adapters.keys())
 
-        # Prepare cached files
+        # Prepare cached files, skipping namespaces whose compiled settings
+        # digest matches the one of the cached files
         for namespace, adapter in self.adapters.items():
             if namespace in compiled_settings:
-                config_data = compiled_settings[namespace]
-                adapter.generate_config(config_data)
+                if adapter.get_cached_digest() == sc.digests[namespace]:
+                    logging.debug(
+                        'FCADRetriever: No changes for namespace {}'.format(
+                            namespace))
+                    continue
+                config_data = sc.expand_settings(compiled_settings[namespace])
+                adapter.generate_config(config_data, sc.digests[namespace])
             else:
                 # Just clean up data
                 adapter.cleanup_cache()
@@ -33,6 +33,8 @@ from gi.repository import GObject
 from fleetcommanderclient.configloader import ConfigLoader
 from fleetcommanderclient import configadapters
 from fleetcommanderclient.settingscompiler import SettingsCompiler
+from fleetcommanderclient.settingscompiler import FC_GLOBAL_POLICY_MAPPINGS
+from fleetcommanderclient.metrics import CompileMetrics
 
 DBUS_BUS_NAME = 'org.freedesktop.FleetCommanderClient'
 DBUS_OBJECT_PATH = '/org/freedesktop/FleetCommanderClient'
@@ -127,19 +129,81 @@ class FleetCommanderClientDbusService(dbus.service.Object):
                 'p': policy,
             })
 
-        # Compile settings
-        sc = SettingsCompiler(directory)
+        # Compile settings. Profiles not applied by user are compiled once
+        # into base layers shared by all users
+        cache_path = self.config.get_value('compile_cache_path')
+        base_cache_path = None
+        if cache_path:
+            base_cache_path = os.path.join(cache_path, 'base')
+            cache_path = os.path.join(cache_path, str(uid))
+        user_field = None
+        if 0 < policy <= len(FC_GLOBAL_POLICY_MAPPINGS):
+            user_field = FC_GLOBAL_POLICY_MAPPINGS[policy - 1].index('u')
+        # Measure compilation when debugging only
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            metrics = CompileMetrics()
+        else:
+            metrics = None
+        sc = SettingsCompiler(
+            directory, cache_path,
+            provenance=True,
+            base_cache_path=base_cache_path,
+            user_field=user_field,
+            max_profile_size=self.config.get_int_value(
+                'max_profile_size') or None,
+            metrics=metrics,
+            workers=self.config.get_int_value('compile_workers'),
+            complete_namespaces=self.config.get_list_value(
+                'complete_namespaces'))
+        for namespace, adapter in self.config_adapters.items():
+            sc.register_aliases(namespace, adapter.ALIASED_NAMESPACES)
         logging.debug('FC Client: Compiling settings')
-        compiled_settings = sc.compile_settings()
-        # Send data to configuration adapters
+        compiled_settings = sc.compile_settings(
+            namespaces=self.config_adapters.keys())
+        if metrics is not None:
+            logging.debug('FC Client: Compile metrics: %s' % json.dumps(
+                metrics.to_dict(), sort_keys=True))
+        # Send data to configuration adapters, skipping namespaces whose
+        # settings did not change since they were last applied, as long as
+        # deployed files are still in place
+        if sc.cache is not None:
+            applied = sc.cache.load_applied()
+        else:
+            applied = {}
         logging.debug('FC Client: Applying settings')
         for namespace in compiled_settings:
-            logging.debug('FC Client: Checking adapters for namespace %s' % namespace)
+            logging.debug(
+                'FC Client: Checking adapters for namespace %s' % namespace)
             if namespace in self.config_adapters:
-                logging.debug('FC Client: Applying settings for namespace %s' % namespace)
-                self.config_adapters[namespace].bootstrap(uid)
-                data = compiled_settings[namespace]
-                self.config_adapters[namespace].update(uid, data)
+                adapter = self.config_adapters[namespace]
+                if applied.get(namespace) == sc.digests[namespace] and \
+                        adapter.is_deployed(uid):
+                    logging.debug(
+                        'FC Client: No changes for namespace %s' % namespace)
+                    continue
+                logging.debug(
+                    'FC Client: Applying settings for namespace %s' % (
+                        namespace))
+                # Digests are only recorded for settings applied successfully,
+                # so failed namespaces are applied again next time
+                applied.pop(namespace, None)
+                try:
+                    adapter.bootstrap(uid)
+                    data = sc.expand_settings(compiled_settings[namespace])
+                    if adapter.update(uid, data) is False:
+                        continue
+                except Exception as e:
+                    logging.error(
+                        'FC Client: Error applying settings for namespace '
+                        '%s: %s' % (namespace, e))
+                    continue
+                applied[namespace] = sc.digests[namespace]
+        if sc.cache is not None:
+            try:
+                sc.cache.save_applied(applied)
+            except Exception as e:
+                logging.warning(
+                    'FC Client: Can not save applied settings digests: %s' % e)
         self.quit()
 
     @dbus.service.method(DBUS_INTERFACE_NAME,
@@ -21,7 +21,6 @@
 
 import os
 import logging
-import json
 
 import dbus
 import dbus.service
@@ -31,9 +30,8 @@ import gi
 from gi.repository import GObject
 
 from fleetcommanderclient.configloader import ConfigLoader
-from fleetcommanderclient import configadapters
 from fleetcommanderclient import adapters
-from fleetcommanderclient.settingscompiler import SettingsCompiler
+from fleetcommanderclient.compilecache import CompileCache
 
 DBUS_BUS_NAME = 'org.freedesktop.FleetCommanderClientAD'
 DBUS_OBJECT_PATH = '/org/freedesktop/FleetCommanderClientAD'
@@ -64,7 +62,8 @@ class FleetCommanderClientADDbusService(dbus.service.Object):
         self.register_adapter(
             adapters.DconfAdapter,
             self.config.get_value('dconf_profile_path'),
-            self.config.get_value('dconf_db_path'))
+            self.config.get_value('dconf_db_path'),
+            shared_dbs=self.config.get_bool_value('dconf_shared_dbs'))
 
         self.register_adapter(
             adapters.GOAAdapter,
@@ -128,13 +127,37 @@ class FleetCommanderClientADDbusService(dbus.service.Object):
         logging.debug(
             'FC Client: Got peer UID: {}'.format(uid))
 
-        # Cycle through configuration adapters and deploy existing data
+        # Digests of the configuration last deployed for this user
+        cache_path = self.config.get_value('compile_cache_path')
+        if cache_path:
+            cache = CompileCache(os.path.join(cache_path, 'ad', str(uid)))
+            deployed = cache.load_applied()
+        else:
+            cache = None
+            deployed = {}
+
+        # Cycle through configuration adapters and deploy existing data.
+        # Unchanged data is deployed again only if deployed files are gone
         for namespace, adapter in self.adapters.items():
+            digest = adapter.get_cached_digest(uid)
+            if digest is not None and deployed.get(namespace) == digest and \
+                    adapter.is_deployed(uid):
+                logging.debug(
+                    'FC Client: No changes for namespace {}'.format(
+                        namespace))
+                continue
             logging.debug(
                 'FC Client: Deploying configuration for namespace {}'.format(
                     namespace))
 
             adapter.deploy(uid)
+            deployed[namespace] = digest
+        if cache is not None:
+            try:
+                cache.save_applied(deployed)
+            except Exception as e:
+                logging.warning(
+                    'FC Client: Can not save deployed digests: {}'.format(e))
         self.quit()
 
     @dbus.service.method(DBUS_INTERFACE_NAME,
@@ -40,6 +40,7 @@ from gi.repository import GLib
 
 from fleetcommanderclient.configloader import ConfigLoader
 from fleetcommanderclient.settingscompiler import SettingsCompiler
+from fleetcommanderclient.settingscompiler import FC_GLOBAL_POLICY_MAPPINGS
 from fleetcommanderclient import adapters
 
 # Basic constants
@@ -53,32 +54,6 @@ FC_DEFAULT_PROFILE_DATA = json.dumps({
 
 FC_GLOBAL_POLICY_NS = 'org.freedesktop.FleetCommander'
 FC_GLOBAL_POLICY_DEFAULT = 1
-FC_GLOBAL_POLICY_MAPPINGS = [
-    'ughx',
-    'ugxh',
-    'uhgx',
-    'uhxg',
-    'uxgh',
-    'uxhg',
-    'guhx',
-    'guxh',
-    'ghux',
-    'ghxu',
-    'gxuh',
-    'gxhu',
-    'hugx',
-    'huxg',
-    'hgux',
-    'hgxu',
-    'hxug',
-    'hxgu',
-    'xugh',
-    'xuhg',
-    'xguh',
-    'xghu',
-    'xhug',
-    'xhgu',
-]
 
 
 class FleetCommanderIPARetriever(object):
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import os
+import struct
+
+# GVDB file header: signature, version, options and root table pointer
+GVDB_HEADER = struct.Struct('<IIIIII')
+GVDB_SIGNATURE0 = 0x72615647
+GVDB_SIGNATURE1 = 0x746e6169
+
+# Hash table item: hash, parent index, key start, key size, type, unused
+# and value pointer
+GVDB_HASH_ITEM = struct.Struct('<IIIHccII')
+
+GVDB_NO_PARENT = 0xffffffff
+
+# Bloom filter header of hash tables. There is no bloom filter, only its
+# shift is written
+GVDB_BLOOM_SHIFT = 5
+
+# Moduli by table size shift used by GLib hash tables
+GHASH_PRIME_MOD = [
+    1, 2, 3, 7, 13, 31, 61, 127, 251, 509, 1021, 2039, 4093, 8191, 16381,
+    32749, 65521, 131071, 262139, 524287, 1048573, 2097143, 4194301,
+    8388593, 16777213, 33554393, 67108859, 134217689, 268435399, 536870909,
+    1073741789, 2147483647,
+]
+GHASH_MIN_SHIFT = 3
+
+
+def str_hash(key):
+    """
+    Return hash of given string as computed by GLib g_str_hash and GVDB,
+    adding its UTF-8 bytes as signed chars
+    """
+    value = 5381
+    for byte in key.encode('utf-8'):
+        if byte > 127:
+            byte -= 256
+        value = (value * 33 + byte) & 0xffffffff
+    return value
+
+
+class GHashTableOrder(object):
+    """
+    Key ordering of a GLib hash table with string keys.
+
+    dconf and GVDB tables are GLib hash tables, and the order they iterate
+    their keys in decides the layout of compiled databases. This emulates
+    their open addressing, quadratic probing and resizing, as done by the
+    GLib releases dconf compile databases are compared with, so keys are
+    iterated in the same order given the same insertions. Readers do not
+    depend on this order, any order produces a valid database.
+    """
+
+    def __init__(self):
+        self.nnodes = 0
+        self.noccupied = 0
+        self.set_shift(GHASH_MIN_SHIFT)
+        self.hashes = [0] * self.size
+        self.keys = [None] * self.size
+
+    def set_shift(self, shift):
+        self.size = 1 << shift
+        self.mod = GHASH_PRIME_MOD[shift]
+        self.mask = self.size - 1
+
+    def set_shift_from_size(self, size):
+        shift = 0
+        while size:
+            size >>= 1
+            shift += 1
+        self.set_shift(max(shift, GHASH_MIN_SHIFT))
+
+    def probe(self, hash_value, key=None):
+        index = hash_value % self.mod
+        step = 0
+        while self.hashes[index]:
+            if self.hashes[index] == hash_value and self.keys[index] == key:
+                break
+            step += 1
+            index = (index + step) & self.mask
+        return index
+
+    def insert(self, key):
+        """
+        Insert given key, if not present yet
+        """
+        hash_value = str_hash(key)
+        if hash_value < 2:
+            hash_value = 2
+        index = self.probe(hash_value, key)
+        if self.hashes[index]:
+            return
+        self.hashes[index] = hash_value
+        self.keys[index] = key
+        self.nnodes += 1
+        self.noccupied += 1
+        if (self.size > self.nnodes * 4 and self.size > 1 << GHASH_MIN_SHIFT) \
+                or self.size <= self.noccupied + self.noccupied // 16:
+            self.resize()
+
+    def resize(self):
+        hashes = self.hashes
+        keys = self.keys
+        self.set_shift_from_size(self.nnodes * 2)
+        self.hashes = [0] * self.size
+        self.keys = [None] * self.size
+        for hash_value, key in zip(hashes, keys):
+            if hash_value >= 2:
+                index = self.probe(hash_value)
+                self.hashes[index] = hash_value
+                self.keys[index] = key
+        self.noccupied = self.nnodes
+
+    def __iter__(self):
+        for hash_value, key in zip(self.hashes, self.keys):
+            if hash_value >= 2:
+                yield key
+
+    def __len__(self):
+        return self.nnodes
+
+
+class GvdbItem(object):
+    """
+    GVDB table item, holding either a value or a list of children
+    """
+
+    __slots__ = ('key', 'hash_value', 'parent', 'children', 'value', 'index')
+
+    def __init__(self, key):
+        self.key = key
+        self.hash_value = str_hash(key)
+        self.parent = None
+        self.children = []
+        self.value = None
+        self.index = None
+
+    def set_parent(self, parent):
+        self.parent = parent
+        if parent is not None:
+            parent.children.append(self)
+
+
+class GvdbTable(object):
+    """
+    GVDB hash table writer
+
+    Generates the same files as the GVDB builder used by dconf compile,
+    given the same items inserted in the same order. Values must be given
+    already serialized as GVariant variants in normal form, in little endian
+    byte order.
+    """
+
+    def __init__(self):
+        self.order = GHashTableOrder()
+        self.items = {}
+
+    def insert(self, key):
+        """
+        Return item for given key, inserting it if needed
+        """
+        item = self.items.get(key)
+        if item is None:
+            item = self.items[key] = GvdbItem(key)
+            self.order.insert(key)
+        return item
+
+    def get_contents(self):
+        """
+        Return GVDB file contents
+        """
+        builder = _FileBuilder()
+        root = builder.add_hash(self)
+        return builder.serialize(root)
+
+    def write(self, filename):
+        """
+        Write GVDB file, replacing any previous file atomically
+        """
+        contents = self.get_contents()
+        with open(filename + '.tmp', 'wb') as fd:
+            fd.write(contents)
+            fd.close()
+        os.rename(filename + '.tmp', filename)
+
+
+class _FileBuilder(object):
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = GVDB_HEADER.size
+
+    def allocate(self, alignment, size):
+        if size == 0:
+            return (None, (0, 0))
+        self.offset += -self.offset & (alignment - 1)
+        data = bytearray(size)
+        start = self.offset
+        self.chunks.append((start, data))
+        self.offset += size
+        return (data, (start, self.offset))
+
+    def add_string(self, string):
+        data = string.encode('utf-8')
+        if len(data) > 0xffff:
+            raise ValueError('GVDB key too long: {}'.format(string))
+        start = self.offset
+        self.chunks.append((start, data))
+        self.offset += len(data)
+        return (start, len(data))
+
+    def add_hash(self, table):
+        n_buckets = len(table.items)
+        buckets = [[] for i in range(n_buckets)]
+        for key in table.order:
+            item = table.items[key]
+            # Items are prepended to bucket chains
+            buckets[item.hash_value % n_buckets].insert(0, item)
+        index = 0
+        for chain in buckets:
+            for item in chain:
+                item.index = index
+                index += 1
+
+        item_size = GVDB_HASH_ITEM.size
+        data, pointer = self.allocate(
+            4, 8 + (4 + item_size) * n_buckets)
+        struct.pack_into(
+            '<II', data, 0, GVDB_BLOOM_SHIFT << 27, n_buckets)
+        offset = 8 + 4 * n_buckets
+        index = 0
+        for bucket, chain in enumerate(buckets):
+            struct.pack_into('<I', data, 8 + 4 * bucket, index)
+            for item in chain:
+                if item.parent is not None:
+                    parent = item.parent.index
+                    basename = item.key[len(item.parent.key):]
+                else:
+                    parent = GVDB_NO_PARENT
+                    basename = item.key
+                key_start, key_size = self.add_string(basename)
+                item_type = b'\0'
+                value = (0, 0)
+                if item.value is not None:
+                    value_data, value = self.allocate(8, len(item.value))
+                    value_data[:] = item.value
+                    item_type = b'v'
+                elif item.children:
+                    # Children are sorted as strcmp does
+                    children = sorted(
+                        item.children, key=lambda c: c.key.encode('utf-8'))
+                    offsets, value = self.allocate(4, 4 * len(children))
+                    struct.pack_into(
+                        '<%dI' % len(children), offsets, 0,
+                        *[child.index for child in children])
+                    item_type = b'L'
+                GVDB_HASH_ITEM.pack_into(
+                    data, offset, item.hash_value, parent, key_start,
+                    key_size, item_type, b'\0', value[0], value[1])
+                offset += item_size
+                index += 1
+        return pointer
+
+    def serialize(self, root):
+        result = bytearray(GVDB_HEADER.pack(
+            GVDB_SIGNATURE0, GVDB_SIGNATURE1, 0, 0, root[0], root[1]))
+        for offset, data in self.chunks:
+            result.extend(b'\0' * (offset - len(result)))
+            result.extend(data)
+        return bytes(result)
+
+
+def get_dconf_parent(table, key):
+    """
+    Return parent directory item of given key, inserting any missing
+    ancestors as dconf does
+    """
+    if key == '/':
+        return None
+    length = len(key)
+    if key.endswith('/'):
+        length -= 1
+    while key[length - 1] != '/':
+        length -= 1
+    parent_name = key[:length]
+    parent = table.items.get(parent_name)
+    if parent is None:
+        parent = table.insert(parent_name)
+        parent.set_parent(get_dconf_parent(table, parent_name))
+    return parent
+
+
+def build_dconf_table(values):
+    """
+    Return GVDB table of a dconf database for given (key path, serialized
+    value) tuples, given in the order dconf compile reads them from its
+    keyfiles. Later values for the same key replace earlier ones.
+    """
+    # dconf merges keyfiles into a changeset, a hash table of key paths,
+    # and then adds its paths to the database table in hash table order
+    changeset = GHashTableOrder()
+    data = {}
+    for key, value in values:
+        changeset.insert(key)
+        data[key] = value
+    table = GvdbTable()
+    for key in changeset:
+        item = table.insert(key)
+        item.set_parent(get_dconf_parent(table, key))
+        item.value = data[key]
+    return table
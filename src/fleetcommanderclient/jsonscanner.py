@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import re
+import json
+from json.decoder import scanstring
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+DECODER = json.JSONDecoder()
+
+
+def skip_whitespace(text, idx):
+    """
+    Return index of next non whitespace character
+    """
+    return WHITESPACE.match(text, idx).end()
+
+
+def skip_value(text, idx):
+    """
+    Return index after the JSON value starting at given index.
+
+    The value is decoded by the C scanner of the json module and discarded
+    right away. That is several times faster than scanning it in Python,
+    and skipped values never stay in memory along with the wanted ones
+    """
+    return DECODER.raw_decode(text, idx)[1]
+
+
+def scan_object_members(text, handler):
+    """
+    Walk the members of a JSON object. The handler is called with the key
+    and the index where the value starts for each member, and must return
+    the index after that value
+    """
+    idx = skip_whitespace(text, 0)
+    if text[idx:idx + 1] != '{':
+        raise ValueError('Expecting JSON object at char %s' % idx)
+    idx = skip_whitespace(text, idx + 1)
+    if text[idx:idx + 1] == '}':
+        idx = skip_whitespace(text, idx + 1)
+    else:
+        while True:
+            if text[idx:idx + 1] != '"':
+                raise ValueError(
+                    'Expecting property name at char %s' % idx)
+            key, idx = scanstring(text, idx + 1)
+            idx = skip_whitespace(text, idx)
+            if text[idx:idx + 1] != ':':
+                raise ValueError('Expecting \':\' delimiter at char %s' % idx)
+            idx = skip_whitespace(text, idx + 1)
+            idx = skip_whitespace(text, handler(key, idx))
+            delimiter = text[idx:idx + 1]
+            idx = skip_whitespace(text, idx + 1)
+            if delimiter == '}':
+                break
+            if delimiter != ',':
+                raise ValueError('Expecting \',\' delimiter at char %s' % idx)
+    if idx != len(text):
+        raise ValueError('Extra data at char %s' % idx)
+
+
+def decode_object_members(text, keys, decoder=DECODER):
+    """
+    Decode a JSON object, keeping only the values for the given keys.
+    Values for any other key are skipped, without going through the given
+    decoder hooks
+    """
+    result = {}
+
+    def handler(key, idx):
+        if key in keys:
+            result[key], idx = decoder.raw_decode(text, idx)
+            return idx
+        return skip_value(text, idx)
+
+    scan_object_members(text, handler)
+    return result
+
+
+def get_object_member_spans(text, keys):
+    """
+    Return a dictionary with the (start, end) indexes of the values for the
+    given keys of a JSON object, so they can be handed over undecoded
+    """
+    result = {}
+
+    def handler(key, idx):
+        end = skip_value(text, idx)
+        if key in keys:
+            result[key] = (idx, end)
+        return end
+
+    scan_object_members(text, handler)
+    return result
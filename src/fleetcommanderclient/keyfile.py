@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import os
+import logging
+
+
+def is_group_name(name):
+    """
+    Check if given name is a valid keyfile group name, as GLib does
+    """
+    if not name:
+        return False
+    for char in name:
+        if char in '[]' or ord(char) < 32 or ord(char) == 127:
+            return False
+    return True
+
+
+def is_key_name(name):
+    """
+    Check if given name is a valid keyfile key name, as GLib does. Key names
+    may end with a locale between brackets. Unlike GLib, names with line
+    breaks are rejected, as they can not be read back
+    """
+    base, bracket, locale = name.partition('[')
+    if not base or base[0] == ' ' or base[-1] == ' ':
+        return False
+    if '=' in base or ']' in base or '\n' in name or '\r' in name:
+        return False
+    if bracket:
+        if not locale.endswith(']'):
+            return False
+        locale = locale[:-1]
+        if '[' in locale or ']' in locale or '=' in locale:
+            return False
+    return True
+
+
+def escape_value(value):
+    """
+    Escape string value as GLib keyfiles do. Leading spaces and tabs, new
+    lines, carriage returns and backslashes are escaped
+    """
+    result = []
+    leading = True
+    for char in value:
+        if char == ' ' and leading:
+            result.append('\\s')
+        elif char == '\t' and leading:
+            result.append('\\t')
+        elif char == '\n':
+            result.append('\\n')
+        elif char == '\r':
+            result.append('\\r')
+        elif char == '\\':
+            result.append('\\\\')
+            leading = False
+        else:
+            result.append(char)
+            leading = False
+    return ''.join(result)
+
+
+def format_value(value):
+    """
+    Return keyfile representation of a string or boolean value
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str):
+        return escape_value(value)
+    raise TypeError(
+        'Keyfile values must be strings or booleans, not {}'.format(
+            type(value).__name__))
+
+
+def iter_keyfile_lines(sections):
+    """
+    Yield lines of a keyfile for given (group, items) tuples, where items
+    are (key, value) tuples. Groups without items are not written, and
+    invalid group and key names are ignored, as GLib does.
+
+    Groups and keys are written in the order they are given, so each group
+    should be given only once.
+    """
+    first = True
+    for group, items in sections:
+        if not is_group_name(group):
+            logging.warning(
+                'Ignoring invalid keyfile group "{}"'.format(group))
+            continue
+        header = True
+        for key, value in items:
+            if not is_key_name(key):
+                logging.warning(
+                    'Ignoring invalid keyfile key "{}" in group "{}"'.format(
+                        key, group))
+                continue
+            line = '{}={}\n'.format(key, format_value(value))
+            if header:
+                # Groups are separated by an empty line
+                if not first:
+                    yield '\n'
+                yield '[{}]\n'.format(group)
+                header = False
+                first = False
+            yield line
+
+
+def write_keyfile(filename, sections):
+    """
+    Write keyfile for given (group, items) tuples in a single buffered pass,
+    replacing any previous file atomically
+    """
+    with open(filename + '.tmp', 'w', encoding='utf-8', newline='') as fd:
+        fd.writelines(iter_keyfile_lines(sections))
+        fd.close()
+    os.rename(filename + '.tmp', filename)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+class KeyTrieNode(object):
+    """
+    Directory of a key path trie, holding its subdirectories and the
+    settings of the keys directly under it
+    """
+
+    __slots__ = ('children', 'settings')
+
+    def __init__(self):
+        self.children = {}
+        self.settings = {}
+
+
+class KeyTrie(object):
+    """
+    Settings indexed by slash separated key paths
+
+    Key paths are split once when settings are added. Grouping keys by
+    directory, as keyfile sections do, walking all keys under a path prefix,
+    like the keys of a schema, and comparing subtrees are then done walking
+    the trie.
+    """
+
+    def __init__(self, key_name='key'):
+        self.key_name = key_name
+        self.root = KeyTrieNode()
+        self.size = 0
+
+    @classmethod
+    def from_settings(cls, settings, key_name='key'):
+        """
+        Create trie from a list of settings. Settings without a key path
+        are ignored
+        """
+        trie = cls(key_name)
+        for setting in settings:
+            trie.add(setting)
+        return trie
+
+    @staticmethod
+    def split_path(path):
+        """
+        Return directory names of given path. A trailing slash is optional
+        """
+        return [name for name in path.split('/') if name]
+
+    def add(self, setting):
+        """
+        Add a setting, replacing any other setting with the same key
+        """
+        key = setting.get(self.key_name)
+        if not isinstance(key, str) or not key.startswith('/'):
+            return
+        names = key[1:].split('/')
+        node = self.root
+        for name in names[:-1]:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = KeyTrieNode()
+            node = child
+        if names[-1] not in node.settings:
+            self.size += 1
+        node.settings[names[-1]] = setting
+
+    def get_node(self, path):
+        """
+        Return node for given directory path, or None if there is none
+        """
+        node = self.root
+        for name in self.split_path(path):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def get(self, key, default=None):
+        """
+        Return setting for given key
+        """
+        directory, name = key.rsplit('/', 1)
+        node = self.get_node(directory)
+        if node is None:
+            return default
+        return node.settings.get(name, default)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.size
+
+    def _walk(self, node, path):
+        yield (path, node)
+        for name, child in node.children.items():
+            for item in self._walk(child, path + name + '/'):
+                yield item
+
+    def walk(self, prefix='/'):
+        """
+        Yield (directory path, node) tuples for all directories under given
+        path, parents first. Directory paths start and end with a slash
+        """
+        names = self.split_path(prefix)
+        node = self.get_node(prefix)
+        if node is None:
+            return iter(())
+        if names:
+            return self._walk(node, '/' + '/'.join(names) + '/')
+        return self._walk(node, '/')
+
+    def iter_settings(self, prefix='/'):
+        """
+        Yield (key, setting) tuples for all keys under given path
+        """
+        for path, node in self.walk(prefix):
+            for name, setting in node.settings.items():
+                yield (path + name, setting)
+
+    def iter_sections(self, prefix='/'):
+        """
+        Yield (section, settings) tuples for the directories under given path
+        having keys, where section is the directory path without leading and
+        trailing slashes, as in dconf keyfiles, and settings is a list of
+        (key name, setting) tuples
+        """
+        for path, node in self.walk(prefix):
+            if node.settings:
+                yield (path[1:-1], list(node.settings.items()))
+
+    def to_list(self, prefix='/'):
+        """
+        Return list of settings under given path
+        """
+        return [setting for key, setting in self.iter_settings(prefix)]
+
+    def diff(self, other, prefix='/'):
+        """
+        Compare settings under given path with those of a previous trie.
+
+        Returns (added, changed, removed) sets of keys. Only directories
+        under given path are walked.
+        """
+        added = set()
+        changed = set()
+        removed = set()
+        names = self.split_path(prefix)
+        path = '/' + ''.join(name + '/' for name in names)
+        self._diff_nodes(
+            other.get_node(prefix), self.get_node(prefix), path,
+            added, changed, removed)
+        return (added, changed, removed)
+
+    def _diff_nodes(self, old, new, path, added, changed, removed):
+        if old is new:
+            return
+        empty = KeyTrieNode()
+        if old is None:
+            old = empty
+        if new is None:
+            new = empty
+        for name, setting in new.settings.items():
+            if name not in old.settings:
+                added.add(path + name)
+            elif old.settings[name] != setting:
+                changed.add(path + name)
+        for name in old.settings:
+            if name not in new.settings:
+                removed.add(path + name)
+        for name, child in new.children.items():
+            self._diff_nodes(
+                old.children.get(name), child, path + name + '/',
+                added, changed, removed)
+        for name, child in old.children.items():
+            if name not in new.children:
+                self._diff_nodes(
+                    child, None, path + name + '/',
+                    added, changed, removed)
@@ -20,7 +20,14 @@
 #          Oliver Gutiérrez <ogutierrez@redhat.com>
 
 # Python imports
-import logging
+import json
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from fleetcommanderclient import compact
+from fleetcommanderclient.keytrie import KeyTrie
 
 
 class BaseMerger(object):
@@ -28,9 +35,55 @@ class BaseMerger(object):
     Base merger class
 
     Default policy: Overwrite same key with new value, create new keys
+
+    Keys can be given other merge strategies for their values:
+      replace: Overwrite previous value (default)
+      deep-merge: Merge dictionaries recursively
+      union: Add list items not already present. A ('union', field) tuple
+             compares dictionary items by that field instead
+      append: Concatenate lists
     """
 
     KEY_NAME = 'key'
+    VALUE_NAME = 'value'
+
+    # Merge strategies by setting key
+    STRATEGIES = {}
+
+    def __init__(self, strategies=None):
+        merge_strategies = dict(self.STRATEGIES)
+        if strategies is not None:
+            merge_strategies.update(strategies)
+        # Compile strategies into setting merge handlers by key
+        self.handlers = {}
+        for key, strategy in merge_strategies.items():
+            handler = self.get_strategy_handler(strategy)
+            if handler is not None:
+                self.handlers[key] = handler
+
+    def get_strategy_handler(self, strategy):
+        """
+        Return a function merging a setting into the previous one for the
+        same key, or None if that previous setting is just replaced
+        """
+        if isinstance(strategy, tuple):
+            name, args = strategy[0], strategy[1:]
+        else:
+            name, args = strategy, ()
+        if name == 'replace':
+            return None
+        merge_value = getattr(self, 'merge_value_' + name.replace('-', '_'))
+        value_name = self.VALUE_NAME
+
+        def handler(old, new):
+            if old is not None:
+                old = old.get(value_name)
+            setting = dict(new)
+            setting[value_name] = merge_value(
+                old, new.get(value_name), *args)
+            return setting
+
+        return handler
 
     def get_key(self, setting):
         """
@@ -44,12 +97,105 @@ class BaseMerger(object):
         Merge settings in the given order
         """
         index = {}
+        handlers = self.handlers
         for settings in args:
             for setting in settings:
                 key = self.get_key(setting)
+                handler = handlers.get(key)
+                if handler is not None:
+                    setting = handler(index.get(key), setting)
                 index[key] = setting
         return list(index.values())
 
+    def merge_value_deep_merge(self, a, b):
+        """
+        Merge dictionary b into dictionary a recursively
+        """
+        if not isinstance(a, Mapping) or not isinstance(b, Mapping):
+            return b
+        result = dict(a)
+        for name, value in b.items():
+            if name in result:
+                value = self.merge_value_deep_merge(result[name], value)
+            result[name] = value
+        return result
+
+    @staticmethod
+    def get_item_hash_key(item):
+        """
+        Return a hashable representation of a list item
+        """
+        try:
+            hash(item)
+            return item
+        except TypeError:
+            # Compact records are serialized as the dictionaries they replace
+            return json.dumps(item, sort_keys=True, default=compact.expand)
+
+    def merge_value_union(self, a, b, field=None):
+        """
+        Merge list b into list a, overwriting items with same value, or same
+        value for given field, and appending new ones
+        """
+        result = list(a) if a is not None else []
+        positions = {}
+        for position, item in enumerate(result):
+            if field is not None:
+                item = item.get(field)
+            positions.setdefault(self.get_item_hash_key(item), position)
+        for item in b:
+            hash_key = self.get_item_hash_key(
+                item.get(field) if field is not None else item)
+            position = positions.get(hash_key)
+            if position is not None:
+                result[position] = item
+            else:
+                positions[hash_key] = len(result)
+                result.append(item)
+        return result
+
+    def merge_value_append(self, a, b):
+        """
+        Append list b to list a
+        """
+        if a is None:
+            return list(b)
+        return list(a) + list(b)
+
+    def get_index(self, settings):
+        """
+        Return settings indexed by key
+        """
+        index = {}
+        for setting in settings:
+            index[self.get_key(setting)] = setting
+        return index
+
+    def exclude_keys(self, settings, keys):
+        """
+        Return settings without the ones for given keys
+        """
+        return [
+            setting for setting in settings
+            if self.get_key(setting) not in keys]
+
+    def diff(self, old, new):
+        """
+        Compare two merged settings.
+        Returns a tuple with added, changed and removed keys
+        """
+        old_index = self.get_index(old)
+        new_index = self.get_index(new)
+        added = set()
+        changed = set()
+        for key, setting in new_index.items():
+            if key not in old_index:
+                added.add(key)
+            elif old_index[key] != setting:
+                changed.add(key)
+        removed = set(old_index.keys()) - set(new_index.keys())
+        return (added, changed, removed)
+
 
 class GSettingsMerger(BaseMerger):
     """
@@ -57,10 +203,42 @@ class GSettingsMerger(BaseMerger):
 
     Policy: Overwrite same key with new value, create new keys
     """
-    pass
 
+    def get_trie(self, settings):
+        """
+        Return settings indexed by key path
+        """
+        return KeyTrie.from_settings(settings, self.KEY_NAME)
+
+    def is_key_path(self, setting):
+        """
+        Check if setting key is a slash separated path, so it is indexed in
+        key path tries
+        """
+        key = self.get_key(setting)
+        return isinstance(key, str) and key.startswith('/')
 
-class LibreOfficeMerger(BaseMerger):
+    def diff(self, old, new, prefix=None):
+        """
+        Compare two merged settings, only for keys under given path, or for
+        all keys if no path is given.
+        Returns a tuple with added, changed and removed keys
+        """
+        if prefix is not None:
+            return self.get_trie(new).diff(self.get_trie(old), prefix)
+        added, changed, removed = self.get_trie(new).diff(self.get_trie(old))
+        # Keys without a leading slash are not in tries
+        other_added, other_changed, other_removed = super(
+            GSettingsMerger, self).diff(
+            [setting for setting in old if not self.is_key_path(setting)],
+            [setting for setting in new if not self.is_key_path(setting)])
+        return (
+            added | other_added,
+            changed | other_changed,
+            removed | other_removed)
+
+
+class LibreOfficeMerger(GSettingsMerger):
     """
     LibreOffice setting merger class
 
@@ -76,40 +254,60 @@ class ChromiumMerger(BaseMerger):
     Policy: Overwrite same key with new value, create new keys
     Except: ManagedBookmarks key: Merge contents
     """
-    def merge(self, *args):
+
+    STRATEGIES = {
+        'ManagedBookmarks': 'bookmarks',
+    }
+
+    def merge_value_bookmarks(self, a, b):
         """
-        Merge settings in the given order
+        Merge managed bookmarks b into managed bookmarks a
         """
-        index = {}
-        bookmarks = []
-        for settings in args:
-            for setting in settings:
-                key = self.get_key(setting)
-                if key == 'ManagedBookmarks':
-                    bookmarks = self.merge_bookmarks(bookmarks, setting['value'])
-                    setting = {self.KEY_NAME: key, 'value': bookmarks}
-                index[key] = setting
-        return list(index.values())
+        return self.merge_bookmarks(list(a) if a is not None else [], b)
+
+    @staticmethod
+    def get_bookmark_hash_key(bookmark):
+        """
+        Return a hashable representation of a bookmark
+        """
+        try:
+            key = tuple(sorted(bookmark.items()))
+            hash(key)
+            return key
+        except TypeError:
+            return json.dumps(bookmark, sort_keys=True, default=compact.expand)
 
     def merge_bookmarks(self, a, b):
+        """
+        Merge bookmark list b into bookmark list a.
+
+        Folders are merged with the first folder with same name at the same
+        level. Bookmarks are appended if not already present at that level.
+        """
+        folders = {}
+        leaves = set()
+        for position, elem_a in enumerate(a):
+            if 'children' in elem_a:
+                folders.setdefault(elem_a.get('name'), position)
+            else:
+                leaves.add(self.get_bookmark_hash_key(elem_a))
         for elem_b in b:
-            logging.debug('Processing %s' % elem_b)
             if 'children' in elem_b:
-                merged = False
-                for elem_a in a:
-                    if elem_a['name'] == elem_b['name'] and 'children' in elem_a:
-                        logging.debug(
-                            'Processing children of %s' % elem_b['name'])
-                        elem_a['children'] = self.merge_bookmarks(
-                            elem_a['children'], elem_b['children'])
-                        merged = True
-                        break
-                if not merged:
+                position = folders.get(elem_b.get('name'))
+                if position is not None:
+                    # Replace folder instead of modifying source data
+                    folder = dict(a[position])
+                    folder['children'] = self.merge_bookmarks(
+                        list(folder['children']), elem_b['children'])
+                    a[position] = folder
+                else:
+                    folders[elem_b.get('name')] = len(a)
                     a.append(elem_b)
             else:
-                if elem_b not in a:
+                hash_key = self.get_bookmark_hash_key(elem_b)
+                if hash_key not in leaves:
+                    leaves.add(hash_key)
                     a.append(elem_b)
-        logging.debug('Returning %s' % a)
         return a
 
 
@@ -122,6 +320,23 @@ class FirefoxMerger(BaseMerger):
     pass
 
 
+class FirefoxBookmarksMerger(BaseMerger):
+    """
+    Firefox bookmarks merger class
+
+    Policy: Overwrite bookmark with same folder and URL, create new bookmarks
+    """
+
+    def get_key(self, setting):
+        """
+        Return setting key
+        """
+        value = setting.get('value')
+        if isinstance(value, Mapping) and 'URL' in value:
+            return (value.get('Folder', ''), value['URL'])
+        return super(FirefoxBookmarksMerger, self).get_key(setting)
+
+
 class NetworkManagerMerger(BaseMerger):
     """
     Network manager setting merger class
@@ -151,3 +366,17 @@ class GOAMerger(BaseMerger):
             for account_id in settings:
                 accounts[account_id] = settings[account_id]
         return accounts
+
+    def get_index(self, settings):
+        """
+        Return settings indexed by account id
+        """
+        return settings
+
+    def exclude_keys(self, settings, keys):
+        """
+        Return settings without the accounts for given account ids
+        """
+        return dict(
+            (account_id, account) for account_id, account in settings.items()
+            if account_id not in keys)
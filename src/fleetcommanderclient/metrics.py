@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+class CompileMetrics(object):
+    """
+    Settings compilation metrics
+
+    Accumulates bytes decoded, parse time and merge time for each profile
+    source, and merge time and number of merges for each namespace. Times
+    are given in seconds.
+
+    Subclasses can override the record methods to forward measures
+    elsewhere as they happen.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all recorded measures
+        """
+        self.sources = {}
+        self.namespaces = {}
+
+    def _get_source(self, source):
+        data = self.sources.get(source)
+        if data is None:
+            data = self.sources[source] = {
+                'bytes': 0,
+                'parse_time': 0.0,
+                'merge_time': 0.0,
+            }
+        return data
+
+    def record_parse(self, source, size, elapsed):
+        """
+        Record decoding of given number of bytes from a profile source
+        """
+        data = self._get_source(source)
+        data['bytes'] += size
+        data['parse_time'] += elapsed
+
+    def record_merge(self, source, elapsed):
+        """
+        Record merging of the settings from a profile source
+        """
+        self._get_source(source)['merge_time'] += elapsed
+
+    def record_namespace_merge(self, namespace, elapsed):
+        """
+        Record a merge of settings into a namespace
+        """
+        data = self.namespaces.get(namespace)
+        if data is None:
+            data = self.namespaces[namespace] = {
+                'merges': 0,
+                'merge_time': 0.0,
+            }
+        data['merges'] += 1
+        data['merge_time'] += elapsed
+
+    def get_totals(self):
+        """
+        Return totals of recorded measures for all sources
+        """
+        return {
+            'sources': len(self.sources),
+            'bytes': sum(
+                data['bytes'] for data in self.sources.values()),
+            'parse_time': sum(
+                data['parse_time'] for data in self.sources.values()),
+            'merge_time': sum(
+                data['merge_time'] for data in self.sources.values()),
+        }
+
+    def to_dict(self):
+        """
+        Return recorded measures as a JSON serializable dictionary
+        """
+        return {
+            'totals': self.get_totals(),
+            'sources': dict(
+                (str(source), dict(data))
+                for source, data in self.sources.items()),
+            'namespaces': dict(
+                (namespace, dict(data))
+                for namespace, data in self.namespaces.items()),
+        }
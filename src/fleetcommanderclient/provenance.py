@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+import sys
+import json
+
+
+class ProvenanceIndex(object):
+    """
+    Settings provenance index
+
+    Records, for each namespace and setting key, the sources that provided
+    it in merge order. The last one is the source that won.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.source_ids = {}
+        self.index = {}
+
+    def get_source_id(self, source):
+        """
+        Return numeric id for given source name
+        """
+        source_id = self.source_ids.get(source)
+        if source_id is None:
+            source_id = len(self.sources)
+            self.sources.append(source)
+            self.source_ids[source] = source_id
+        return source_id
+
+    def record(self, namespace, keys, source):
+        """
+        Record given source as provider for given keys of a namespace
+        """
+        source_id = self.get_source_id(source)
+        namespace_index = self.index.setdefault(namespace, {})
+        for key in keys:
+            providers = namespace_index.setdefault(key, [])
+            if not providers or providers[-1] != source_id:
+                providers.append(source_id)
+
+    def explain(self, namespace, key=None):
+        """
+        Return winning and overridden sources for a setting key, or for all
+        keys of a namespace if no key is given
+        """
+        namespace_index = self.index.get(namespace, {})
+        if key is None:
+            return dict(
+                (key, self._explain_providers(providers))
+                for key, providers in namespace_index.items())
+        providers = namespace_index.get(key)
+        if providers is None:
+            return None
+        return self._explain_providers(providers)
+
+    def _explain_providers(self, providers):
+        return {
+            'source': self.sources[providers[-1]],
+            'overridden': [self.sources[i] for i in providers[:-1]],
+        }
+
+    @staticmethod
+    def _load_key(key):
+        # JSON has no tuples, but tuple keys are needed for hashing
+        if isinstance(key, list):
+            return tuple(key)
+        return key
+
+    def to_dict(self):
+        """
+        Return index data as a JSON serializable dictionary
+        """
+        return {
+            'sources': self.sources,
+            'index': dict(
+                (namespace, [
+                    [key, providers]
+                    for key, providers in namespace_index.items()])
+                for namespace, namespace_index in self.index.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create index from data generated by to_dict method
+        """
+        provenance = cls()
+        for source in data['sources']:
+            provenance.get_source_id(source)
+        for namespace, items in data['index'].items():
+            provenance.index[namespace] = dict(
+                (cls._load_key(key), providers) for key, providers in items)
+        return provenance
+
+
+def main(args=sys.argv[1:]):
+    """
+    Explain settings provenance from a compile cache directory
+
+    Usage: provenance.py CACHE_PATH NAMESPACE [KEY]
+    """
+    from fleetcommanderclient.compilecache import CompileCache
+    if len(args) not in (2, 3):
+        sys.stderr.write(
+            'Usage: provenance.py CACHE_PATH NAMESPACE [KEY]\n')
+        return 2
+    provenance = CompileCache(args[0]).load_provenance()
+    if provenance is None:
+        sys.stderr.write('No provenance data at {}\n'.format(args[0]))
+        return 1
+    if len(args) == 3:
+        result = provenance.explain(args[1], args[2])
+    else:
+        result = dict(
+            (key if isinstance(key, str) else json.dumps(key), value)
+            for key, value in provenance.explain(args[1]).items())
+    sys.stdout.write(json.dumps(result, indent=4, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,10 +20,58 @@
 #          Oliver Gutiérrez <ogutierrez@redhat.com>
 
 import os
+import re
+import heapq
+import operator
 import logging
 import json
+import mmap
+import time
+import hashlib
+import collections
+import multiprocessing
+from concurrent import futures
 
 from fleetcommanderclient import mergers
+from fleetcommanderclient import validators
+from fleetcommanderclient import jsonscanner
+from fleetcommanderclient import compact
+from fleetcommanderclient.compilecache import CompileCache, LayerCache
+from fleetcommanderclient.provenance import ProvenanceIndex
+from fleetcommanderclient.metrics import CompileMetrics
+
+# Five numeric priority fields at the beginning of profile file names
+PRECEDENCE_RE = re.compile(
+    r'^(\d+)[-_](\d+)[-_](\d+)[-_](\d+)[-_](\d+)[-_](.*)$')
+
+# Order of user, group, host and hostgroup priorities in profile file names
+# for each global policy
+FC_GLOBAL_POLICY_MAPPINGS = [
+    'ughx',
+    'ugxh',
+    'uhgx',
+    'uhxg',
+    'uxgh',
+    'uxhg',
+    'guhx',
+    'guxh',
+    'ghux',
+    'ghxu',
+    'gxuh',
+    'gxhu',
+    'hugx',
+    'huxg',
+    'hgux',
+    'hgxu',
+    'hxug',
+    'hxgu',
+    'xugh',
+    'xuhg',
+    'xguh',
+    'xghu',
+    'xhug',
+    'xhgu',
+]
 
 
 class SettingsCompiler(object):
@@ -33,37 +81,184 @@ class SettingsCompiler(object):
     Generates final profile settings merging data from files in a given path
     """
 
-    def __init__(self, path):
+    # Number of merged profile files between incremental compilation
+    # checkpoints
+    CHECKPOINT_INTERVAL = 16
+
+    # Maximum number of base layers kept in the shared layers cache
+    BASE_CACHE_SIZE = 64
+
+    def __init__(self, path, cache_path=None, use_compact=False,
+                 provenance=False, base_cache_path=None, user_field=None,
+                 max_profile_size=None, metrics=None,
+                 checkpoint_interval=CHECKPOINT_INTERVAL,
+                 base_cache_size=BASE_CACHE_SIZE, workers=1, shadowed=False,
+                 complete_namespaces=None):
         self.path = path
 
+        # Number of processes reading and decoding profile sources ahead of
+        # the one being merged. With a single worker, sources are decoded in
+        # this process
+        self.workers = max(workers or 1, 1)
+
+        # Per source and namespace parse and merge measures, if enabled
+        self.metrics = metrics
+
+        # Profile files bigger than this size in bytes are ignored without
+        # being read. None means no limit
+        self.max_profile_size = max_profile_size
+
+        # Use compact records with interned strings for settings in memory.
+        # Results held together share their interned strings, so twenty
+        # compiled copies of large gsettings profiles take a third of the
+        # memory of plain dictionaries, while decoding is up to three times
+        # slower, as each object is built by a Python hook
+        self.use_compact = use_compact
+        if use_compact:
+            self.decoder = json.JSONDecoder(
+                object_pairs_hook=compact.Record.from_pairs)
+        else:
+            self.decoder = json.JSONDecoder()
+
+        # Namespaces to be compiled. None means all namespaces
+        self.namespaces = None
+
+        # Settings from previous compilation, if known
+        self.previous_settings = None
+
+        # Walk sources from higher precedence down when merging them in a
+        # single pass, so lower precedence sources are not decoded for
+        # namespaces already covered. Not used for incremental compilation
+        # nor when recording provenance
+        self.shadowed = shadowed
+
+        # Namespaces whose settings in a profile are complete, replacing
+        # those of lower precedence profiles instead of being merged with
+        # them, as namespaces without merger already are
+        self.complete_namespaces = frozenset(complete_namespaces or ())
+
+        # Index of the profiles providing each setting, if enabled
+        self.use_provenance = provenance
+        self.provenance = None
+
+        # Compiled settings cache for incremental compilation. Merged
+        # settings are saved every checkpoint_interval files and at the end
+        # of the base layer, so saving them does not grow with the square
+        # of the number of files
+        self.checkpoint_interval = max(checkpoint_interval, 1)
+        if cache_path is not None:
+            self.cache = CompileCache(cache_path, self.decoder)
+        else:
+            self.cache = None
+
+        # Shared base layers cache. Profiles not applied by user, as told by
+        # the given position of the user priority among the applies fields
+        # of file names, are compiled once for all users sharing them
+        self.user_field = user_field
+        if base_cache_path is not None and user_field is not None:
+            self.base_cache = LayerCache(
+                base_cache_path, self.decoder, base_cache_size)
+        else:
+            self.base_cache = None
+
+        # Namespaces also fed by other input namespaces. Inputs are listed
+        # from lower to higher precedence, all of them having higher
+        # precedence than the namespace itself
+        self.aliases = {
+            'org.gnome.gsettings': ['org.libreoffice.registry'],
+        }
+
         # Initialize data mergers
         self.mergers = {
             'org.gnome.gsettings': mergers.GSettingsMerger(),
             'org.libreoffice.registry': mergers.LibreOfficeMerger(),
             'org.gnome.online-accounts': mergers.GOAMerger(),
+            'org.chromium.Policies': mergers.ChromiumMerger(),
+            'org.google.chrome.Policies': mergers.ChromiumMerger(),
             'org.mozilla.firefox': mergers.FirefoxMerger(),
+            'org.mozilla.firefox.Bookmarks': mergers.FirefoxBookmarksMerger(),
             'org.freedesktop.NetworkManager': mergers.NetworkManagerMerger(),
         }
 
+        # Initialize data validators
+        self.validators = {
+            'org.gnome.gsettings': validators.GSettingsValidator(),
+            'org.libreoffice.registry': validators.LibreOfficeValidator(),
+            'org.gnome.online-accounts': validators.GOAValidator(),
+            'org.chromium.Policies': validators.ChromiumValidator(),
+            'org.google.chrome.Policies': validators.ChromiumValidator(),
+            'org.mozilla.firefox': validators.FirefoxValidator(),
+            'org.mozilla.firefox.Bookmarks':
+                validators.FirefoxBookmarksValidator(),
+            'org.freedesktop.NetworkManager':
+                validators.NetworkManagerValidator(),
+        }
+
+        # Number of invalid settings dropped by namespace while merging
+        self.invalid_settings = {}
+
+        # Content digests of compiled settings by namespace
+        self.digests = None
+
+    def get_precedence(self, filename):
+        """
+        Return precedence for given profile file name.
+
+        Profile file names start with five numeric priority fields separated
+        by dashes or underscores, followed by the profile name, which may
+        start with digits too. Fields are compared as numbers, so their width
+        does not affect ordering.
+        """
+        match = PRECEDENCE_RE.match(filename)
+        if match is None:
+            return ((), filename, filename)
+        priorities = tuple(int(field) for field in match.groups()[:5])
+        return (priorities, match.group(6), filename)
+
+    def is_shared_profile(self, filename):
+        """
+        Check if a profile file applies regardless of the user, so it can be
+        part of a base layer shared with other users
+        """
+        if self.user_field is None:
+            return False
+        # First priority field is the profile priority itself
+        field = self.user_field + 1
+        priorities = self.get_precedence(filename)[0]
+        return len(priorities) > field and priorities[field] == 0
+
     def get_ordered_file_names(self):
         """
         Get file name list from path given at class initialization
         """
         filenames = os.listdir(self.path)
-        filenames.sort()
+        filenames.sort(key=self.get_precedence)
         return filenames
 
     def read_profile_settings(self, filename):
         """
-        Read profile settings from given file
+        Read profile settings from given file.
+
+        Files are memory mapped and decoded from the mapped pages, without
+        copying their contents first. Files bigger than the maximum profile
+        size are ignored without being read
         """
         filepath = os.path.join(self.path, filename)
         try:
-            with open(filepath, 'r') as fd:
-                contents = fd.read()
-                data = json.loads(contents)
-                fd.close()
-                return data
+            with open(filepath, 'rb') as fd:
+                size = os.fstat(fd.fileno()).st_size
+                if self.is_oversized(size):
+                    raise ValueError(
+                        'File size of %s bytes exceeds the limit of %s' % (
+                            size, self.max_profile_size))
+                if size == 0:
+                    return self.decode_profile_settings(filename, b'')
+                contents = mmap.mmap(
+                    fd.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    return self.decode_profile_settings(filename, contents)
+                finally:
+                    contents.close()
         except Exception as e:
             logging.error(
                 'ProfileGenerator: Ignoring profile data from %(f)s: %(e)s' % {
@@ -72,43 +267,745 @@ class SettingsCompiler(object):
                 })
         return {}
 
-    def merge_profile_settings(self, old, new):
+    def is_oversized(self, size):
+        """
+        Check if given profile data size exceeds the maximum profile size
+        """
+        return self.max_profile_size is not None \
+            and size > self.max_profile_size
+
+    def get_source_path(self, filename):
+        """
+        Return path of given profile file, or the source name as is for in
+        memory sources
+        """
+        if self.path is None or not isinstance(filename, str):
+            return filename
+        return os.path.join(self.path, filename)
+
+    def decode_profile_settings(self, filename, contents):
+        """
+        Decode profile settings from given file contents, given as bytes or
+        any other buffer like a memory mapped file
+        """
+        if self.metrics is None:
+            return self._decode_profile_settings(filename, contents)
+        start = time.perf_counter()
+        try:
+            return self._decode_profile_settings(filename, contents)
+        finally:
+            self.metrics.record_parse(
+                filename, len(contents), time.perf_counter() - start)
+
+    def _decode_profile_settings(self, filename, contents):
+        try:
+            if self.is_oversized(len(contents)):
+                raise ValueError(
+                    'Data size of %s bytes exceeds the limit of %s' % (
+                        len(contents), self.max_profile_size))
+            if self.namespaces is None:
+                return self.decoder.decode(str(contents, 'utf-8'))
+            return jsonscanner.decode_object_members(
+                str(contents, 'utf-8'), self.namespaces, self.decoder)
+        except Exception as e:
+            logging.error(
+                'ProfileGenerator: Ignoring profile data from %(f)s: %(e)s' % {
+                    'f': self.get_source_path(filename),
+                    'e': e,
+                })
+        return {}
+
+    def iter_profile_settings(self, filenames):
+        """
+        Yield (filename, settings) tuples in the same order as given files
+        """
+        decoded = self.iter_decoded_sources(
+            [(filename, None) for filename in filenames])
+        for filename, settings in zip(filenames, decoded):
+            yield (filename, settings)
+
+    def iter_decoded_sources(self, sources):
+        """
+        Yield settings of given (name, data) sources in the same order.
+        Data is None for profile files, or source data as taken by
+        load_source_settings.
+
+        With a single worker, each source is decoded when the previous one
+        has been consumed. Otherwise encoded sources are read and decoded
+        by spawned worker processes, at most two per worker ahead of the
+        source being consumed, so decoding overlaps merging while results
+        are still merged in order
+        """
+        if self.workers <= 1 or len(sources) <= 1:
+            for name, data in sources:
+                if data is None:
+                    yield self.read_profile_settings(name)
+                else:
+                    yield self.load_source_settings(name, data)
+            return
+
+        options = {
+            'use_compact': self.use_compact,
+            'max_profile_size': self.max_profile_size,
+        }
+        workers = min(self.workers, len(sources))
+        # Forking would copy the GLib state of this process
+        context = multiprocessing.get_context('spawn')
+        with futures.ProcessPoolExecutor(
+                workers, mp_context=context) as executor:
+            pending = collections.deque()
+            position = 0
+            while pending or position < len(sources):
+                while position < len(sources) and \
+                        len(pending) < 2 * workers:
+                    name, data = sources[position]
+                    position += 1
+                    if isinstance(data, str):
+                        data = data.encode('utf-8')
+                    job = None
+                    # Already decoded settings are not sent to workers
+                    if data is None or isinstance(data, bytes):
+                        job = executor.submit(
+                            decode_profile_source, self.path, name, data,
+                            self.namespaces, options)
+                    pending.append((name, data, job))
+                name, data, job = pending.popleft()
+                if job is None:
+                    yield self.load_source_settings(name, data)
+                    continue
+                try:
+                    settings, parse = job.result()
+                except Exception as e:
+                    logging.error(
+                        'ProfileGenerator: Ignoring profile data from '
+                        '%(f)s: %(e)s' % {
+                            'f': self.get_source_path(name),
+                            'e': e,
+                        })
+                    settings, parse = ({}, None)
+                if self.metrics is not None and parse is not None:
+                    self.metrics.record_parse(
+                        name, parse['bytes'], parse['parse_time'])
+                yield settings
+
+    def register_aliases(self, namespace, aliases):
         """
-        Merge two profiles overwriting previous values with new ones
+        Set input namespaces to be merged into given namespace
         """
+        if aliases:
+            self.aliases[namespace] = list(aliases)
+        elif namespace in self.aliases:
+            del self.aliases[namespace]
+
+    def validate_profile_settings(self, new, source=None):
+        """
+        Return profile settings without invalid settings, counting them
+        """
+        result = {}
         for namespace, settings in new.items():
-            # Check for merger
-            if namespace in self.mergers:
-                if namespace not in old.keys():
-                    old[namespace] = new[namespace]
+            validator = self.validators.get(namespace)
+            if validator is not None:
+                settings, invalid = validator.validate(settings)
+                if invalid:
+                    self.invalid_settings[namespace] = \
+                        self.invalid_settings.get(namespace, 0) + invalid
+                    logging.warning(
+                        'ProfileGenerator: Dropped %(n)s invalid settings '
+                        'for %(ns)s from %(s)s' % {
+                            'n': invalid,
+                            'ns': namespace,
+                            's': source,
+                        })
+                if settings is None:
+                    continue
+            result[namespace] = settings
+        return result
+
+    def merge_namespace_settings(self, namespace, old, settings):
+        """
+        Merge settings for a namespace into previous settings
+        """
+        if self.metrics is not None:
+            start = time.perf_counter()
+            result = self._merge_namespace_settings(namespace, old, settings)
+            self.metrics.record_namespace_merge(
+                namespace, time.perf_counter() - start)
+            return result
+        return self._merge_namespace_settings(namespace, old, settings)
+
+    def _merge_namespace_settings(self, namespace, old, settings):
+        if namespace in self.mergers and namespace in old \
+                and not self.is_complete_namespace(namespace):
+            return self.mergers[namespace].merge(old[namespace], settings)
+        return settings
+
+    def is_complete_namespace(self, namespace):
+        """
+        Check if settings for given namespace in a profile replace those of
+        lower precedence profiles. Aliased namespaces and their inputs are
+        always merged, as their keys are shared
+        """
+        if namespace in self.aliases:
+            return False
+        for aliases in self.aliases.values():
+            if namespace in aliases:
+                return False
+        return namespace not in self.mergers \
+            or namespace in self.complete_namespaces
+
+    def is_covered(self, namespace, settings):
+        """
+        Check if settings for a namespace from a source can not be changed
+        by lower precedence sources
+        """
+        if not self.is_complete_namespace(namespace):
+            return False
+        validator = self.validators.get(namespace)
+        return validator is None or validator.validate(settings)[0] is not None
+
+    def merge_sources_shadowed(self, items):
+        """
+        Merge (precedence, data, name) items given in precedence order,
+        decoding them from higher precedence down. Data is None for profile
+        files, or source data as taken by load_source_settings.
+
+        Complete namespaces are covered by the highest precedence source
+        with valid settings for them. Lower precedence sources are decoded
+        without covered namespaces, and are not read at all once all the
+        namespaces being compiled are covered. Gives the same result as
+        merge_sources, though invalid settings are only counted for the
+        namespaces decoded
+        """
+        namespaces = self.namespaces
+        covered = set()
+        decoded = []
+        try:
+            for precedence, data, name in reversed(items):
+                if namespaces is not None:
+                    # Sources are decoded for the namespaces left
+                    self.namespaces = namespaces - covered
+                    if not self.namespaces:
+                        break
+                if data is None:
+                    settings = self.read_profile_settings(name)
                 else:
-                    old[namespace] = self.mergers[namespace].merge(
-                        old[namespace], new[namespace])
-            else:
-                old[namespace] = new[namespace]
+                    settings = self.load_source_settings(name, data)
+                if namespaces is None and covered:
+                    settings = dict(
+                        (namespace, value)
+                        for namespace, value in settings.items()
+                        if namespace not in covered)
+                for namespace, value in settings.items():
+                    if self.is_covered(namespace, value):
+                        covered.add(namespace)
+                decoded.append((precedence, settings, name))
+        finally:
+            self.namespaces = namespaces
+        decoded.reverse()
+        return self.merge_sources(decoded)
+
+    def record_provenance(self, namespace, settings, source):
+        """
+        Record given source as provider of the settings for a namespace
+        """
+        if namespace in self.mergers:
+            keys = self.mergers[namespace].get_index(settings)
+        else:
+            keys = [None]
+        self.provenance.record(namespace, keys, source)
+
+    def merge_profile_settings(self, old, new, source=None):
+        """
+        Merge two profiles overwriting previous values with new ones.
+
+        Invalid settings are dropped. If provenance is enabled, the given
+        source is recorded as provider of the merged settings
+        """
+        if self.metrics is not None:
+            start = time.perf_counter()
+        new = self.validate_profile_settings(new, source)
+        record = self.provenance is not None and source is not None
+        for namespace, settings in new.items():
+            if namespace not in self.aliases:
+                old[namespace] = self.merge_namespace_settings(
+                    namespace, old, settings)
+                if record:
+                    self.record_provenance(namespace, settings, source)
+
+        # Merge aliased namespaces once all their inputs have been merged
+        for namespace, aliases in self.aliases.items():
+            inputs = [namespace] + aliases
+            for position, input_namespace in enumerate(inputs):
+                if input_namespace not in new:
+                    continue
+                settings = new[input_namespace]
+                # Skip keys already set by higher precedence inputs
+                if namespace in self.mergers:
+                    merger = self.mergers[namespace]
+                    hidden = set()
+                    for higher in inputs[position + 1:]:
+                        if higher in old:
+                            hidden.update(merger.get_index(old[higher]))
+                    if hidden:
+                        settings = merger.exclude_keys(settings, hidden)
+                old[namespace] = self.merge_namespace_settings(
+                    namespace, old, settings)
+                if record:
+                    self.record_provenance(namespace, settings, source)
+        if self.metrics is not None:
+            self.metrics.record_merge(source, time.perf_counter() - start)
         return old
 
-    def compile_settings(self):
+    def merge_sources(self, *sources):
         """
-        Generate final settings
+        Merge settings from several sources.
+
+        Each source is an iterable of (precedence, settings) tuples already
+        sorted by precedence, optionally followed by a source name used for
+        provenance. Sources are consumed lazily using a k-way merge, sources
+        given first winning ties.
         """
+        profile_settings = {}
+        for item in heapq.merge(*sources, key=operator.itemgetter(0)):
+            source = item[2] if len(item) > 2 else item[0]
+            profile_settings = self.merge_profile_settings(
+                profile_settings, item[1], source)
+        return profile_settings
+
+    def compile_settings(self, namespaces=None):
+        """
+        Generate final settings.
+
+        If namespaces are given, any other namespace is skipped without
+        being decoded or merged
+        """
+        self.reset_compile_state(namespaces)
         filenames = self.get_ordered_file_names()
+        if self.cache is not None:
+            profile_settings = self.compile_settings_incremental(filenames)
+        elif self.base_cache is not None:
+            profile_settings = self.compile_settings_layered(filenames)
+        elif self.shadowed and self.provenance is None:
+            profile_settings = self.merge_sources_shadowed([
+                (self.get_precedence(filename), None, filename)
+                for filename in filenames])
+        else:
+            profile_settings = self.merge_sources(
+                (self.get_precedence(filename), data, filename)
+                for filename, data in self.iter_profile_settings(filenames))
+
+        if self.digests is None:
+            self.digests = self.get_settings_digests(profile_settings)
+        return profile_settings
+
+    def reset_compile_state(self, namespaces=None):
+        """
+        Prepare compiler state for a new compilation of given namespaces
+        """
+        if namespaces is not None:
+            namespaces = set(namespaces)
+            for namespace, aliases in self.aliases.items():
+                if namespace in namespaces:
+                    namespaces.update(aliases)
+        self.namespaces = namespaces
+        self.invalid_settings = {}
+        self.digests = None
+        if self.use_provenance:
+            self.provenance = ProvenanceIndex()
+        if self.metrics is not None:
+            self.metrics.reset()
+
+    def load_source_settings(self, name, data):
+        """
+        Return profile settings from source data, decoding it if given as
+        bytes or string and skipping namespaces not being compiled
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(data, bytes):
+            return self.decode_profile_settings(name, data)
+        if self.namespaces is None:
+            return data
+        return dict(
+            (namespace, settings) for namespace, settings in data.items()
+            if namespace in self.namespaces)
+
+    def compile_sources(self, sources, namespaces=None):
+        """
+        Generate final settings from in memory sources, without reading any
+        profile file.
+
+        Sources are (precedence, data) tuples, optionally followed by a source
+        name used for logging and provenance. Data is the encoded JSON
+        profile settings or the already decoded settings dictionary.
+        Precedence is either a profile file name or a value comparable with
+        the precedence of other sources.
+
+        If a cache path was given and all sources are encoded data, the
+        cached result is returned when no source changed since the last
+        compilation
+        """
+        self.reset_compile_state(namespaces)
+        items = []
+        for item in sources:
+            precedence = item[0]
+            name = item[2] if len(item) > 2 else precedence
+            if isinstance(precedence, str):
+                precedence = self.get_precedence(precedence)
+            items.append((precedence, item[1], name))
+        items.sort(key=operator.itemgetter(0))
+
+        entries = None
+        if self.cache is not None:
+            entries = self.get_source_entries(items)
+        if entries is not None:
+            options = self.get_compile_options()
+            profile_settings = self.load_cached_sources(entries, options)
+            if profile_settings is not None:
+                return profile_settings
+
+        if self.shadowed and self.provenance is None:
+            profile_settings = self.merge_sources_shadowed(items)
+        else:
+            decoded = self.iter_decoded_sources(
+                [(name, data) for precedence, data, name in items])
+            profile_settings = self.merge_sources(
+                (precedence, settings, name)
+                for (precedence, data, name), settings in zip(
+                    items, decoded))
+        self.digests = self.get_settings_digests(profile_settings)
+
+        if entries is not None:
+            try:
+                # Checkpoints of profile file compilations do not apply
+                self.cache.save_manifest(entries, False, options)
+                self.cache.remove_checkpoints(0)
+                self.cache.save_compiled(
+                    entries, profile_settings, options, self.provenance,
+                    self.digests)
+            except Exception as e:
+                logging.warning(
+                    'ProfileGenerator: Can not save compiled settings: %s' % e)
+        return profile_settings
+
+    @staticmethod
+    def get_source_entries(items):
+        """
+        Return manifest entries for given (precedence, data, name) source
+        items, or None if any of them is not encoded data
+        """
+        entries = []
+        for precedence, data, name in items:
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            if not isinstance(data, bytes):
+                return None
+            entries.append({
+                'name': name,
+                'digest': CompileCache.get_digest(data),
+            })
+        return entries
+
+    def load_cached_sources(self, entries, options):
+        """
+        Return cached settings compiled from sources with given manifest
+        entries, or None if they are not cached
+        """
+        old_entries, compiled = self.cache.load_manifest(options)
+        if not compiled or old_entries != entries:
+            return None
+        try:
+            profile_settings = self.cache.load_compiled()
+        except Exception as e:
+            logging.warning(
+                'ProfileGenerator: Can not load cached settings: %s' % e)
+            return None
+        digests = self.cache.load_digests()
+        if digests is None:
+            return None
+        if self.use_provenance:
+            self.provenance = self.cache.load_provenance()
+            if self.provenance is None:
+                self.provenance = ProvenanceIndex()
+                return None
+        logging.debug('ProfileGenerator: Using cached compiled settings')
+        self.previous_settings = profile_settings
+        self.digests = digests
+        return profile_settings
+
+    @staticmethod
+    def get_namespace_digest(settings):
+        """
+        Return content digest for the settings of a namespace.
+
+        Settings are serialized with sorted keys and no whitespace, so equal
+        settings give the same digest whatever their order of keys or their
+        in memory representation
+        """
+        data = json.dumps(
+            settings, sort_keys=True, separators=(',', ':'),
+            ensure_ascii=False, default=compact.expand)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get_settings_digests(self, settings):
+        """
+        Return a dictionary with content digests of compiled settings for
+        each namespace
+        """
+        return dict(
+            (namespace, self.get_namespace_digest(namespace_settings))
+            for namespace, namespace_settings in settings.items())
+
+    def get_compile_options(self):
+        """
+        Return options affecting compilation results
+        """
+        if self.namespaces is not None:
+            namespaces = sorted(self.namespaces)
+        else:
+            namespaces = None
+        return {
+            'namespaces': namespaces,
+            'aliases': self.aliases,
+            'provenance': self.use_provenance,
+            'complete_namespaces': sorted(self.complete_namespaces),
+        }
+
+    def compile_settings_incremental(self, filenames):
+        """
+        Generate final settings reusing cached results.
+
+        When no input file changed since the last compilation the cached
+        result is returned. Otherwise, merging is resumed from the last
+        checkpoint previous to the first changed file.
+        """
+        options = self.get_compile_options()
+        old_entries, compiled = self.cache.load_manifest(options)
+        entries = self.cache.build_manifest(
+            self.path, filenames, old_entries, self.max_profile_size)
+        position = self.cache.get_first_changed(old_entries, entries)
+
+        if compiled:
+            try:
+                self.previous_settings = self.cache.load_compiled()
+            except Exception as e:
+                logging.warning(
+                    'ProfileGenerator: Can not load cached settings: %s' % e)
+
+        if self.previous_settings is not None \
+                and position == len(entries) == len(old_entries):
+            if self.use_provenance:
+                self.provenance = self.cache.load_provenance()
+            if self.provenance is not None or not self.use_provenance:
+                logging.debug(
+                    'ProfileGenerator: Using cached compiled settings')
+                self.digests = self.cache.load_digests()
+                return self.previous_settings
+            position = 0
+
         profile_settings = {}
-        for filename in filenames:
-            data = self.read_profile_settings(filename)
+        base_size = self.get_base_layer_size(entries)
+        layer = None
+        if position < base_size:
+            layer = self.load_base_layer(entries[:base_size])
+        if layer is not None:
+            profile_settings, position = layer
+        elif position > 0:
+            checkpoint = self.cache.get_last_checkpoint(position)
+            position = 0
+            if checkpoint is not None:
+                try:
+                    profile_settings, provenance = \
+                        self.cache.load_checkpoint(checkpoint)
+                    if self.use_provenance:
+                        if provenance is None:
+                            raise ValueError('Missing provenance data')
+                        self.provenance = provenance
+                    position = checkpoint + 1
+                except Exception as e:
+                    logging.warning(
+                        'ProfileGenerator: Can not load cache checkpoint: '
+                        '%s' % e)
+                    profile_settings = {}
+                    if self.use_provenance:
+                        self.provenance = ProvenanceIndex()
+        logging.debug(
+            'ProfileGenerator: Merging from position %s of %s' % (
+                position, len(entries)))
+
+        # Invalidate cached data after the resume position before
+        # overwriting any checkpoint
+        self.cache.save_manifest(entries[:position], False, options)
+        self.cache.remove_checkpoints(position)
+        if layer is not None:
+            self.cache.save_checkpoint(
+                position - 1, profile_settings, self.provenance)
+
+        pending = self.iter_profile_settings(filenames[position:])
+        for index, (filename, data) in enumerate(pending, position):
             profile_settings = self.merge_profile_settings(
-                profile_settings, data)
+                profile_settings, data, filename)
+            if (index + 1) % self.checkpoint_interval == 0 \
+                    or index + 1 == base_size:
+                self.cache.save_checkpoint(
+                    index, profile_settings, self.provenance)
+            if index + 1 == base_size:
+                self.save_base_layer(entries[:base_size], profile_settings)
 
-        # FIXME: Right now merging libreoffice config data into gsettings
-        #        because both use the same configuration adapter.
-        #        We should change the config adapter interface to allow
-        #        multiple namespaces for the same config adapter.
+        self.digests = self.get_settings_digests(profile_settings)
+        self.cache.save_compiled(
+            entries, profile_settings, options, self.provenance, self.digests)
+        return profile_settings
 
-        if 'org.libreoffice.registry' in profile_settings.keys():
-            libreoffice_data = {
-                'org.gnome.gsettings':
-                    profile_settings['org.libreoffice.registry']
-            }
+    def explain(self, namespace, key=None):
+        """
+        Return the profile that provided a setting and the ones it
+        overrode, or that data for all settings of a namespace if no key
+        is given. Provenance must be enabled
+        """
+        if self.provenance is None and self.cache is not None:
+            self.provenance = self.cache.load_provenance()
+        if self.provenance is None:
+            return None
+        return self.provenance.explain(namespace, key)
+
+    def get_base_layer_size(self, entries):
+        """
+        Return number of leading manifest entries forming the base layer.
+
+        The base layer ends at the first profile applied by user, so merge
+        order is kept and the per user overlay gives the same result as
+        merging all profiles. Only the whole base layer is saved, so users
+        share it when their per user profiles start at the same precedence.
+        """
+        size = 0
+        if self.base_cache is not None:
+            for entry in entries:
+                if entry['digest'] is None \
+                        or not self.is_shared_profile(entry['name']):
+                    break
+                size += 1
+        return size
+
+    def load_base_layer(self, entries):
+        """
+        Return a (settings, size) tuple for the base layer of given entries
+        if any user cached it, or None if there is none
+        """
+        layer = self.base_cache.load_layer(
+            entries, self.get_compile_options())
+        if layer is None:
+            return None
+        settings, provenance = layer
+        if self.use_provenance:
+            if provenance is None:
+                return None
+            self.provenance = provenance
+        logging.debug(
+            'ProfileGenerator: Using base layer of %s profiles' % len(entries))
+        return (settings, len(entries))
+
+    def save_base_layer(self, entries, settings):
+        """
+        Save merged settings for a base layer
+        """
+        try:
+            self.base_cache.save_layer(
+                entries, settings, self.get_compile_options(),
+                self.provenance)
+        except Exception as e:
+            logging.warning(
+                'ProfileGenerator: Can not save base layer: %s' % e)
+
+    def compile_settings_layered(self, filenames):
+        """
+        Generate final settings reusing a base layer shared with other users.
+
+        Only profiles not applied by user are merged when the base layer is
+        not cached yet, and only per user profiles are merged on top of it
+        otherwise.
+        """
+        base_size = 0
+        for filename in filenames:
+            if not self.is_shared_profile(filename):
+                break
+            base_size += 1
+        entries = CompileCache.build_manifest(
+            self.path, filenames[:base_size], [], self.max_profile_size)
+        base_size = self.get_base_layer_size(entries)
+
+        profile_settings = {}
+        position = 0
+        if base_size > 0:
+            layer = self.load_base_layer(entries[:base_size])
+            if layer is not None:
+                profile_settings, position = layer
+
+        pending = self.iter_profile_settings(filenames[position:])
+        for index, (filename, data) in enumerate(pending, position):
             profile_settings = self.merge_profile_settings(
-                profile_settings, libreoffice_data)
+                profile_settings, data, filename)
+            if index + 1 == base_size:
+                self.save_base_layer(entries[:base_size], profile_settings)
         return profile_settings
+
+    def expand_settings(self, settings):
+        """
+        Return settings as plain dictionaries and lists to be used by
+        configuration adapters
+        """
+        if self.use_compact:
+            return compact.expand(settings)
+        return settings
+
+    def get_settings_delta(self, old, new):
+        """
+        Compare two compiled settings.
+
+        Returns a dictionary with an entry for each namespace with changes.
+        Each entry is a dictionary with added, changed and removed sets of
+        keys, using the same keys as the namespace merger. Namespaces without
+        merger are compared as a whole, using None as key.
+        """
+        delta = {}
+        for namespace in set(old.keys()) | set(new.keys()):
+            old_settings = old.get(namespace)
+            new_settings = new.get(namespace)
+            if old_settings == new_settings:
+                continue
+            if namespace in self.mergers:
+                merger = self.mergers[namespace]
+                if old_settings is None:
+                    old_settings = [] if isinstance(new_settings, list) else {}
+                if new_settings is None:
+                    new_settings = [] if isinstance(old_settings, list) else {}
+                added, changed, removed = merger.diff(
+                    old_settings, new_settings)
+            elif old_settings is None:
+                added, changed, removed = (set([None]), set(), set())
+            elif new_settings is None:
+                added, changed, removed = (set(), set(), set([None]))
+            else:
+                added, changed, removed = (set(), set([None]), set())
+            delta[namespace] = {
+                'added': added,
+                'changed': changed,
+                'removed': removed,
+            }
+        return delta
+
+
+def decode_profile_source(path, name, data, namespaces, options):
+    """
+    Decode settings of a profile source in a worker process. Data is None
+    for profile files under given path. Returns settings along with their
+    parse measures, so they can be recorded by the compiling process
+    """
+    metrics = CompileMetrics()
+    sc = SettingsCompiler(path, metrics=metrics, **options)
+    sc.namespaces = namespaces
+    if data is None:
+        settings = sc.read_profile_settings(name)
+    else:
+        settings = sc.decode_profile_settings(name, data)
+    return (settings, metrics.sources.get(name))
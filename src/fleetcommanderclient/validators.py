@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class BaseValidator(object):
+    """
+    Base validator class
+
+    Policy: Settings are a list of mappings having all the required fields.
+    Fields are mapped to their allowed value types, or None for any type.
+    """
+
+    FIELDS = {
+        'key': None,
+        'value': None,
+    }
+
+    def __init__(self):
+        # Compile field schema into (field, types) checks
+        self.checks = tuple(
+            (field, frozenset(types) if types is not None else None)
+            for field, types in sorted(self.FIELDS.items()))
+
+    def is_valid(self, setting):
+        """
+        Check a single setting
+        """
+        if not isinstance(setting, Mapping):
+            return False
+        for field, types in self.checks:
+            if field not in setting:
+                return False
+            if types is not None and type(setting[field]) not in types:
+                return False
+        return True
+
+    def validate(self, settings):
+        """
+        Return a (settings, invalid) tuple with the valid settings, or None
+        if the whole namespace data is invalid, and the number of dropped
+        settings. Given settings are returned as is when all are valid
+        """
+        if not isinstance(settings, list):
+            return (None, 1)
+        is_valid = self.is_valid
+        for position, setting in enumerate(settings):
+            if not is_valid(setting):
+                break
+        else:
+            return (settings, 0)
+        valid = settings[:position]
+        valid.extend(
+            setting for setting in settings[position + 1:]
+            if is_valid(setting))
+        return (valid, len(settings) - len(valid))
+
+
+class GSettingsValidator(BaseValidator):
+    """
+    GSettings validator class
+
+    Policy: Settings need key and value in GVariant text format
+    """
+
+    FIELDS = {
+        'key': (str, ),
+        'value': (str, ),
+    }
+
+
+class LibreOfficeValidator(GSettingsValidator):
+    """
+    LibreOffice validator class
+
+    Policy: Settings need key and value in GVariant text format
+    """
+    pass
+
+
+class ChromiumValidator(BaseValidator):
+    """
+    Chromium validator class
+
+    Policy: Settings need policy key and value of any type
+    """
+
+    FIELDS = {
+        'key': (str, ),
+        'value': None,
+    }
+
+
+class FirefoxValidator(ChromiumValidator):
+    """
+    Firefox validator class
+
+    Policy: Settings need preference key and value of any type
+    """
+    pass
+
+
+class FirefoxBookmarksValidator(BaseValidator):
+    """
+    Firefox bookmarks validator class
+
+    Policy: Settings need key and value of any type
+    """
+    pass
+
+
+class NetworkManagerValidator(BaseValidator):
+    """
+    Network manager validator class
+
+    Policy: Settings need connection uuid and data in GVariant text format
+    """
+
+    FIELDS = {
+        'uuid': (str, ),
+        'data': (str, ),
+    }
+
+
+class GOAValidator(BaseValidator):
+    """
+    GOA validator class
+
+    Policy: Settings are a mapping of account ids to mappings of account
+    fields to boolean or string values
+    """
+
+    VALUE_TYPES = (bool, str)
+
+    def __init__(self):
+        self.value_types = frozenset(self.VALUE_TYPES)
+
+    def is_valid(self, setting):
+        """
+        Check a single account
+        """
+        if not isinstance(setting, Mapping):
+            return False
+        value_types = self.value_types
+        for field in setting:
+            if type(field) is not str \
+                    or type(setting[field]) not in value_types:
+                return False
+        return True
+
+    def validate(self, settings):
+        """
+        Return a (settings, invalid) tuple with the valid accounts, or None
+        if the whole namespace data is invalid, and the number of dropped
+        accounts. Given settings are returned as is when all are valid
+        """
+        if not isinstance(settings, Mapping):
+            return (None, 1)
+        invalid = [
+            account_id for account_id in settings
+            if not self.is_valid(settings[account_id])]
+        if not invalid:
+            return (settings, 0)
+        invalid = set(invalid)
+        return (
+            dict(
+                (account_id, account)
+                for account_id, account in settings.items()
+                if account_id not in invalid),
+            len(invalid))
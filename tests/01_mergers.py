@@ -30,6 +30,7 @@ sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
 
 # Fleet commander imports
 from fleetcommanderclient import mergers
+from fleetcommanderclient import compact
 
 
 class TestBaseMerger(unittest.TestCase):
@@ -108,6 +109,99 @@ class TestBaseMerger(unittest.TestCase):
             key=lambda item: item[self.KEY_NAME])
         self.assertEqual(result, expected)
 
+    def test_02_diff(self):
+        added, changed, removed = self.merger.diff(
+            self.TEST_SETTINGS_A, self.TEST_SETTINGS_B)
+        get_key = self.merger.get_key
+        self.assertEqual(added, set([get_key(self.TEST_SETTINGS_B[1])]))
+        self.assertEqual(changed, set([get_key(self.TEST_SETTINGS_B[0])]))
+        self.assertEqual(removed, set([get_key(self.TEST_SETTINGS_A[1])]))
+        # Same settings
+        result = self.merger.diff(self.TEST_SETTINGS_A, self.TEST_SETTINGS_A)
+        self.assertEqual(result, (set(), set(), set()))
+
+
+class TestMergeStrategies(unittest.TestCase):
+
+    TEST_SETTINGS_A = [
+        {'key': 'replace', 'value': {'a': 1}},
+        {'key': 'deep', 'value': {'a': {'b': 1, 'c': 1}, 'd': 1}},
+        {'key': 'union', 'value': ['a', 'b', {'c': 1}]},
+        {'key': 'union-by-field', 'value': [
+            {'name': 'a', 'value': 1}, {'name': 'b', 'value': 1}]},
+        {'key': 'append', 'value': ['a', 'b']},
+    ]
+
+    TEST_SETTINGS_B = [
+        {'key': 'replace', 'value': {'b': 2}},
+        {'key': 'deep', 'value': {'a': {'b': 2}, 'e': 2}},
+        {'key': 'union', 'value': [{'c': 1}, 'c', 'a']},
+        {'key': 'union-by-field', 'value': [
+            {'name': 'c', 'value': 2}, {'name': 'a', 'value': 2}]},
+        {'key': 'append', 'value': ['b', 'c']},
+    ]
+
+    TEST_SETTINGS_MERGED = [
+        {'key': 'replace', 'value': {'b': 2}},
+        {'key': 'deep', 'value': {'a': {'b': 2, 'c': 1}, 'd': 1, 'e': 2}},
+        {'key': 'union', 'value': ['a', 'b', {'c': 1}, 'c']},
+        {'key': 'union-by-field', 'value': [
+            {'name': 'a', 'value': 2}, {'name': 'b', 'value': 1},
+            {'name': 'c', 'value': 2}]},
+        {'key': 'append', 'value': ['a', 'b', 'b', 'c']},
+    ]
+
+    STRATEGIES = {
+        'replace': 'replace',
+        'deep': 'deep-merge',
+        'union': 'union',
+        'union-by-field': ('union', 'name'),
+        'append': 'append',
+    }
+
+    def setUp(self):
+        self.merger = mergers.BaseMerger(self.STRATEGIES)
+
+    def test_00_handlers(self):
+        self.assertEqual(
+            sorted(self.merger.handlers.keys()),
+            ['append', 'deep', 'union', 'union-by-field'])
+
+    def test_01_merge(self):
+        result = self.merger.merge(self.TEST_SETTINGS_A, self.TEST_SETTINGS_B)
+        self.assertEqual(result, self.TEST_SETTINGS_MERGED)
+        # Source settings are not modified
+        self.assertEqual(
+            self.TEST_SETTINGS_A[2]['value'], ['a', 'b', {'c': 1}])
+
+    def test_02_chromium_url_allowlist(self):
+        merger = mergers.ChromiumMerger({'URLAllowlist': 'union'})
+        result = merger.merge(
+            [{'key': 'URLAllowlist', 'value': ['example.com']}],
+            [{'key': 'URLAllowlist', 'value': ['example.org', 'example.com']}])
+        self.assertEqual(
+            result,
+            [{'key': 'URLAllowlist', 'value': ['example.com', 'example.org']}])
+        self.assertIn('ManagedBookmarks', merger.handlers)
+
+    def test_03_merge_compact(self):
+        def decode(settings):
+            return json.loads(
+                json.dumps(settings),
+                object_pairs_hook=compact.Record.from_pairs)
+
+        result = self.merger.merge(
+            decode(self.TEST_SETTINGS_A), decode(self.TEST_SETTINGS_B))
+        self.assertEqual(compact.expand(result), self.TEST_SETTINGS_MERGED)
+        # Bookmarks with compact children are compared by their contents
+        merger = mergers.ChromiumMerger()
+        bookmark = {'name': 'Folder', 'children': [
+            {'name': 'Example', 'url': 'https://example.com'}]}
+        result = merger.merge_bookmarks(
+            decode([bookmark]), decode([bookmark, {'name': 'Other'}]))
+        self.assertEqual(
+            compact.expand(result), [bookmark, {'name': 'Other'}])
+
 
 class TestNetworkManagerMerger(TestBaseMerger):
 
@@ -245,6 +339,111 @@ class TestGOAMerger(unittest.TestCase):
         result = self.merger.merge(self.TEST_SETTINGS_A, self.TEST_SETTINGS_B)
         self.assertEqual(result, self.TEST_SETTINGS_MERGED)
 
+    def test_02_diff(self):
+        added, changed, removed = self.merger.diff(
+            self.TEST_SETTINGS_A, self.TEST_SETTINGS_B)
+        self.assertEqual(added, set(['Template account_fc_1490729989_0']))
+        self.assertEqual(changed, set(['Template account_fc_1490729747_0']))
+        self.assertEqual(removed, set(['Template account_fc_1490729845_0']))
+
+
+class TestFirefoxBookmarksMerger(unittest.TestCase):
+
+    maxDiff = None
+
+    merger_class = mergers.FirefoxBookmarksMerger
+
+    TEST_SETTINGS_A = [
+        {
+            'key': 'bookmark1',
+            'value': {
+                'Title': 'Fedora',
+                'URL': 'https://getfedora.org/',
+                'Placement': 'toolbar',
+                'Folder': 'Linux'
+            }
+        },
+        {
+            'key': 'bookmark2',
+            'value': {
+                'Title': 'FreeIPA',
+                'URL': 'http://freeipa.org',
+                'Placement': 'toolbar'
+            }
+        },
+    ]
+
+    TEST_SETTINGS_B = [
+        {
+            'key': 'bookmark3',
+            'value': {
+                'Title': 'Get Fedora',
+                'URL': 'https://getfedora.org/',
+                'Placement': 'toolbar',
+                'Folder': 'Linux'
+            }
+        },
+        {
+            'key': 'bookmark4',
+            'value': {
+                'Title': 'Fedora',
+                'URL': 'https://getfedora.org/',
+                'Placement': 'toolbar'
+            }
+        },
+        {
+            'key': 'bookmark2',
+            'value': {
+                'Title': 'FreeIPA',
+                'URL': 'http://freeipa.org',
+                'Placement': 'toolbar'
+            }
+        },
+    ]
+
+    TEST_SETTINGS_MERGED = [
+        {
+            'key': 'bookmark3',
+            'value': {
+                'Title': 'Get Fedora',
+                'URL': 'https://getfedora.org/',
+                'Placement': 'toolbar',
+                'Folder': 'Linux'
+            }
+        },
+        {
+            'key': 'bookmark2',
+            'value': {
+                'Title': 'FreeIPA',
+                'URL': 'http://freeipa.org',
+                'Placement': 'toolbar'
+            }
+        },
+        {
+            'key': 'bookmark4',
+            'value': {
+                'Title': 'Fedora',
+                'URL': 'https://getfedora.org/',
+                'Placement': 'toolbar'
+            }
+        },
+    ]
+
+    def setUp(self):
+        self.merger = self.merger_class()
+
+    def test_00_get_key(self):
+        result = self.merger.get_key(self.TEST_SETTINGS_A[0])
+        self.assertEqual(result, ('Linux', 'https://getfedora.org/'))
+        result = self.merger.get_key(self.TEST_SETTINGS_A[1])
+        self.assertEqual(result, ('', 'http://freeipa.org'))
+        result = self.merger.get_key({'key': 'nourl', 'value': {}})
+        self.assertEqual(result, 'nourl')
+
+    def test_01_merge(self):
+        result = self.merger.merge(self.TEST_SETTINGS_A, self.TEST_SETTINGS_B)
+        self.assertEqual(result, self.TEST_SETTINGS_MERGED)
+
 
 class TestChromiumMerger(unittest.TestCase):
 
@@ -345,6 +544,42 @@ class TestChromiumMerger(unittest.TestCase):
         self.assertEqual(
             result, expected)
 
+    def test_02_merge_bookmarks(self):
+        a = [
+            {'name': 'Docs', 'url': 'http://docs'},
+            {'name': 'Folder', 'children': [
+                {'name': 'Sub', 'children': [{'name': 'A', 'url': 'a'}]},
+            ]},
+        ]
+        b = [
+            {'name': 'Folder', 'url': 'http://folder'},
+            {'name': 'Docs', 'url': 'http://docs'},
+            {'name': 'New', 'children': [{'name': 'B', 'url': 'b'}]},
+            {'name': 'Folder', 'children': [
+                {'name': 'Sub', 'children': [
+                    {'name': 'A', 'url': 'a'},
+                    {'name': 'C', 'url': 'c'},
+                ]},
+            ]},
+            {'name': 'New', 'children': [{'name': 'D', 'url': 'd'}]},
+            {'name': 'Folder', 'url': 'http://folder'},
+        ]
+        result = self.merger.merge_bookmarks(a, b)
+        self.assertEqual(result, [
+            {'name': 'Docs', 'url': 'http://docs'},
+            {'name': 'Folder', 'children': [
+                {'name': 'Sub', 'children': [
+                    {'name': 'A', 'url': 'a'},
+                    {'name': 'C', 'url': 'c'},
+                ]},
+            ]},
+            {'name': 'Folder', 'url': 'http://folder'},
+            {'name': 'New', 'children': [
+                {'name': 'B', 'url': 'b'},
+                {'name': 'D', 'url': 'd'},
+            ]},
+        ])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -23,14 +23,20 @@
 # Python imports
 import os
 import sys
+import shutil
+import tempfile
 import unittest
 import json
+import mmap
 
 PYTHONPATH = os.path.join(os.environ['TOPSRCDIR'], 'src')
 sys.path.append(PYTHONPATH)
 
 # Fleet commander imports
 from fleetcommanderclient.settingscompiler import SettingsCompiler
+from fleetcommanderclient import compact
+from fleetcommanderclient.metrics import CompileMetrics
+from fleetcommanderclient.compilecache import CompileCache
 
 
 class TestSettingsCompiler(unittest.TestCase):
@@ -187,8 +193,8 @@ class TestSettingsCompiler(unittest.TestCase):
                 "value": "['riot.desktop','matrix.desktop']",
                 "signature": "as"
             },
-            # FIXME: This data is added to merge libreoffice settings with
-            #        gsettings to deploy all together with dconf config adapter
+            # LibreOffice settings are aliased into gsettings to deploy all
+            # together with dconf config adapter
             {
                 "value": "'The Company'",
                 "key": "/org/libreoffice/registry/org.openoffice.UserProfile/Data/o",
@@ -268,6 +274,759 @@ class TestSettingsCompiler(unittest.TestCase):
             json.dumps(sorted(result), sort_keys=True),
             json.dumps(sorted(self.COMPILED_SETTINGS), sort_keys=True))
 
+    def test_05_compile_settings_namespaces(self):
+        namespaces = [
+            'org.gnome.gsettings',
+            'org.freedesktop.NetworkManager',
+        ]
+        compiled = self.sc.compile_settings()
+        result = self.sc.compile_settings(namespaces=namespaces)
+        expected = dict(
+            (namespace, compiled[namespace])
+            for namespace in namespaces + ['org.libreoffice.registry'])
+        self.assertEqual(result, expected)
+
+    def test_06_decode_profile_settings_namespaces(self):
+        contents = json.dumps({
+            'org.freedesktop.FleetCommander': {
+                'skipped': [{'a': '}]\\"['}, [[], {}], 1, None],
+            },
+            'org.gnome.online-accounts': {'Account': {'Enabled': True}},
+            'org.mozilla.firefox': '}',
+        }, indent=2).encode('utf-8')
+        self.sc.namespaces = set(['org.gnome.online-accounts'])
+        result = self.sc.decode_profile_settings('test', contents)
+        self.assertEqual(result, {
+            'org.gnome.online-accounts': {'Account': {'Enabled': True}},
+        })
+        # Invalid data
+        result = self.sc.decode_profile_settings('test', contents[:-1])
+        self.assertEqual(result, {})
+
+    def test_07_get_settings_delta(self):
+        old = self.sc.compile_settings()
+        new = json.loads(json.dumps(old))
+        self.assertEqual(self.sc.get_settings_delta(old, new), {})
+        new['org.gnome.gsettings'][0]['value'] = "'#000000'"
+        del new['org.freedesktop.NetworkManager'][1]
+        new['org.gnome.online-accounts']['New account'] = {}
+        del new['org.libreoffice.registry']
+        new['org.freedesktop.FleetCommander'] = {}
+        result = self.sc.get_settings_delta(old, new)
+        self.assertEqual(result, {
+            'org.gnome.gsettings': {
+                'added': set(),
+                'changed': set([
+                    '/org/yorba/shotwell/preferences/ui/background-color']),
+                'removed': set(),
+            },
+            'org.freedesktop.NetworkManager': {
+                'added': set(),
+                'changed': set(),
+                'removed': set(['0be7d422-1635-11e7-a83f-68f728db19d3']),
+            },
+            'org.gnome.online-accounts': {
+                'added': set(['New account']),
+                'changed': set(),
+                'removed': set(),
+            },
+            'org.libreoffice.registry': {
+                'added': set(),
+                'changed': set(),
+                'removed': set([
+                    '/org/libreoffice/registry/org.openoffice.UserProfile/Data/o',
+                    '/org/libreoffice/registry/org.openoffice.Office.Writer/Layout/Window/HorizontalRuler',
+                ]),
+            },
+            'org.freedesktop.FleetCommander': {
+                'added': set([None]),
+                'changed': set(),
+                'removed': set(),
+            },
+        })
+
+    def test_08_register_aliases(self):
+        result = self.sc.compile_settings()
+        values = dict(
+            (item['key'], item['value'])
+            for item in result['org.gnome.gsettings'])
+        self.assertEqual(
+            values[
+                '/org/libreoffice/registry/org.openoffice.UserProfile/Data/o'],
+            "'The Company'")
+        self.sc.register_aliases('org.gnome.gsettings', [])
+        result = self.sc.compile_settings()
+        keys = [item['key'] for item in result['org.gnome.gsettings']]
+        self.assertEqual(keys, [
+            '/org/yorba/shotwell/preferences/ui/background-color',
+            '/org/gnome/software/popular-overrides',
+        ])
+
+    def test_09_get_precedence(self):
+        filenames = [
+            '00050_00050_00000_00000_00000-Some_Profile',
+            '100000-00000-00000-00000-00000-Top',
+            'NoPriority',
+            '99999-00000-00000-00000-00000-Almost_Top',
+            '0050-0050-0000-0000-0000-Test1.profile',
+            '00050_00050_00000_00000_00000-2019_Profile',
+        ]
+        result = sorted(filenames, key=self.sc.get_precedence)
+        self.assertEqual(result, [
+            'NoPriority',
+            '00050_00050_00000_00000_00000-2019_Profile',
+            '00050_00050_00000_00000_00000-Some_Profile',
+            '0050-0050-0000-0000-0000-Test1.profile',
+            '99999-00000-00000-00000-00000-Almost_Top',
+            '100000-00000-00000-00000-00000-Top',
+        ])
+        # Digits starting the profile name are not priority fields
+        self.assertEqual(
+            self.sc.get_precedence(
+                '00050_00050_00000_00000_00000-2019_Profile')[:2],
+            ((50, 50, 0, 0, 0), '2019_Profile'))
+        self.assertEqual(
+            self.sc.get_precedence('00050-00050-Short')[0], ())
+
+    def test_10_merge_sources(self):
+        def setting(value):
+            return {'org.gnome.gsettings': [{'key': '/a/b', 'value': value}]}
+
+        result = self.sc.merge_sources(
+            [((1, ), setting('1')), ((4, ), setting('4a'))],
+            [((2, ), setting('2')), ((4, ), setting('4b'))],
+            [((3, ), setting('3'))],
+        )
+        self.assertEqual(
+            result['org.gnome.gsettings'], [{'key': '/a/b', 'value': '4b'}])
+        result = self.sc.merge_sources(
+            [((1, ), setting('1')), ((5, ), setting('5'))],
+            [((2, ), setting('2')), ((4, ), setting('4'))],
+        )
+        self.assertEqual(
+            result['org.gnome.gsettings'], [{'key': '/a/b', 'value': '5'}])
+
+    def test_11_compile_settings_compact(self):
+        sc = SettingsCompiler(
+            os.path.join(
+                os.environ['TOPSRCDIR'], 'tests/data/sampleprofiledata/'),
+            use_compact=True)
+        result = sc.compile_settings()
+        setting = result['org.gnome.gsettings'][0]
+        self.assertIsInstance(setting, compact.Record)
+        self.assertEqual(setting['key'], self.COMPILED_SETTINGS[
+            'org.gnome.gsettings'][0]['key'])
+        self.assertRaises(KeyError, lambda: setting['nonexistent'])
+        expanded = sc.expand_settings(result)
+        self.assertEqual(expanded, self.sc.compile_settings())
+        self.assertEqual(
+            json.dumps(expanded, sort_keys=True),
+            json.dumps(result, sort_keys=True, default=compact.expand))
+
+    def test_12_explain(self):
+        sc = SettingsCompiler(
+            os.path.join(
+                os.environ['TOPSRCDIR'], 'tests/data/sampleprofiledata/'),
+            provenance=True)
+        self.assertEqual(sc.explain('org.gnome.gsettings'), None)
+        sc.compile_settings()
+        filenames = TestSettingsCompiler.ordered_filenames
+        self.assertEqual(
+            sc.explain(
+                'org.gnome.gsettings',
+                '/org/yorba/shotwell/preferences/ui/background-color'),
+            {'source': filenames[1], 'overridden': [filenames[0]]})
+        # Aliased inputs are recorded for the output namespace
+        self.assertEqual(
+            sc.explain(
+                'org.gnome.gsettings',
+                '/org/libreoffice/registry/org.openoffice.UserProfile/Data/o'),
+            {'source': filenames[3], 'overridden': filenames[:2]})
+        explained = sc.explain('org.gnome.online-accounts')
+        self.assertEqual(
+            explained['Template account_fc_1490729747_0'],
+            {'source': filenames[3], 'overridden': [filenames[1]]})
+        self.assertEqual(sc.explain('org.gnome.gsettings', '/unknown'), None)
+
+    def test_14_digests(self):
+        result = self.sc.compile_settings()
+        self.assertEqual(set(self.sc.digests), set(result))
+        # Digests do not depend on key order nor on compact records
+        sc = SettingsCompiler(
+            os.path.join(
+                os.environ['TOPSRCDIR'], 'tests/data/sampleprofiledata/'),
+            use_compact=True)
+        sc.compile_settings()
+        self.assertEqual(sc.digests, self.sc.digests)
+        self.assertEqual(
+            self.sc.get_namespace_digest({'a': 1, 'b': [{'c': 2, 'd': 3}]}),
+            self.sc.get_namespace_digest({'b': [{'d': 3, 'c': 2}], 'a': 1}))
+        self.assertNotEqual(
+            self.sc.get_namespace_digest({'a': [1, 2]}),
+            self.sc.get_namespace_digest({'a': [2, 1]}))
+
+    def test_15_compile_sources(self):
+        expected = self.sc.compile_settings()
+        sources = []
+        for index, filename in enumerate(reversed(self.ordered_filenames)):
+            with open(os.path.join(self.sc.path, filename), 'rb') as fd:
+                data = fd.read()
+            # Give decoded settings for some sources
+            if index % 2 and filename != self.invalid_profile_filename:
+                data = json.loads(data.decode('utf-8'))
+            sources.append((filename, data))
+        sc = SettingsCompiler(None)
+        self.assertEqual(sc.compile_sources(sources), expected)
+        self.assertEqual(sc.digests, self.sc.digests)
+        # Namespaces not requested are skipped for decoded sources too
+        namespaces = ['org.gnome.online-accounts']
+        self.assertEqual(
+            sc.compile_sources(sources, namespaces=namespaces),
+            self.sc.compile_settings(namespaces=namespaces))
+        # Any comparable precedence can be given
+        result = sc.compile_sources([
+            (2, {'org.gnome.online-accounts': {'A': {'x': '2'}}}, 'second'),
+            (1, b'{"org.gnome.online-accounts": {"A": {}, "B": {}}}', 'first'),
+        ])
+        self.assertEqual(
+            result, {'org.gnome.online-accounts': {'A': {'x': '2'}, 'B': {}}})
+
+    def test_16_read_profile_settings_max_size(self):
+        filename = self.ordered_filenames[0]
+        size = os.path.getsize(os.path.join(self.sc.path, filename))
+        sc = SettingsCompiler(self.sc.path, max_profile_size=size)
+        self.assertEqual(
+            sc.read_profile_settings(filename),
+            self.sc.read_profile_settings(filename))
+        # Bigger files are ignored without being decoded
+        sc = SettingsCompiler(self.sc.path, max_profile_size=size - 1)
+        decoded = []
+        sc.decoder.decode = decoded.append
+        self.assertEqual(sc.read_profile_settings(filename), {})
+        self.assertEqual(decoded, [])
+        self.assertEqual(
+            sc.compile_sources([(filename, b' ' * size)]), {})
+
+    def test_17_compile_settings_metrics(self):
+        metrics = CompileMetrics()
+        sc = SettingsCompiler(self.sc.path, metrics=metrics)
+        self.assertEqual(sc.compile_settings(), self.sc.compile_settings())
+        self.assertEqual(
+            sorted(metrics.sources.keys()), self.ordered_filenames)
+        for filename in self.ordered_filenames:
+            data = metrics.sources[filename]
+            self.assertEqual(
+                data['bytes'],
+                os.path.getsize(os.path.join(sc.path, filename)))
+            self.assertGreater(data['parse_time'], 0)
+            self.assertGreater(data['merge_time'], 0)
+        totals = metrics.get_totals()
+        self.assertEqual(totals['sources'], len(self.ordered_filenames))
+        self.assertEqual(
+            totals['bytes'],
+            sum(data['bytes'] for data in metrics.sources.values()))
+        # Namespaces merged with previous settings are measured
+        self.assertEqual(
+            metrics.namespaces['org.gnome.online-accounts']['merges'], 2)
+        self.assertIn('org.gnome.gsettings', metrics.namespaces)
+        json.dumps(metrics.to_dict())
+        # Measures are reset on each compilation
+        sc.compile_settings(namespaces=['org.gnome.online-accounts'])
+        self.assertEqual(
+            list(metrics.namespaces.keys()), ['org.gnome.online-accounts'])
+
+    def test_18_compact_records(self):
+        decoder = json.JSONDecoder(
+            object_pairs_hook=compact.Record.from_pairs)
+        record = decoder.decode('{"a": 1, "b": 2, "a": 3}')
+        # Duplicated names keep the last value, as plain decoding does
+        self.assertEqual(compact.expand(record), json.loads(
+            '{"a": 1, "b": 2, "a": 3}'))
+        self.assertEqual(list(record), ['a', 'b'])
+        self.assertEqual(len(record), 2)
+        # Records with the same names share their shape
+        other = decoder.decode('{"a": 1, "b": 2, "a": 3}')
+        self.assertIs(other.shape, record.shape)
+        # Wide objects are decoded as plain dictionaries
+        wide = dict(
+            ('key%d' % index, index)
+            for index in range(compact.RECORD_MAX_FIELDS + 1))
+        self.assertIs(type(decoder.decode(json.dumps(wide))), dict)
+        # Shapes are dropped along with their records
+        names = ('shape', 'test')
+        compact.Record(names, (1, 2))
+        self.assertNotIn(names, compact.SHAPES)
+
+    def test_19_compile_settings_workers(self):
+        metrics = CompileMetrics()
+        sc = SettingsCompiler(self.sc.path, metrics=metrics, workers=2)
+        self.assertEqual(sc.compile_settings(), self.sc.compile_settings())
+        self.assertEqual(sc.digests, self.sc.digests)
+        # Parse measures from worker processes are recorded
+        self.assertEqual(
+            sorted(metrics.sources.keys()), self.ordered_filenames)
+        self.assertGreater(metrics.get_totals()['parse_time'], 0)
+        namespaces = ['org.gnome.online-accounts']
+        self.assertEqual(
+            sc.compile_settings(namespaces=namespaces),
+            self.sc.compile_settings(namespaces=namespaces))
+        # Encoded and decoded sources are merged in precedence order
+        sources = []
+        for index, filename in enumerate(self.ordered_filenames):
+            with open(os.path.join(self.sc.path, filename), 'rb') as fd:
+                data = fd.read()
+            if index % 2 and filename != self.invalid_profile_filename:
+                data = json.loads(data.decode('utf-8'))
+            sources.append((filename, data))
+        self.assertEqual(
+            sc.compile_sources(reversed(sources)),
+            self.sc.compile_settings())
+        # Compact records decoded by workers share their shapes
+        sc = SettingsCompiler(self.sc.path, use_compact=True, workers=2)
+        result = sc.compile_settings()
+        self.assertEqual(
+            sc.expand_settings(result), self.sc.compile_settings())
+        settings = result['org.gnome.gsettings']
+        self.assertEqual(settings[1].shape.names, settings[3].shape.names)
+        self.assertIs(settings[1].shape, settings[3].shape)
+
+    def test_20_compile_settings_shadowed(self):
+        sc = SettingsCompiler(self.sc.path, shadowed=True)
+        self.assertEqual(sc.compile_settings(), self.sc.compile_settings())
+        namespaces = ['org.gnome.gsettings', 'org.gnome.online-accounts']
+        self.assertEqual(
+            sc.compile_settings(namespaces=namespaces),
+            self.sc.compile_settings(namespaces=namespaces))
+        # Covered complete namespaces are not decoded from lower precedence
+        # profiles, which are not read once all namespaces are covered
+        goa = 'org.gnome.online-accounts'
+        sc = SettingsCompiler(
+            self.sc.path, shadowed=True, complete_namespaces=[goa])
+        read = []
+        read_profile_settings = sc.read_profile_settings
+
+        def tracking_read(filename):
+            read.append(filename)
+            return read_profile_settings(filename)
+
+        sc.read_profile_settings = tracking_read
+        result = sc.compile_settings(namespaces=[goa])
+        self.assertEqual(read, self.ordered_filenames[-1:])
+        self.assertEqual(
+            result,
+            SettingsCompiler(
+                self.sc.path, complete_namespaces=[goa]).compile_settings(
+                    namespaces=[goa]))
+        self.assertEqual(
+            sc.compile_settings()['org.gnome.gsettings'],
+            self.sc.compile_settings()['org.gnome.gsettings'])
+
+    def test_21_compile_sources_shadowed(self):
+        goa = 'org.gnome.online-accounts'
+        sources = [
+            (1, {goa: {'A': {'Provider': 'a'}, 'B': {'Provider': 'b'}},
+                 'org.gnome.gsettings': [{'key': '/a', 'value': '1'}]}),
+            (2, {goa: {'B': {'Provider': 'c'}},
+                 'org.gnome.gsettings': [{'key': '/b', 'value': '2'}],
+                 'org.example.Unmerged': {'x': 2}}),
+            (3, b'{"org.example.Unmerged": {"x": 3}}'),
+            # Whole namespace is invalid, so it does not cover lower ones
+            (4, {goa: ['C']}),
+        ]
+        forward = SettingsCompiler(None, complete_namespaces=[goa])
+        shadowed = SettingsCompiler(
+            None, shadowed=True, complete_namespaces=[goa])
+        expected = {
+            goa: {'B': {'Provider': 'c'}},
+            'org.gnome.gsettings': [
+                {'key': '/a', 'value': '1'}, {'key': '/b', 'value': '2'}],
+            'org.example.Unmerged': {'x': 3},
+        }
+        self.assertEqual(forward.compile_sources(sources), expected)
+        self.assertEqual(shadowed.compile_sources(sources), expected)
+        # Complete namespaces are merged when they are not
+        self.assertEqual(
+            SettingsCompiler(None, shadowed=True).compile_sources(
+                sources)[goa],
+            {'A': {'Provider': 'a'}, 'B': {'Provider': 'c'}})
+        # Aliased namespaces are always merged
+        sc = SettingsCompiler(
+            None, complete_namespaces=['org.gnome.gsettings'])
+        self.assertFalse(sc.is_complete_namespace('org.gnome.gsettings'))
+        self.assertEqual(
+            sc.compile_sources(sources)['org.gnome.gsettings'],
+            expected['org.gnome.gsettings'])
+
+
+class TestSettingsCompilerIncremental(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.test_directory = tempfile.mkdtemp(
+            prefix='fc-client-settingscompiler-test')
+        self.profiles_path = os.path.join(self.test_directory, 'profiles')
+        self.cache_path = os.path.join(self.test_directory, 'cache')
+        shutil.copytree(
+            os.path.join(
+                os.environ['TOPSRCDIR'], 'tests/data/sampleprofiledata/'),
+            self.profiles_path)
+        self.decoded = []
+
+    def tearDown(self):
+        shutil.rmtree(self.test_directory)
+
+    def get_compiler(self, provenance=False, checkpoint_interval=1):
+        sc = SettingsCompiler(
+            self.profiles_path, self.cache_path, provenance=provenance,
+            checkpoint_interval=checkpoint_interval)
+        decode = sc.decode_profile_settings
+
+        def tracking_decode(filename, contents):
+            self.decoded.append(filename)
+            return decode(filename, contents)
+
+        sc.decode_profile_settings = tracking_decode
+        return sc
+
+    def test_00_compile_settings(self):
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        result = self.get_compiler().compile_settings()
+        self.assertEqual(result, expected)
+        self.assertEqual(
+            self.decoded, TestSettingsCompiler.ordered_filenames)
+
+    def test_03_compile_settings_compact(self):
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        for i in range(2):
+            sc = SettingsCompiler(
+                self.profiles_path, self.cache_path, use_compact=True)
+            result = sc.compile_settings()
+            self.assertEqual(sc.expand_settings(result), expected)
+
+    def test_01_compile_settings_unchanged(self):
+        expected = self.get_compiler().compile_settings()
+        self.decoded = []
+        result = self.get_compiler().compile_settings()
+        self.assertEqual(result, expected)
+        self.assertEqual(self.decoded, [])
+
+    def test_02_compile_settings_changed(self):
+        self.get_compiler().compile_settings()
+        self.decoded = []
+        # Rewrite a file with same contents
+        filename = TestSettingsCompiler.ordered_filenames[1]
+        filepath = os.path.join(self.profiles_path, filename)
+        with open(filepath, 'rb') as fd:
+            data = fd.read()
+        with open(filepath, 'wb') as fd:
+            fd.write(data)
+        os.utime(filepath, ns=(0, 0))
+        # Change last file contents
+        filename = TestSettingsCompiler.ordered_filenames[3]
+        filepath = os.path.join(self.profiles_path, filename)
+        with open(filepath, 'r') as fd:
+            data = json.loads(fd.read())
+        data.setdefault('org.gnome.online-accounts', {})['Test account'] = {}
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps(data))
+        sc = self.get_compiler()
+        result = sc.compile_settings()
+        self.assertEqual(
+            self.decoded, TestSettingsCompiler.ordered_filenames[3:])
+        delta = sc.get_settings_delta(sc.previous_settings, result)
+        self.assertEqual(list(delta.keys()), ['org.gnome.online-accounts'])
+        self.assertEqual(
+            delta['org.gnome.online-accounts']['added'],
+            set(['Test account']))
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        self.assertEqual(result, expected)
+        self.assertIn('Test account', result['org.gnome.online-accounts'])
+        # Remove last file
+        os.remove(filepath)
+        self.decoded = []
+        result = self.get_compiler().compile_settings()
+        self.assertEqual(self.decoded, [])
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        self.assertEqual(result, expected)
+
+    def test_04_explain(self):
+        sc = SettingsCompiler(self.profiles_path, provenance=True)
+        sc.compile_settings()
+        expected = sc.explain('org.gnome.gsettings')
+        self.get_compiler(provenance=True).compile_settings()
+        # Provenance is read from cache without compiling
+        self.decoded = []
+        sc = self.get_compiler()
+        self.assertEqual(sc.explain('org.gnome.gsettings'), expected)
+        self.assertEqual(self.decoded, [])
+        # Resuming from a checkpoint keeps previous provenance
+        filename = TestSettingsCompiler.ordered_filenames[3]
+        filepath = os.path.join(self.profiles_path, filename)
+        with open(filepath, 'r') as fd:
+            data = json.loads(fd.read())
+        data['org.gnome.gsettings'] = []
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps(data))
+        sc = self.get_compiler(provenance=True)
+        sc.compile_settings()
+        self.assertEqual(self.decoded, [filename])
+        expected = SettingsCompiler(self.profiles_path, provenance=True)
+        expected.compile_settings()
+        self.assertEqual(
+            sc.explain('org.gnome.gsettings'),
+            expected.explain('org.gnome.gsettings'))
+        self.assertEqual(
+            sc.explain(
+                'org.gnome.gsettings',
+                '/org/yorba/shotwell/preferences/ui/background-color')[
+                    'source'],
+            TestSettingsCompiler.ordered_filenames[1])
+
+    def test_05_digests(self):
+        sc = self.get_compiler()
+        sc.compile_settings()
+        expected = sc.digests
+        # Digests are read from cache without compiling
+        self.decoded = []
+        sc = self.get_compiler()
+        sc.compile_settings()
+        self.assertEqual(self.decoded, [])
+        self.assertEqual(sc.digests, expected)
+        # Only digests of changed namespaces change
+        filename = TestSettingsCompiler.ordered_filenames[3]
+        filepath = os.path.join(self.profiles_path, filename)
+        with open(filepath, 'r') as fd:
+            data = json.loads(fd.read())
+        data.setdefault('org.gnome.online-accounts', {})['Test account'] = {}
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps(data))
+        sc = self.get_compiler()
+        sc.compile_settings()
+        changed = [
+            namespace for namespace in expected
+            if sc.digests[namespace] != expected[namespace]]
+        self.assertEqual(changed, ['org.gnome.online-accounts'])
+
+    def test_06_compile_settings_max_size(self):
+        filename = TestSettingsCompiler.ordered_filenames[3]
+        sizes = [
+            os.path.getsize(os.path.join(self.profiles_path, name))
+            for name in TestSettingsCompiler.ordered_filenames]
+        max_size = os.path.getsize(os.path.join(self.profiles_path, filename))
+        expected = {}
+        sc = SettingsCompiler(self.profiles_path)
+        for name, size in zip(TestSettingsCompiler.ordered_filenames, sizes):
+            if size <= max_size - 1:
+                expected = sc.merge_profile_settings(
+                    expected, sc.read_profile_settings(name))
+        for i in range(2):
+            sc = SettingsCompiler(
+                self.profiles_path, self.cache_path,
+                max_profile_size=max_size - 1)
+            self.assertEqual(sc.compile_settings(), expected)
+
+    def test_07_compile_settings_sparse_checkpoints(self):
+        filenames = TestSettingsCompiler.ordered_filenames
+        self.get_compiler(checkpoint_interval=2).compile_settings()
+        # Checkpoints are only saved every two files
+        cache = CompileCache(self.cache_path)
+        self.assertEqual(cache.get_checkpoint_positions(), [1, 3])
+        # Merging resumes from the last checkpoint before the changed file
+        filepath = os.path.join(self.profiles_path, filenames[3])
+        with open(filepath, 'r') as fd:
+            data = json.loads(fd.read())
+        data.setdefault('org.gnome.online-accounts', {})['Test account'] = {}
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps(data))
+        self.decoded = []
+        result = self.get_compiler(checkpoint_interval=2).compile_settings()
+        self.assertEqual(self.decoded, filenames[2:])
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        self.assertEqual(result, expected)
+        # Changes before the first checkpoint merge all files again
+        filepath = os.path.join(self.profiles_path, filenames[0])
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps({'org.gnome.online-accounts': {}}))
+        self.decoded = []
+        result = self.get_compiler(checkpoint_interval=2).compile_settings()
+        self.assertEqual(self.decoded, filenames)
+        expected = SettingsCompiler(self.profiles_path).compile_settings()
+        self.assertEqual(result, expected)
+
+    def test_08_build_manifest(self):
+        filenames = TestSettingsCompiler.ordered_filenames
+        # Files are hashed by blocks
+        class SmallBlocksCache(CompileCache):
+            READ_BLOCK_SIZE = 7
+
+        entries = SmallBlocksCache.build_manifest(
+            self.profiles_path, filenames, [])
+        for filename, entry in zip(filenames, entries):
+            with open(os.path.join(self.profiles_path, filename), 'rb') as fd:
+                data = fd.read()
+            self.assertEqual(entry['name'], filename)
+            self.assertEqual(entry['size'], len(data))
+            self.assertEqual(entry['digest'], CompileCache.get_digest(data))
+        # Merged files are read from disk, not from manifest data
+        contents = []
+        sc = SettingsCompiler(self.profiles_path, self.cache_path)
+        decode = sc.decode_profile_settings
+
+        def tracking_decode(filename, data):
+            contents.append(type(data))
+            return decode(filename, data)
+
+        sc.decode_profile_settings = tracking_decode
+        sc.compile_settings()
+        self.assertIn(mmap.mmap, contents)
+
+    def test_09_compile_sources(self):
+        sources = []
+        for filename in sorted(os.listdir(self.profiles_path)):
+            with open(os.path.join(self.profiles_path, filename), 'rb') as fd:
+                sources.append((filename, fd.read()))
+                fd.close()
+        sc = self.get_compiler()
+        expected = sc.compile_sources(sources)
+        self.assertEqual(len(self.decoded), len(sources))
+        # Unchanged sources are served from cache
+        self.decoded = []
+        sc = self.get_compiler()
+        self.assertEqual(sc.compile_sources(sources), expected)
+        self.assertEqual(self.decoded, [])
+        self.assertEqual(sc.digests, sc.get_settings_digests(expected))
+        # Any changed source compiles them again
+        filename, data = sources[0]
+        sources[0] = (filename, data + b' ')
+        sc = self.get_compiler()
+        self.assertEqual(sc.compile_sources(sources), expected)
+        self.assertEqual(len(self.decoded), len(sources))
+        # Decoded sources are never cached
+        self.decoded = []
+        sources[0] = (filename, json.loads(data.decode('utf-8')))
+        sc = self.get_compiler()
+        self.assertEqual(sc.compile_sources(sources), expected)
+        self.assertEqual(len(self.decoded), len(sources) - 1)
+
+
+class TestSettingsCompilerLayered(unittest.TestCase):
+
+    maxDiff = None
+
+    # Second applies field of sample profile file names is zero
+    USER_FIELD = 1
+    USER_PROFILE = '0080-0000-0080-0000-0000-Private.profile'
+
+    def setUp(self):
+        self.test_directory = tempfile.mkdtemp(
+            prefix='fc-client-settingscompiler-test')
+        self.base_cache_path = os.path.join(self.test_directory, 'base')
+        for user in ('user1', 'user2'):
+            shutil.copytree(
+                os.path.join(
+                    os.environ['TOPSRCDIR'], 'tests/data/sampleprofiledata/'),
+                os.path.join(self.test_directory, user))
+        with open(os.path.join(
+                self.test_directory, 'user2', self.USER_PROFILE), 'w') as fd:
+            fd.write(json.dumps({
+                'org.gnome.gsettings': [
+                    {'key': '/org/gnome/software/popular-overrides',
+                     'value': "['private.desktop']", 'signature': 'as'},
+                    {'key': '/org/gnome/private', 'value': 'true',
+                     'signature': 'b'},
+                ],
+            }))
+        self.decoded = []
+
+    def tearDown(self):
+        shutil.rmtree(self.test_directory)
+
+    def get_compiler(self, user, cache=False):
+        cache_path = None
+        if cache:
+            cache_path = os.path.join(self.test_directory, 'cache', user)
+        sc = SettingsCompiler(
+            os.path.join(self.test_directory, user), cache_path,
+            provenance=True, base_cache_path=self.base_cache_path,
+            user_field=self.USER_FIELD)
+        decode = sc.decode_profile_settings
+
+        def tracking_decode(filename, contents):
+            self.decoded.append(filename)
+            return decode(filename, contents)
+
+        sc.decode_profile_settings = tracking_decode
+        return sc
+
+    def get_expected(self, user):
+        sc = SettingsCompiler(
+            os.path.join(self.test_directory, user), provenance=True)
+        return (sc.compile_settings(), sc.explain('org.gnome.gsettings'))
+
+    def test_00_is_shared_profile(self):
+        sc = self.get_compiler('user1')
+        self.assertFalse(sc.is_shared_profile(self.USER_PROFILE))
+        self.assertFalse(sc.is_shared_profile('NoPriority'))
+        for filename in TestSettingsCompiler.ordered_filenames:
+            self.assertTrue(sc.is_shared_profile(filename))
+        sc = SettingsCompiler(self.test_directory)
+        self.assertFalse(
+            sc.is_shared_profile(TestSettingsCompiler.ordered_filenames[0]))
+
+    def check_layered(self, cache):
+        filenames = TestSettingsCompiler.ordered_filenames
+        for user in ('user1', 'user2'):
+            sc = self.get_compiler(user, cache)
+            result = sc.compile_settings()
+            expected, provenance = self.get_expected(user)
+            self.assertEqual(result, expected)
+            self.assertEqual(sc.explain('org.gnome.gsettings'), provenance)
+        # Second user per user profile ends its base layer before the one
+        # of the first user, so each user saved its own base layer
+        self.assertEqual(
+            self.decoded,
+            filenames + filenames[:3] + [self.USER_PROFILE, filenames[3]])
+        self.assertEqual(len(os.listdir(self.base_cache_path)), 2)
+        # Base layer is reused by users sharing it
+        self.decoded = []
+        result = self.get_compiler('user2').compile_settings()
+        self.assertEqual(self.decoded, [self.USER_PROFILE, filenames[3]])
+        self.assertEqual(
+            result['org.gnome.gsettings'][-1]['key'], '/org/gnome/private')
+
+    def test_01_compile_settings(self):
+        self.check_layered(False)
+
+    def test_02_compile_settings_incremental(self):
+        self.check_layered(True)
+        # Changing a shared profile generates a new base layer
+        filepath = os.path.join(
+            self.test_directory, 'user2',
+            TestSettingsCompiler.ordered_filenames[0])
+        with open(filepath, 'w') as fd:
+            fd.write(json.dumps({'org.gnome.online-accounts': {}}))
+        self.decoded = []
+        sc = self.get_compiler('user2', True)
+        result = sc.compile_settings()
+        self.assertEqual(result, self.get_expected('user2')[0])
+        self.assertEqual(len(self.decoded), 5)
+        self.assertEqual(len(os.listdir(self.base_cache_path)), 3)
+
+    def test_03_base_cache_size(self):
+        filenames = TestSettingsCompiler.ordered_filenames
+        sc = self.get_compiler('user1')
+        sc.base_cache.store.max_entries = 1
+        sc.compile_settings()
+        sc = self.get_compiler('user2')
+        sc.base_cache.store.max_entries = 1
+        sc.compile_settings()
+        # Least recently used layer was removed
+        self.assertEqual(len(os.listdir(self.base_cache_path)), 1)
+        self.decoded = []
+        self.get_compiler('user1').compile_settings()
+        self.assertEqual(self.decoded, filenames)
+
 
 if __name__ == '__main__':
     unittest.main()
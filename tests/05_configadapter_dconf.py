@@ -39,6 +39,9 @@ class TestDconfConfigAdapter(unittest.TestCase):
 
     TEST_UID = 55555
 
+    COMPILED_DB_PATH = os.path.join(
+        os.environ['TOPSRCDIR'], 'tests/data/dconf_profile_compiled.dat')
+
     TEST_DATA = [
         {
             "signature": "s",
@@ -130,10 +133,13 @@ class TestDconfConfigAdapter(unittest.TestCase):
 
         # Check db file has been compiled
         self.assertTrue(os.path.exists(self.dbpath))
-        with open(self.dbpath, 'r') as fd:
+        with open(self.dbpath, 'rb') as fd:
             data = fd.read()
             fd.close()
-        self.assertEqual(data, 'COMPILED\n')
+        with open(self.COMPILED_DB_PATH, 'rb') as fd:
+            compiled_data = fd.read()
+            fd.close()
+        self.assertEqual(data, compiled_data)
 
 
 if __name__ == '__main__':
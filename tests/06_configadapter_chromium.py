@@ -97,6 +97,16 @@ class TestChromiumConfigAdapter(unittest.TestCase):
             self.assertTrue(item['key'] in data)
             self.assertEqual(item['value'], data[item['key']])
 
+    def test_02_is_deployed(self):
+        self.assertEqual(
+            self.ca.get_deployed_paths(self.TEST_UID),
+            [self.policies_file_path])
+        self.assertFalse(self.ca.is_deployed(self.TEST_UID))
+        self.ca.update(self.TEST_UID, self.TEST_DATA)
+        self.assertTrue(self.ca.is_deployed(self.TEST_UID))
+        self.ca.bootstrap(self.TEST_UID)
+        self.assertFalse(self.ca.is_deployed(self.TEST_UID))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -381,7 +381,45 @@ class TestSettingsCompiler(dbusmock.DBusTestCase):
             'settings': self.TEST_PROFILE['settings']
         })
 
-    def test_06_call_fc_client(self):
+    def test_06_process_profile_result(self):
+        self.fcad.DOMAIN = 'fcrealm.ad'
+        userdir = tempfile.mkdtemp()
+        smbmock.TEMP_DIR = userdir
+        self._save_test_cifs_data(userdir)
+        profilesdir = os.path.join(userdir, 'profiles')
+        os.makedirs(profilesdir)
+        profile = self.TEST_PROFILE.copy()
+        profile['cn'] = 'profile-cn'
+        filename, settings = self.fcad.process_profile(
+            profile,
+            profilesdir,
+            self.TEST_USERNAME,
+            self.TEST_GROUPS,
+            self.TEST_HOSTNAME,
+            self.TEST_GLOBAL_POLICY)
+        self.assertEqual(
+            filename, '00100_00000_00000_00000_00000-Test_Profile')
+        # Settings are given as encoded data, as saved in profiles directory
+        self.assertIsInstance(settings, bytes)
+        self.assertEqual(json.loads(settings), self.TEST_PROFILE['settings'])
+        with open(os.path.join(profilesdir, filename), 'rb') as fd:
+            self.assertEqual(fd.read(), settings)
+            fd.close()
+        # Profiles with invalid data are ignored
+        filepath = os.path.join(
+            userdir, 'fcrealm.ad/Policies/profile-cn/fleet-commander.json')
+        with open(filepath, 'w') as fd:
+            fd.write('{"priority": 100, "settings": {')
+            fd.close()
+        self.assertIsNone(self.fcad.process_profile(
+            profile,
+            None,
+            self.TEST_USERNAME,
+            self.TEST_GROUPS,
+            self.TEST_HOSTNAME,
+            self.TEST_GLOBAL_POLICY))
+
+    def test_07_call_fc_client(self):
         # Setup dbusmock
         self.setupFCClientDbusMock()
         # Call client method
@@ -115,6 +115,51 @@ class TestChromiumAdapter(unittest.TestCase):
             fd.close()
         self.assertEqual(data1, data2)
 
+    def test_02_generate_config_digest(self):
+        filepath = os.path.join(
+            self.cache_path,
+            self.ca.NAMESPACE,
+            'fleet-commander.json')
+        # Generate configuration with a digest
+        self.ca.generate_config(self.TEST_DATA, 'digest1')
+        self.assertEqual(self.ca.get_cached_digest(), 'digest1')
+        # Same digest keeps cached files
+        os.remove(filepath)
+        self.ca.generate_config(self.TEST_DATA, 'digest1')
+        self.assertFalse(os.path.exists(filepath))
+        # Different digest regenerates them
+        self.ca.generate_config(self.TEST_DATA, 'digest2')
+        self.assertTrue(os.path.exists(filepath))
+        self.assertEqual(self.ca.get_cached_digest(), 'digest2')
+
+    def test_03_generate_config_failure(self):
+        self.ca.generate_config(self.TEST_DATA, 'digest1')
+        # Digest is not saved when processing fails
+        self.ca.process_config_data = lambda config_data, cache_path: False
+        self.assertFalse(self.ca.generate_config(self.TEST_DATA, 'digest2'))
+        self.assertIsNone(self.ca.get_cached_digest())
+
+        def process_config_data(config_data, cache_path):
+            raise IOError('No space left on device')
+
+        self.ca.process_config_data = process_config_data
+        self.assertRaises(
+            IOError, self.ca.generate_config, self.TEST_DATA, 'digest3')
+        self.assertIsNone(self.ca.get_cached_digest())
+        # Data is processed again once the failure is gone
+        del self.ca.process_config_data
+        self.assertTrue(self.ca.generate_config(self.TEST_DATA, 'digest3'))
+        self.assertEqual(self.ca.get_cached_digest(), 'digest3')
+
+    def test_04_is_deployed(self):
+        self.ca.generate_config(self.TEST_DATA)
+        self.assertFalse(self.ca.is_deployed(self.TEST_UID))
+        self.ca.deploy(self.TEST_UID)
+        self.assertTrue(self.ca.is_deployed(self.TEST_UID))
+        # Deployed files may be lost, as in runtime directories on reboot
+        os.remove(self.policies_file_path)
+        self.assertFalse(self.ca.is_deployed(self.TEST_UID))
+
 
 if __name__ == '__main__':
     unittest.main()
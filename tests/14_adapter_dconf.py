@@ -22,6 +22,7 @@
 
 import os
 import sys
+import pwd
 import logging
 import tempfile
 import shutil
@@ -34,6 +35,7 @@ sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
 
 import fleetcommanderclient.adapters.dconf
 from fleetcommanderclient.adapters.dconf import DconfAdapter
+from fleetcommanderclient.compilecache import ContentStore
 
 
 def universal_function(*args, **kwargs):
@@ -51,6 +53,9 @@ class TestDconfAdapter(unittest.TestCase):
 
     TEST_UID = 55555
 
+    COMPILED_DB_PATH = os.path.join(
+        os.environ['TOPSRCDIR'], 'tests/data/dconf_profile_compiled.dat')
+
     TEST_DATA = [
         {
             "signature": "s",
@@ -118,10 +123,13 @@ class TestDconfAdapter(unittest.TestCase):
         self.assertTrue(os.path.isfile(dbfile_path))
 
         # Check db file contents
-        with open(dbfile_path, 'r') as fd:
+        with open(dbfile_path, 'rb') as fd:
             data = fd.read()
             fd.close()
-        self.assertEqual(data, 'COMPILED\n')
+        with open(self.COMPILED_DB_PATH, 'rb') as fd:
+            compiled_data = fd.read()
+            fd.close()
+        self.assertEqual(data, compiled_data)
 
     def test_01_deploy(self):
         # Generate config files in cache
@@ -137,14 +145,14 @@ class TestDconfAdapter(unittest.TestCase):
         self.assertTrue(os.path.isfile(deployed_file_path))
 
         # Check both files content is the same
-        with open(deployed_file_path, 'r') as fd:
+        with open(deployed_file_path, 'rb') as fd:
             data1 = fd.read()
             fd.close()
         cached_file_path = os.path.join(
             self.cache_path,
             self.ca.NAMESPACE,
             self.ca.DB_FILE)
-        with open(cached_file_path, 'r') as fd:
+        with open(cached_file_path, 'rb') as fd:
             data2 = fd.read()
             fd.close()
         self.assertEqual(data1, data2)
@@ -164,6 +172,160 @@ class TestDconfAdapter(unittest.TestCase):
             self.DCONF_USER_FILE_CONTENTS.format(
                 deployed_file_name))
 
+    def test_02_generate_config_store(self):
+        # Generate configuration
+        self.ca.generate_config(self.TEST_DATA)
+        store_path = os.path.join(self.cache_path, self.ca.DB_STORE_DIR)
+        self.assertEqual(len(os.listdir(store_path)), 1)
+
+        # Same settings in another order reuse the compiled database
+        self.ca.generate_config(list(reversed(self.TEST_DATA)))
+        keyfiles_dir = os.path.join(
+            self.cache_path, self.ca.NAMESPACE, 'keyfiles')
+        self.assertFalse(os.path.exists(keyfiles_dir))
+        self.assertEqual(len(os.listdir(store_path)), 1)
+        dbfile_path = os.path.join(
+            self.cache_path, self.ca.NAMESPACE, self.ca.DB_FILE)
+        with open(dbfile_path, 'rb') as fd:
+            data = fd.read()
+            fd.close()
+        with open(self.COMPILED_DB_PATH, 'rb') as fd:
+            compiled_data = fd.read()
+            fd.close()
+        self.assertEqual(data, compiled_data)
+
+        # Changed settings are compiled again
+        self.ca.generate_config(self.TEST_DATA[:1])
+        self.assertTrue(os.path.isdir(keyfiles_dir))
+        self.assertEqual(len(os.listdir(store_path)), 2)
+
+    def test_03_deploy_shared(self):
+        self.ca.shared_dbs = True
+        self.ca.generate_config(self.TEST_DATA)
+        # Deploy same configuration for two users
+        other_uid = self.TEST_UID + 1
+        self.ca.deploy(self.TEST_UID)
+        self.ca.deploy(other_uid)
+
+        shared = [
+            name for name in os.listdir(self.test_directory)
+            if name.startswith(self.ca.SHARED_DB_FILE)]
+        self.assertEqual(len(shared), 1)
+        shared_path = os.path.join(self.test_directory, shared[0])
+        self.assertEqual(os.stat(shared_path).st_nlink, 3)
+        for uid in (self.TEST_UID, other_uid):
+            deployed_file_path = os.path.join(
+                self.test_directory, '{}-{}'.format(self.ca.DB_FILE, uid))
+            self.assertTrue(os.path.samefile(deployed_file_path, shared_path))
+
+        # Deploying other configuration drops one reference
+        self.ca.generate_config(self.TEST_DATA[:1])
+        self.ca.deploy(other_uid)
+        self.assertEqual(os.stat(shared_path).st_nlink, 2)
+
+        # Unreferenced shared databases are removed
+        self.ca.generate_config(self.TEST_DATA[:1])
+        self.ca.deploy(self.TEST_UID)
+        self.assertFalse(os.path.exists(shared_path))
+        shared = [
+            name for name in os.listdir(self.test_directory)
+            if name.startswith(self.ca.SHARED_DB_FILE)]
+        self.assertEqual(len(shared), 1)
+
+    def test_04_generate_configs(self):
+        self.ca._get_cache_path = lambda uid=None: os.path.join(
+            self.cache_path, str(uid), self.ca.NAMESPACE)
+        self.ca.db_store_path = os.path.join(self.test_directory, 'store')
+        uids = [self.TEST_UID + index for index in range(4)]
+        # Test users do not exist, so caches are written by this user
+        self.ca._run_as_user = lambda uid, function, *args: function(*args)
+        results = self.ca.generate_configs([
+            (uids[0], self.TEST_DATA, 'digest0'),
+            (uids[1], list(reversed(self.TEST_DATA)), 'digest1'),
+            (uids[2], self.TEST_DATA[:1], 'digest2'),
+            (uids[3], self.TEST_DATA, None),
+        ], workers=2)
+
+        # Identical settings are compiled once
+        self.assertEqual(sorted(results), uids)
+        self.assertEqual(results[uids[0]], results[uids[1]])
+        self.assertEqual(results[uids[0]], results[uids[3]])
+        self.assertNotEqual(results[uids[0]], results[uids[2]])
+        self.assertEqual(len(os.listdir(self.ca.db_store_path)), 2)
+
+        with open(self.COMPILED_DB_PATH, 'rb') as fd:
+            compiled_data = fd.read()
+            fd.close()
+        for uid in (uids[0], uids[1], uids[3]):
+            dbfile_path = os.path.join(
+                self.ca._get_cache_path(uid), self.ca.DB_FILE)
+            with open(dbfile_path, 'rb') as fd:
+                data = fd.read()
+                fd.close()
+            self.assertEqual(data, compiled_data)
+
+        # Digests of configuration data are saved as generate_config does
+        self.assertEqual(self.ca.get_cached_digest(uids[0]), 'digest0')
+        self.assertEqual(self.ca.get_cached_digest(uids[2]), 'digest2')
+        self.assertIsNone(self.ca.get_cached_digest(uids[3]))
+
+    @unittest.skipUnless(os.geteuid() == 0, 'requires root')
+    def test_05_run_as_user(self):
+        # Files are written with user identity, which is restored afterwards
+        uid = pwd.getpwnam('nobody').pw_uid
+        os.chmod(self.test_directory, 0o777)
+        filename = os.path.join(self.test_directory, 'file')
+        self.ca._run_as_user(uid, lambda: open(filename, 'w').close())
+        self.assertEqual(os.stat(filename).st_uid, uid)
+        self.assertEqual(os.geteuid(), 0)
+        # Root owned files can not be written
+        self.assertRaises(
+            PermissionError, self.ca._run_as_user, uid,
+            lambda: open(self.COMPILED_DB_PATH, 'a').close())
+        self.assertEqual(os.geteuid(), 0)
+
+
+class TestContentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_directory = tempfile.mkdtemp(
+            prefix='fc-client-contentstore-test')
+        self.store = ContentStore(
+            os.path.join(self.test_directory, 'store'), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_directory)
+
+    def add(self, digest, mtime):
+        filename = os.path.join(self.test_directory, 'data')
+        with open(filename, 'w') as fd:
+            fd.write(digest)
+            fd.close()
+        path = self.store.add_file(digest, filename)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_00_lookup(self):
+        self.assertIsNone(self.store.lookup('a'))
+        path = self.add('a', 1000)
+        self.assertEqual(self.store.lookup('a'), path)
+        with open(path, 'r') as fd:
+            self.assertEqual(fd.read(), 'a')
+            fd.close()
+        # Lookups mark files as recently used
+        self.assertGreater(os.stat(path).st_mtime, 1000)
+
+    def test_01_evict(self):
+        self.add('a', 1000)
+        self.add('b', 2000)
+        self.store.lookup('a')
+        self.add('c', 3000)
+        # Least recently used file is removed
+        self.assertEqual(
+            [digest for mtime, digest in self.store.get_entries()],
+            ['c', 'a'])
+        self.assertIsNone(self.store.lookup('b'))
+
 
 if __name__ == '__main__':
     unittest.main()
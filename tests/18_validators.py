@@ -0,0 +1,172 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+# Python imports
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
+
+# Fleet commander imports
+from fleetcommanderclient import validators
+from fleetcommanderclient.settingscompiler import SettingsCompiler
+
+
+class TestGSettingsValidator(unittest.TestCase):
+
+    validator_class = validators.GSettingsValidator
+
+    VALID_SETTINGS = [
+        {
+          "signature": "s",
+          "value": "'#FFFFFF'",
+          "key": "/org/yorba/shotwell/preferences/ui/background-color",
+          "schema": "org.yorba.shotwell.preferences.ui"
+        },
+        {
+          "key": "/org/gnome/software/popular-overrides",
+          "value": "['firefox.desktop','builder.desktop']",
+          "signature": "as"
+        },
+    ]
+
+    INVALID_SETTINGS = [
+        {
+          "value": "'list-view'",
+          "signature": "s"
+        },
+        {
+          "key": "/org/gnome/nautilus/list-view/default-zoom-level",
+          "value": 3,
+        },
+        "/org/gnome/nautilus/preferences/default-folder-viewer",
+    ]
+
+    def setUp(self):
+        self.validator = self.validator_class()
+
+    def test_00_validate(self):
+        settings = list(self.VALID_SETTINGS)
+        result, invalid = self.validator.validate(settings)
+        self.assertIs(result, settings)
+        self.assertEqual(invalid, 0)
+
+    def test_01_validate_invalid(self):
+        settings = self.VALID_SETTINGS[:1] + self.INVALID_SETTINGS + \
+            self.VALID_SETTINGS[1:]
+        result, invalid = self.validator.validate(settings)
+        self.assertEqual(result, self.VALID_SETTINGS)
+        self.assertEqual(invalid, len(self.INVALID_SETTINGS))
+        self.assertEqual(
+            self.validator.validate({'key': 'value'}), (None, 1))
+
+
+class TestNetworkManagerValidator(TestGSettingsValidator):
+
+    validator_class = validators.NetworkManagerValidator
+
+    VALID_SETTINGS = [
+        {
+          "data": "{'connection': {'id': <'Company VPN'>}}",
+          "uuid": "601d3b48-a44f-40f3-aa7a-35da4a10a099",
+          "type": "vpn",
+          "id": "Company VPN"
+        },
+    ]
+
+    INVALID_SETTINGS = [
+        {
+          "data": "{'connection': {'id': <'Company VPN'>}}",
+          "type": "vpn",
+        },
+        {
+          "uuid": "601d3b48-a44f-40f3-aa7a-35da4a10a099",
+          "type": "vpn",
+        },
+    ]
+
+
+class TestGOAValidator(unittest.TestCase):
+
+    VALID_SETTINGS = {
+        "Template account_fc_1490729747_0": {
+            "FilesEnabled": True,
+            "Provider": "google",
+        },
+    }
+
+    INVALID_SETTINGS = {
+        "Template account_fc_1490729585_0": {
+            "FilesEnabled": 1,
+            "Provider": "google",
+        },
+        "Template account_fc_1490729845_0": {
+            "Provider": None,
+        },
+        "Template account_fc_1490729989_0": ["Provider", "google"],
+    }
+
+    def setUp(self):
+        self.validator = validators.GOAValidator()
+
+    def test_00_validate(self):
+        result, invalid = self.validator.validate(self.VALID_SETTINGS)
+        self.assertIs(result, self.VALID_SETTINGS)
+        self.assertEqual(invalid, 0)
+
+    def test_01_validate_invalid(self):
+        settings = dict(self.VALID_SETTINGS)
+        settings.update(self.INVALID_SETTINGS)
+        result, invalid = self.validator.validate(settings)
+        self.assertEqual(result, self.VALID_SETTINGS)
+        self.assertEqual(invalid, len(self.INVALID_SETTINGS))
+        self.assertEqual(self.validator.validate([]), (None, 1))
+
+
+class TestSettingsCompilerValidation(unittest.TestCase):
+
+    def test_00_merge_profile_settings(self):
+        sc = SettingsCompiler(os.environ['TOPSRCDIR'])
+        profile = {
+            'org.gnome.gsettings': (
+                TestGSettingsValidator.VALID_SETTINGS +
+                TestGSettingsValidator.INVALID_SETTINGS),
+            'org.gnome.online-accounts': TestGOAValidator.INVALID_SETTINGS,
+            'org.freedesktop.NetworkManager': {},
+            'unknown.namespace': 'Unknown data',
+        }
+        result = sc.merge_profile_settings({}, profile, 'profile')
+        self.assertEqual(result, {
+            'org.gnome.gsettings': TestGSettingsValidator.VALID_SETTINGS,
+            'org.gnome.online-accounts': {},
+            'unknown.namespace': 'Unknown data',
+        })
+        self.assertEqual(sc.invalid_settings, {
+            'org.gnome.gsettings': 3,
+            'org.gnome.online-accounts': 3,
+            'org.freedesktop.NetworkManager': 1,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+# Python imports
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
+
+# Fleet commander imports
+from fleetcommanderclient.keytrie import KeyTrie
+from fleetcommanderclient import mergers
+
+
+class TestKeyTrie(unittest.TestCase):
+
+    maxDiff = None
+
+    TEST_SETTINGS = [
+        {'key': '/org/gnome/desktop/background/picture-uri', 'value': "'a'"},
+        {'key': '/org/gnome/desktop/background/color', 'value': "'#000'"},
+        {'key': '/org/gnome/desktop/interface/clock-format', 'value': "'24h'"},
+        {'key': '/org/gnome/software/popular-overrides', 'value': "['a']"},
+        {'key': 'invalid', 'value': "'ignored'"},
+        {'value': "'ignored'"},
+    ]
+
+    def setUp(self):
+        self.trie = KeyTrie.from_settings(self.TEST_SETTINGS)
+
+    def test_00_get(self):
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(
+            self.trie.get('/org/gnome/desktop/background/color'),
+            self.TEST_SETTINGS[1])
+        self.assertIn('/org/gnome/software/popular-overrides', self.trie)
+        self.assertNotIn('/org/gnome/software', self.trie)
+        self.assertNotIn('/org/gnome/unknown/key', self.trie)
+        # Settings with same key are replaced
+        self.trie.add({
+            'key': '/org/gnome/desktop/background/color', 'value': "'#fff'"})
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(
+            self.trie.get('/org/gnome/desktop/background/color')['value'],
+            "'#fff'")
+
+    def test_01_iter_sections(self):
+        self.assertEqual(list(self.trie.iter_sections()), [
+            ('org/gnome/desktop/background', [
+                ('picture-uri', self.TEST_SETTINGS[0]),
+                ('color', self.TEST_SETTINGS[1]),
+            ]),
+            ('org/gnome/desktop/interface', [
+                ('clock-format', self.TEST_SETTINGS[2]),
+            ]),
+            ('org/gnome/software', [
+                ('popular-overrides', self.TEST_SETTINGS[3]),
+            ]),
+        ])
+
+    def test_02_iter_settings(self):
+        self.assertEqual(
+            list(self.trie.iter_settings('/org/gnome/desktop/background/')),
+            [(setting['key'], setting) for setting in self.TEST_SETTINGS[:2]])
+        self.assertEqual(
+            self.trie.to_list('/org/gnome/desktop'), self.TEST_SETTINGS[:3])
+        self.assertEqual(self.trie.to_list(), self.TEST_SETTINGS[:4])
+        self.assertEqual(self.trie.to_list('/org/unknown'), [])
+
+    def test_03_diff(self):
+        new = KeyTrie.from_settings([
+            {'key': '/org/gnome/desktop/background/picture-uri',
+             'value': "'b'"},
+            {'key': '/org/gnome/desktop/background/color', 'value': "'#000'"},
+            {'key': '/org/gnome/desktop/wm/preferences/theme',
+             'value': "'x'"},
+            {'key': '/org/gnome/software/popular-overrides', 'value': "['a']"},
+        ])
+        self.assertEqual(new.diff(self.trie), (
+            set(['/org/gnome/desktop/wm/preferences/theme']),
+            set(['/org/gnome/desktop/background/picture-uri']),
+            set(['/org/gnome/desktop/interface/clock-format'])))
+        # Only the given subtree is compared
+        self.assertEqual(
+            new.diff(self.trie, '/org/gnome/desktop/background'),
+            (set(), set(['/org/gnome/desktop/background/picture-uri']),
+             set()))
+        self.assertEqual(
+            new.diff(self.trie, '/org/gnome/software'), (set(), set(), set()))
+
+    def test_04_merger_diff(self):
+        merger = mergers.GSettingsMerger()
+        new = merger.merge(self.TEST_SETTINGS[:4], [
+            {'key': '/org/gnome/software/popular-overrides', 'value': "[]"},
+        ])
+        self.assertEqual(
+            merger.diff(self.TEST_SETTINGS[:4], new),
+            mergers.BaseMerger().diff(self.TEST_SETTINGS[:4], new))
+        self.assertEqual(
+            merger.diff(self.TEST_SETTINGS[:4], new, '/org/gnome/desktop'),
+            (set(), set(), set()))
+        # Keys without a leading slash are compared too, unless a path is
+        # given
+        old = self.TEST_SETTINGS[:4] + [{'key': 'relative/key', 'value': '1'}]
+        new = new + [{'key': 'relative/key', 'value': '2'}]
+        self.assertEqual(
+            merger.diff(old, new), mergers.BaseMerger().diff(old, new))
+        self.assertIn('relative/key', merger.diff(old, new)[1])
+        self.assertEqual(merger.diff(old, new, '/'), merger.diff(
+            self.TEST_SETTINGS[:4], new[:-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
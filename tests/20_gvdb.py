@@ -0,0 +1,123 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+# Python imports
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
+
+# Fleet commander imports
+from fleetcommanderclient import gvdb
+
+
+class TestGvdb(unittest.TestCase):
+
+    COMPILED_DB_PATH = os.path.join(
+        os.environ['TOPSRCDIR'], 'tests/data/dconf_profile_compiled.dat')
+
+    # Values serialized as boxed GVariants, in normal form and little endian
+    TEST_VALUES = [
+        ('/org/yorba/shotwell/preferences/ui/background-color',
+            b"#CCCCCC\0\0s"),
+        ('/org/gnome/software/popular-overrides',
+            b"riot.desktop\0matrix.desktop\0\x0d\x1c\0as"),
+    ]
+
+    def setUp(self):
+        with open(self.COMPILED_DB_PATH, 'rb') as fd:
+            self.compiled_data = fd.read()
+            fd.close()
+
+    def test_00_str_hash(self):
+        self.assertEqual(gvdb.str_hash(''), 5381)
+        self.assertEqual(gvdb.str_hash('a'), 5381 * 33 + 97)
+        # Non ASCII bytes are added as signed chars
+        self.assertEqual(
+            gvdb.str_hash('\xe9'),
+            ((5381 * 33 - 61) * 33 - 87) & 0xffffffff)
+
+    def test_01_hash_table_order(self):
+        order = gvdb.GHashTableOrder()
+        keys = ['/key{}'.format(index) for index in range(100)]
+        for key in keys:
+            order.insert(key)
+        # Inserting a key twice does nothing
+        order.insert(keys[0])
+        self.assertEqual(len(order), 100)
+        self.assertEqual(sorted(order), sorted(keys))
+        self.assertEqual(order.size, 128)
+
+    def test_02_build_dconf_table(self):
+        table = gvdb.build_dconf_table(self.TEST_VALUES)
+        self.assertEqual(sorted(table.items), [
+            '/',
+            '/org/',
+            '/org/gnome/',
+            '/org/gnome/software/',
+            '/org/gnome/software/popular-overrides',
+            '/org/yorba/',
+            '/org/yorba/shotwell/',
+            '/org/yorba/shotwell/preferences/',
+            '/org/yorba/shotwell/preferences/ui/',
+            '/org/yorba/shotwell/preferences/ui/background-color',
+        ])
+        self.assertEqual(
+            table.items['/org/gnome/software/popular-overrides'].parent.key,
+            '/org/gnome/software/')
+        self.assertIsNone(table.items['/'].parent)
+        self.assertEqual(
+            sorted(child.key for child in table.items['/org/'].children),
+            ['/org/gnome/', '/org/yorba/'])
+
+    def test_03_compatibility(self):
+        # Database must be the same dconf compile generates
+        for values in [self.TEST_VALUES, list(reversed(self.TEST_VALUES))]:
+            table = gvdb.build_dconf_table(values)
+            self.assertEqual(table.get_contents(), self.compiled_data)
+
+    def test_04_write(self):
+        directory = tempfile.mkdtemp(prefix='fc-client-gvdb-test')
+        try:
+            filename = os.path.join(directory, 'db')
+            gvdb.build_dconf_table(self.TEST_VALUES).write(filename)
+            with open(filename, 'rb') as fd:
+                data = fd.read()
+                fd.close()
+            self.assertEqual(data, self.compiled_data)
+            self.assertEqual(os.listdir(directory), ['db'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_05_empty(self):
+        data = gvdb.build_dconf_table([]).get_contents()
+        # Header with an empty root table
+        self.assertEqual(data[:8], b'GVariant')
+        self.assertEqual(len(data), gvdb.GVDB_HEADER.size + 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
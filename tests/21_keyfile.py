@@ -0,0 +1,151 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+# Python imports
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import gi
+from gi.repository import GLib
+
+sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
+
+# Fleet commander imports
+from fleetcommanderclient import keyfile
+
+
+class TestKeyFile(unittest.TestCase):
+
+    maxDiff = None
+
+    TEST_SECTIONS = [
+        ('org/gnome/desktop/background', [
+            ('picture-uri', "'file:///usr/share/backgrounds/default.png'"),
+            ('color', "'#000000'"),
+        ]),
+        ('Template account_fc_1490729747_0', [
+            ('Provider', 'google'),
+            ('Identity', 'user@example.com'),
+            ('MailEnabled', True),
+            ('CalendarEnabled', False),
+        ]),
+        ('escapes', [
+            ('leading', '  \t leading spaces and tabs'),
+            ('inner', 'inner  spaces\tand tabs  '),
+            ('lines', 'first line\nsecond line\r\n  third line'),
+            ('backslashes', '\\ \\\\ \\n \\s'),
+            ('separators', 'a;b,c=d#e[f]'),
+            ('unicode', 'Gutiérrez ☃'),
+            ('empty', ''),
+        ]),
+    ]
+
+    def get_glib_keyfile(self):
+        glib_keyfile = GLib.KeyFile.new()
+        for group, items in self.TEST_SECTIONS:
+            for key, value in items:
+                if isinstance(value, bool):
+                    glib_keyfile.set_boolean(group, key, value)
+                else:
+                    glib_keyfile.set_string(group, key, value)
+        return glib_keyfile
+
+    def get_data(self, sections):
+        return ''.join(keyfile.iter_keyfile_lines(sections))
+
+    def test_00_escape_value(self):
+        self.assertEqual(keyfile.escape_value('  a b  '), '\\s\\sa b  ')
+        self.assertEqual(keyfile.escape_value('\t a\tb'), '\\t\\sa\tb')
+        self.assertEqual(keyfile.escape_value('\n b'), '\\n\\sb')
+        self.assertEqual(keyfile.escape_value('\\ b'), '\\\\ b')
+        self.assertEqual(keyfile.escape_value('a;b'), 'a;b')
+        self.assertEqual(keyfile.format_value(True), 'true')
+        self.assertEqual(keyfile.format_value(False), 'false')
+        self.assertRaises(TypeError, keyfile.format_value, 1)
+
+    def test_01_names(self):
+        self.assertTrue(keyfile.is_group_name('org/gnome/desktop'))
+        self.assertFalse(keyfile.is_group_name(''))
+        self.assertFalse(keyfile.is_group_name('a]b'))
+        self.assertFalse(keyfile.is_group_name('a\nb'))
+        self.assertTrue(keyfile.is_key_name('key name'))
+        self.assertTrue(keyfile.is_key_name('name[es_ES]'))
+        self.assertFalse(keyfile.is_key_name(''))
+        self.assertFalse(keyfile.is_key_name(' key'))
+        self.assertFalse(keyfile.is_key_name('a=b'))
+        self.assertFalse(keyfile.is_key_name('name[es'))
+        self.assertFalse(keyfile.is_key_name('a\nb'))
+
+    def test_02_same_as_glib(self):
+        glib_data, length = self.get_glib_keyfile().to_data()
+        self.assertEqual(self.get_data(self.TEST_SECTIONS), glib_data)
+
+    def test_03_parsed_by_glib(self):
+        data = self.get_data(self.TEST_SECTIONS)
+        glib_keyfile = GLib.KeyFile.new()
+        glib_keyfile.load_from_data(
+            data, len(data.encode('utf-8')), GLib.KeyFileFlags.NONE)
+        groups, length = glib_keyfile.get_groups()
+        self.assertEqual(
+            groups, [group for group, items in self.TEST_SECTIONS])
+        for group, items in self.TEST_SECTIONS:
+            for key, value in items:
+                if isinstance(value, bool):
+                    self.assertEqual(
+                        glib_keyfile.get_boolean(group, key), value)
+                else:
+                    self.assertEqual(
+                        glib_keyfile.get_string(group, key), value)
+
+    def test_04_invalid_entries(self):
+        data = self.get_data([
+            ('', [('key', 'ignored')]),
+            ('empty', []),
+            ('group', [('a=b', 'ignored'), ('key', 'value')]),
+        ])
+        self.assertEqual(data, '[group]\nkey=value\n')
+
+    def test_05_write_keyfile(self):
+        directory = tempfile.mkdtemp(prefix='fc-client-keyfile-test')
+        try:
+            filename = os.path.join(directory, 'test.conf')
+            keyfile.write_keyfile(filename, self.TEST_SECTIONS)
+            self.assertEqual(os.listdir(directory), ['test.conf'])
+            glib_keyfile = GLib.KeyFile.new()
+            glib_keyfile.load_from_file(filename, GLib.KeyFileFlags.NONE)
+            self.assertEqual(
+                glib_keyfile.get_string('escapes', 'lines'),
+                'first line\nsecond line\r\n  third line')
+            self.assertEqual(
+                glib_keyfile.get_boolean(
+                    'Template account_fc_1490729747_0', 'MailEnabled'),
+                True)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+
+# Python imports
+import os
+import sys
+import json
+import unittest
+
+sys.path.append(os.path.join(os.environ['TOPSRCDIR'], 'src'))
+
+# Fleet commander imports
+from fleetcommanderclient import jsonscanner
+
+
+class TestJsonScanner(unittest.TestCase):
+
+    TEST_DATA = (
+        '{"priority": 100, "skipped": {"a": [1, "}"]}, '
+        '"settings": {"org.gnome.gsettings": []}}\n')
+
+    def test_00_decode_object_members(self):
+        self.assertEqual(
+            jsonscanner.decode_object_members(
+                self.TEST_DATA, ('priority', 'settings')),
+            {'priority': 100, 'settings': {'org.gnome.gsettings': []}})
+        self.assertEqual(
+            jsonscanner.decode_object_members(self.TEST_DATA, ()), {})
+
+    def test_01_get_object_member_spans(self):
+        spans = jsonscanner.get_object_member_spans(
+            self.TEST_DATA, ('settings',))
+        start, end = spans['settings']
+        self.assertEqual(
+            json.loads(self.TEST_DATA[start:end]),
+            {'org.gnome.gsettings': []})
+
+    def test_02_empty_object(self):
+        # Whitespace around empty objects is allowed, as json does
+        for text in ['{}', '{}\n', ' {} ', '\n{ }\n']:
+            self.assertEqual(json.loads(text), {})
+            self.assertEqual(
+                jsonscanner.decode_object_members(text, ('a',)), {})
+            self.assertEqual(
+                jsonscanner.get_object_member_spans(text, ('a',)), {})
+
+    def test_03_invalid(self):
+        for text in ['', '[]', '{} x', '{"a" 1}', '{"a": 1 "b": 2}', '{a: 1}']:
+            self.assertRaises(
+                ValueError, jsonscanner.decode_object_members, text, ('a',))
+
+
+if __name__ == '__main__':
+    unittest.main()
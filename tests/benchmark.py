@@ -0,0 +1,315 @@
+#!/usr/bin/env python-wrapper.sh
+# -*- coding: utf-8 -*-
+# vi:ts=4 sw=4 sts=4
+
+# Copyright (C) 2019 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the licence, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+#
+# Authors: Alberto Ruiz <aruiz@redhat.com>
+#          Oliver Gutiérrez <ogutierrez@redhat.com>
+
+"""
+Micro benchmarks for settings mergers and compiler.
+
+Settings are generated synthetically. Each benchmark is timed several
+times, then run once more under tracemalloc to record its peak memory
+usage and the memory still held by its result. Results are written as
+JSON, so runs of different builds can be compared.
+"""
+
+# Python imports
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.join(
+    os.environ.get(
+        'TOPSRCDIR', os.path.join(os.path.dirname(__file__), '..')),
+    'src'))
+
+# Fleet commander imports
+from fleetcommanderclient import mergers
+from fleetcommanderclient.settingscompiler import SettingsCompiler
+
+
+def generate_gsettings(profile, keys, schemas=100):
+    """
+    Generate gsettings for a profile. Keys are shared by all profiles so
+    they override each other
+    """
+    settings = []
+    for index in range(keys):
+        schema = 'org.example.schema{}'.format(index % schemas)
+        settings.append({
+            'key': '/{}/key{}'.format(schema.replace('.', '/'), index),
+            'schema': schema,
+            'signature': 's',
+            'value': "'profile{}-value{}'".format(profile, index),
+        })
+    return settings
+
+
+def generate_connections(profile, connections):
+    """
+    Generate NetworkManager connections for a profile
+    """
+    return [
+        {
+            'uuid': '00000000-0000-0000-{:04d}-{:012d}'.format(
+                profile % 10000, index),
+            'type': 'vpn',
+            'id': 'Connection {}'.format(index),
+            'data': "{'connection': {'id': <'Connection %s'>}, "
+                    "'vpn': {'data': <{'gateway': 'vpn%s.example.com'}>}}" % (
+                        index, index),
+        }
+        for index in range(connections)]
+
+
+def generate_bookmarks(profile, depth, width):
+    """
+    Generate a Chromium bookmark tree of given depth, with width folders
+    and bookmarks at each level
+    """
+    bookmarks = []
+    for index in range(width):
+        bookmarks.append({
+            'name': 'Bookmark {}-{}'.format(profile, index),
+            'url': 'https://www.example.com/{}/{}/{}'.format(
+                profile, depth, index),
+        })
+    if depth > 1:
+        for index in range(width):
+            bookmarks.append({
+                'name': 'Folder {}'.format(index),
+                'children': generate_bookmarks(profile, depth - 1, width),
+            })
+    return bookmarks
+
+
+def generate_accounts(profile, accounts):
+    """
+    Generate GNOME Online Accounts for a profile
+    """
+    return dict(
+        ('Template account_fc_{}'.format(index), {
+            'Provider': 'google',
+            'Identity': 'user{}-{}@example.com'.format(profile, index),
+            'MailEnabled': True,
+            'CalendarEnabled': bool(index % 2),
+        })
+        for index in range(accounts))
+
+
+def generate_profile(profile, options):
+    """
+    Generate settings for a whole profile
+    """
+    return {
+        'org.gnome.gsettings': generate_gsettings(profile, options.keys),
+        'org.freedesktop.NetworkManager': generate_connections(
+            profile, options.connections),
+        'org.chromium.Policies': [
+            {'key': 'ManagedBookmarks', 'value': generate_bookmarks(
+                profile, options.bookmark_depth, options.bookmark_width)},
+        ],
+        'org.gnome.online-accounts': generate_accounts(
+            profile, options.accounts),
+    }
+
+
+def measure(function, repeat):
+    """
+    Return timing, peak memory usage and memory retained by the result of
+    given function
+    """
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        retained, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return {
+        'runs': repeat,
+        'min': min(times),
+        'mean': sum(times) / len(times),
+        'max': max(times),
+        'peak_memory': peak,
+        'retained_memory': retained,
+    }
+
+
+def get_benchmarks(options, directory):
+    """
+    Return a list of (name, function) tuples to be measured
+    """
+    profiles = [
+        generate_profile(profile, options)
+        for profile in range(options.profiles)]
+
+    gsettings = [profile['org.gnome.gsettings'] for profile in profiles]
+    connections = [
+        profile['org.freedesktop.NetworkManager'] for profile in profiles]
+    bookmarks = [
+        profile['org.chromium.Policies'][0]['value'] for profile in profiles]
+    accounts = [profile['org.gnome.online-accounts'] for profile in profiles]
+
+    gsettings_merger = mergers.GSettingsMerger()
+    nm_merger = mergers.NetworkManagerMerger()
+    chromium_merger = mergers.ChromiumMerger()
+    goa_merger = mergers.GOAMerger()
+
+    def merge_bookmarks():
+        result = []
+        for tree in bookmarks:
+            result = chromium_merger.merge_bookmarks(result, tree)
+
+    # Profile files for settings compiler
+    profiles_path = os.path.join(directory, 'profiles')
+    os.makedirs(profiles_path)
+    for index, profile in enumerate(profiles):
+        filename = '{:05d}_00000_00000_00000_00000-Profile{}.profile'.format(
+            index, index)
+        with open(os.path.join(profiles_path, filename), 'w') as fd:
+            fd.write(json.dumps(profile))
+            fd.close()
+
+    def compile_cold_cache():
+        # Each run starts with a new empty cache, so all files are compiled
+        # and saved
+        cache_path = tempfile.mkdtemp(prefix='cache', dir=directory)
+        return SettingsCompiler(profiles_path, cache_path).compile_settings()
+
+    # Cache holding compiled settings for the unchanged profile files
+    warm_cache_path = os.path.join(directory, 'cache')
+    SettingsCompiler(profiles_path, warm_cache_path).compile_settings()
+
+    def compile_warm_cache():
+        return SettingsCompiler(
+            profiles_path, warm_cache_path).compile_settings()
+
+    return [
+        ('BaseMerger.merge[gsettings]',
+            lambda: gsettings_merger.merge(*gsettings)),
+        ('BaseMerger.merge[networkmanager]',
+            lambda: nm_merger.merge(*connections)),
+        ('ChromiumMerger.merge_bookmarks', merge_bookmarks),
+        ('GOAMerger.merge', lambda: goa_merger.merge(*accounts)),
+        ('SettingsCompiler.compile_settings',
+            lambda: SettingsCompiler(profiles_path).compile_settings()),
+        ('SettingsCompiler.compile_settings[workers]',
+            lambda: SettingsCompiler(
+                profiles_path, workers=options.workers).compile_settings()),
+        ('SettingsCompiler.compile_settings[shadowed]',
+            lambda: SettingsCompiler(
+                profiles_path, shadowed=True,
+                complete_namespaces=['org.gnome.online-accounts'],
+            ).compile_settings()),
+        ('SettingsCompiler.compile_settings[compact]',
+            lambda: SettingsCompiler(
+                profiles_path, use_compact=True).compile_settings()),
+        ('SettingsCompiler.compile_settings[cold-cache]', compile_cold_cache),
+        ('SettingsCompiler.compile_settings[warm-cache]', compile_warm_cache),
+        ('SettingsCompiler.compile_sources',
+            lambda: SettingsCompiler(None).compile_sources(
+                (index, profile) for index, profile in enumerate(profiles))),
+    ]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Run Fleet Commander client micro benchmarks')
+    parser.add_argument(
+        '--profiles', type=int, default=20,
+        help='number of profiles to merge')
+    parser.add_argument(
+        '--keys', type=int, default=2000,
+        help='number of gsettings keys per profile')
+    parser.add_argument(
+        '--connections', type=int, default=200,
+        help='number of NetworkManager connections per profile')
+    parser.add_argument(
+        '--bookmark-depth', type=int, default=4,
+        help='depth of Chromium bookmark trees')
+    parser.add_argument(
+        '--bookmark-width', type=int, default=5,
+        help='number of folders and bookmarks per bookmark tree level')
+    parser.add_argument(
+        '--accounts', type=int, default=200,
+        help='number of GNOME Online Accounts per profile')
+    parser.add_argument(
+        '--workers', type=int, default=4,
+        help='number of decoding processes for the workers benchmark')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timed runs per benchmark')
+    parser.add_argument(
+        '--filter', default=None,
+        help='only run benchmarks containing given text in their name')
+    parser.add_argument(
+        '--output', default=None,
+        help='file to write results to instead of standard output')
+    options = parser.parse_args(args)
+
+    directory = tempfile.mkdtemp(prefix='fc-client-benchmark')
+    try:
+        results = {}
+        for name, function in get_benchmarks(options, directory):
+            if options.filter is not None and options.filter not in name:
+                continue
+            results[name] = measure(function, options.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    report = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'profiles': options.profiles,
+            'keys': options.keys,
+            'connections': options.connections,
+            'bookmark_depth': options.bookmark_depth,
+            'bookmark_width': options.bookmark_width,
+            'accounts': options.accounts,
+            'repeat': options.repeat,
+            'workers': options.workers,
+        },
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if options.output is not None:
+        with open(options.output, 'w') as fd:
+            fd.write(report + '\n')
+            fd.close()
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()